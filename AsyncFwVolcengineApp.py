@@ -0,0 +1,989 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙异步版本
+
+与 FwVolcengineApp 提供相同的原子方法与批量封禁/解封任务，返回结果保持阿里云兼容格式。
+请求的构建、签名与反序列化复用火山云SDK的拦截器链，仅将HTTP发送替换为 aiohttp 非阻塞传输，
+单个事件循环即可并发驱动多个租户/地域，无需为每个请求占用一个线程。
+
+使用示例：
+    async with AsyncFwVolcengineApp(ak, sk, endpoint, region) as app:
+        res = await app.auto_block_task("1.1.1.1,2.2.2.2", "in")
+"""
+
+import asyncio
+import importlib.metadata
+import json
+import random
+import re
+import string
+import time
+from urllib.parse import urlencode
+
+import volcenginesdkcore
+import volcenginesdkfwcenter
+from volcenginesdkcore.interceptor import InterceptorContext, Response
+from volcenginesdkcore.rest import ApiException
+from loguru import logger
+from apps.fw_volcengine import metrics, tracing, utils
+from apps.fw_volcengine.address_book import AddressBookSnapshot
+from apps.fw_volcengine.control_policy import ControlPolicyIndex
+from apps.fw_volcengine.batcher import get_async_write_batcher
+from apps.fw_volcengine.cache import get_read_cache
+from apps.fw_volcengine.retry import THROTTLED, RETRYABLE, UNCERTAIN, api_error_code, classify_api_error, should_retry
+from apps.fw_volcengine.concurrency import async_single_flight, get_rate_limiter
+from apps.fw_volcengine.FwVolcengineApp import (
+    to_address_list, convert_address_book, convert_control_policy, block_control_policy_params,
+    split_addrs_by_type, invalid_direction_result, filter_task_msgs, block_task_result, unblock_task_result, unblock_group_msgs,
+    merge_address_list, lost_address_entries, api_rate_limiter, block_query_prefix, block_fill_msg, block_policy_msg,
+    BlockTask, UnblockTask,
+    cached_blocklist_snapshot, store_blocklist_snapshot, check_blocked_result, check_blocked_error_result, has_next_page,
+    task_metrics_result, api_span_attributes
+)
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖，仅异步版本需要
+    aiohttp = None
+
+
+def sdk_method_name(action):
+    """API名称转换为SDK方法名（DescribeAddressBook -> describe_address_book），限流令牌桶与指标按SDK方法名与同步版本共享"""
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', action).lower()
+
+
+def classify_async_error(e):
+    """异步调用异常分类：aiohttp 连接失败视为可重试，请求发出后的断连/超时视为结果不确定，其余同 classify_api_error"""
+    if isinstance(e, aiohttp.ClientConnectorError):
+        return RETRYABLE
+    if isinstance(e, (aiohttp.ServerDisconnectedError, aiohttp.ClientPayloadError, asyncio.TimeoutError)):
+        return UNCERTAIN
+    return classify_api_error(e)
+
+
+_sdk_version_checked = False
+
+
+def check_sdk_version(expected):
+    """检查已安装的 volcengine-python-sdk 版本（主.次）是否为 expected，不一致时记录一次警告（SDK内部接口可能已变化）"""
+    global _sdk_version_checked
+    if _sdk_version_checked:
+        return
+    _sdk_version_checked = True
+    try:
+        installed = importlib.metadata.version('volcengine-python-sdk')
+    except importlib.metadata.PackageNotFoundError:
+        logger.warning('未找到 volcengine-python-sdk 的安装信息，无法校验SDK版本')
+        return
+    if installed.split('.')[:2] != expected.split('.'):
+        logger.warning(f'volcengine-python-sdk 版本为 {installed}，异步客户端按 {expected}.x 的SDK内部接口实现，可能不兼容')
+
+
+class _AsyncHTTPResponse:
+    """HTTP响应适配对象，接口与 volcenginesdkcore.rest.RESTResponse 一致，供SDK反序列化使用"""
+
+    def __init__(self, status, reason, data, headers):
+        self.status = status
+        self.reason = reason
+        self.data = data
+        self.headers = headers
+
+    def getheaders(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class AsyncFWCENTERClient:
+    """FWCENTERApi 的异步客户端
+
+    ApiClient 仅用于执行SDK拦截器链（构建请求、解析endpoint、签名、反序列化），不发送请求；
+    HTTP请求通过 aiohttp 长连接池发送
+    """
+
+    API_VERSION = '2021-09-06'
+    # 依赖的SDK内部接口（ApiClient._create_request / interceptor_chain）所对应的 volcengine-python-sdk 版本（主.次）
+    SDK_VERSION = '5.0'
+
+    def __init__(self, configuration):
+        check_sdk_version(self.SDK_VERSION)
+        self.configuration = configuration
+        self.api_client = volcenginesdkcore.ApiClient(configuration)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.configuration.connection_pool_maxsize),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.configuration.connect_timeout,
+                    sock_read=self.configuration.read_timeout
+                )
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def call(self, action, request, response_type):
+        """调用火山云防火墙API，返回 (resp, status, headers)，与SDK的 *_with_http_info 一致"""
+        api_client = self.api_client
+        # _create_request 为SDK内部方法，按 SDK_VERSION 中 volcenginesdkcore.interceptor.Request 的参数名以关键字传参
+        sdk_request = api_client._create_request(
+            resource_path=f'/{action}/{self.API_VERSION}/fw_center/post/application_json/',
+            method='POST',
+            path_params={},
+            query_params=[],
+            header_params={'Accept': 'application/json', 'Content-Type': 'application/json'},
+            body=request,
+            post_params=[],
+            files={},
+            response_type=response_type,
+            auth_settings=['volcengineSign'],
+            _return_http_data_only=False,
+            collection_formats={},
+            _preload_content=True,
+            _request_timeout=None
+        )
+        sdk_request.auto_retry = False
+        sdk_request.retryer = api_client._base_retryer
+        context = api_client.interceptor_chain.execute_request(InterceptorContext(request=sdk_request))
+
+        sdk_request = context.request
+        url = sdk_request.url
+        if sdk_request.query_params:
+            url += '?' + urlencode(sdk_request.query_params)
+        body = json.dumps(sdk_request.body) if sdk_request.body is not None else '{}'
+        async with self._get_session().post(url, data=body, headers=sdk_request.header_params,
+                                            proxy=self.configuration.proxy) as resp:
+            http_response = _AsyncHTTPResponse(resp.status, resp.reason, await resp.text(), resp.headers)
+        if not 200 <= http_response.status <= 299:
+            raise ApiException(http_resp=http_response)
+
+        context.response = Response(http_response)
+        context = api_client.interceptor_chain.execute_response(context)
+        return context.response.result, http_response.status, http_response.headers
+
+
+class AsyncFwVolcengineApp:
+    def __init__(self, ak, sk, endpoint, region, proxies=None):
+        if aiohttp is None:
+            raise ImportError("AsyncFwVolcengineApp 依赖 aiohttp，请先安装: pip install aiohttp")
+        self.ak = ak
+        self.sk = sk
+        self.endpoint = endpoint
+        self.region = region
+        self.proxies = proxies
+        self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """关闭底层HTTP连接池"""
+        if self._client is not None:
+            await self._client.close()
+
+    def create_client(self):
+        """获取异步火山云防火墙客户端（实例内复用同一个连接池，不修改SDK全局默认配置）"""
+        if self._client is None:
+            configuration = volcenginesdkcore.Configuration()
+            configuration.ak = self.ak
+            configuration.sk = self.sk
+            configuration.region = self.region # 这个参数必须有
+            configuration.client_side_validation = True
+            configuration.host = self.endpoint
+            configuration.connection_pool_maxsize = utils.get_config('client.pool_maxsize', 10)
+            if self.proxies:
+                configuration.proxy = self.proxies
+            self._client = AsyncFWCENTERClient(configuration)
+        return self._client
+
+    async def _throttle(self, action):
+        """按 (ak, region, API) 限流，与同步版本共享令牌桶（API名称统一为SDK方法名），返回等待的秒数"""
+        limiter = api_rate_limiter(self.ak, self.region, sdk_method_name(action))
+        delay = limiter.reserve() if limiter else 0.0
+        if delay > 0:
+            await metrics.async_sleep(delay, 'rate_limit')
+        return delay
+
+    def _cache_key(self, *parts):
+        """查询结果缓存键，与同步版本共享进程内查询缓存"""
+        return (self.ak, self.region) + parts
+
+    def _batch_key(self, *parts):
+        """写合并的批次键/执行顺序键，与 FwVolcengineApp._batch_key 一致"""
+        return (self.ak, self.sk, self.endpoint, self.region) + parts
+
+    def _invalidate_cache(self, *parts):
+        get_read_cache().invalidate(self._cache_key(*parts))
+
+    async def _call(self, action, request, response_type, idempotent=True):
+        """统一的SDK调用入口：限流、错误分类与重试，重试策略与 FwVolcengineApp._call_api 一致"""
+        client = self.create_client()
+        max_attempts = utils.get_config('retry.max_attempts', 5)
+        backoff_base = utils.get_config('retry.backoff_base', 0.5)
+        backoff_max = utils.get_config('retry.backoff_max', 8)
+        deadline = time.monotonic() + utils.get_config('retry.budget', 30)
+        method = sdk_method_name(action)
+        span_attributes = {"rpc.system": "volcengine", "rpc.service": "fwcenter", "rpc.method": method}
+        span_attributes.update(api_span_attributes(request))
+        with tracing.span(f'fwcenter.{method}', span_attributes, tracing.SPAN_KIND_CLIENT) as call_span:
+            attempt = 0
+            while True:
+                await self._throttle(action)
+                started = time.perf_counter()
+                try:
+                    result = await client.call(action, request, response_type)
+                except Exception as e:
+                    kind = classify_async_error(e)
+                    metrics.record_call(method, time.perf_counter() - started, kind or metrics.OUTCOME_ERROR)
+                    call_span.set_attributes({"fw.attempts": attempt + 1, "http.status_code": getattr(e, 'status', None),
+                                              "fw.error_code": api_error_code(e), "fw.error_kind": kind})
+                    delay = utils.backoff_delay(attempt, backoff_base, backoff_max)
+                    if kind == THROTTLED:
+                        delay = max(delay, get_rate_limiter((self.ak, self.region, 'throttled'), utils.get_config('retry.throttle_qps', 5)).reserve())
+                    attempt += 1
+                    if (not should_retry(kind, idempotent) or attempt >= max_attempts or
+                            time.monotonic() + delay > deadline):
+                        raise
+                    metrics.record_retry(method)
+                    logger.warning(f'{action} 调用失败（{kind}），{delay:.2f}秒后第{attempt}次重试: {e}')
+                    await metrics.async_sleep(delay, 'retry_backoff')
+                else:
+                    metrics.record_call(method, time.perf_counter() - started)
+                    call_span.set_attributes({"fw.attempts": attempt + 1, "http.status_code": result[1]})
+                    call_span.set_attributes(api_span_attributes(result[0]))
+                    return result
+
+    async def _gather(self, func, items, max_workers):
+        """并发执行 func(item)（同时进行的数量不超过 max_workers），按输入顺序返回结果"""
+        semaphore = asyncio.Semaphore(max(max_workers or 1, 1))
+
+        async def run(item):
+            async with semaphore:
+                return await func(item)
+
+        return await asyncio.gather(*(run(item) for item in items))
+
+    # 火山云云防火墙原子方法
+
+    async def add_address_book(self, groupname, grouptype, description, addresslist, verify=True):
+        """创建地址组，verify=True 时等待地址组在查询结果中可见后才返回创建成功"""
+        request = volcenginesdkfwcenter.AddAddressBookRequest(
+            group_name=groupname,
+            group_type=grouptype,
+            description=description,
+            address_list=to_address_list(addresslist)
+        )
+        try:
+            resp, status, headers = await self._call('AddAddressBook', request, 'AddAddressBookResponse', idempotent=False)
+            data = resp.to_dict()
+            utils.log_payload(f'add_address_book响应: status={status}, data=', data)
+
+            # 检查是否真正创建成功：状态码200且有group_uuid
+            if status == 200 and data.get('group_uuid'):
+                # 再次验证地址组是否真的存在（可见即返回，超时视为失败）
+                if verify and data['group_uuid'] not in await self.wait_address_books_ready(groupname, grouptype, [data['group_uuid']]):
+                    logger.error(f'地址组创建后验证失败: {groupname}')
+                    return {"desc": "创建失败"}
+                return {
+                    "desc": "创建成功",
+                    "groupname": groupname,
+                    "groupuuid": data.get('group_uuid', ''),
+                    "description": description
+                }
+            else:
+                logger.error(f'地址组创建失败: status={status}, data={data}')
+                return {"desc": "创建失败"}
+        except Exception as e:
+            logger.error(f'地址组创建异常: {e}')
+            return str(e)
+        finally:
+            self._invalidate_cache('address_book')
+
+    async def wait_address_books_ready(self, query, grouptype, groupuuids, timeout=None):
+        """等待新建的地址组在查询结果中可见（指数退避 + 随机抖动轮询），返回已可见的地址组UUID集合"""
+        if timeout is None:
+            timeout = utils.get_config('add_address_book.ready_timeout', 30)
+        backoff_base = utils.get_config('add_address_book.ready_backoff_base', 0.5)
+        backoff_max = utils.get_config('add_address_book.ready_backoff_max', 5)
+        deadline = time.monotonic() + timeout
+        pending = set(groupuuids)
+        ready = set()
+        with tracing.span('wait_address_books_ready', {"fw.group_type": grouptype, "fw.group_count": len(pending)}) as wait_span:
+            attempt = 0
+            while pending:
+                try:
+                    async for acl in self.iter_address_books(query, grouptype):
+                        if acl['GroupUuid'] in pending:
+                            pending.discard(acl['GroupUuid'])
+                            ready.add(acl['GroupUuid'])
+                            if not pending:
+                                break
+                except Exception as e:
+                    logger.error(f'查询地址组可见性失败: {e}')
+                remaining = deadline - time.monotonic()
+                if not pending or remaining <= 0:
+                    break
+                await metrics.async_sleep(min(utils.backoff_delay(attempt, backoff_base, backoff_max), remaining), 'ready_wait')
+                attempt += 1
+            if pending:
+                logger.error(f'等待地址组可见超时: {pending}')
+            wait_span.set_attributes({"fw.ready_group_count": len(ready), "fw.attempts": attempt + 1})
+        return ready
+
+    async def delete_address_book(self, groupuuid):
+        request = volcenginesdkfwcenter.DeleteAddressBookRequest(
+            group_uuid=groupuuid
+        )
+        try:
+            resp, status, headers = await self._call('DeleteAddressBook', request, 'DeleteAddressBookResponse')
+            logger.info(f'删除地址簿成功: {groupuuid}')
+            return {"statusCode": status}
+        except Exception as e:
+            logger.error(f'{e}')
+            return str(e)
+        finally:
+            self._invalidate_cache('address_book')
+
+    async def _describe_address_book_page(self, query, grouptype, page_number, page_size):
+        """查询单页地址组，返回 (status, total_count, 阿里云格式的地址组列表)"""
+        request = volcenginesdkfwcenter.DescribeAddressBookRequest(
+            query=query,
+            group_type=grouptype,
+            page_number=page_number,
+            page_size=page_size
+        )
+        resp, status, headers = await self._call('DescribeAddressBook', request, 'DescribeAddressBookResponse')
+        data = resp.to_dict()
+        utils.log_payload('describe_address_book响应: ', data)
+        acls_data = [convert_address_book(item) for item in data.get('data') or []]
+        return status, data.get('total_count'), acls_data
+
+    async def _iter_pages(self, fetch_page, page_number, page_size, prefetch=False):
+        """通用异步翻页生成器，每次产出 (status, total_count, 当前页数据列表)
+
+        prefetch=True 时在调用方处理当前页的同时并发请求下一页
+        """
+        task = None
+        try:
+            fetched = 0
+            page = await fetch_page(page_number, page_size)
+            while True:
+                status, total_count, items = page
+                fetched += len(items)
+                has_next = has_next_page(items, page_size, fetched, total_count)
+                if has_next and prefetch:
+                    task = asyncio.ensure_future(fetch_page(page_number + 1, page_size))
+                yield page
+                if not has_next:
+                    break
+                page_number += 1
+                if task:
+                    page = await task
+                    task = None
+                else:
+                    page = await fetch_page(page_number, page_size)
+        finally:
+            if task:
+                task.cancel()
+
+    def _iter_address_book_pages(self, query, grouptype, prefetch=False):
+        return self._iter_pages(
+            lambda page_number, page_size: self._describe_address_book_page(query, grouptype, page_number, page_size),
+            utils.get_config('describe_address_book.page_number', 1),
+            utils.get_config('describe_address_book.page_size', 500),
+            prefetch
+        )
+
+    async def iter_address_books(self, query, grouptype, prefetch=False):
+        """遍历全部分页的地址组（异步生成器），产出阿里云格式的地址组字典"""
+        async for status, total_count, acls_data in self._iter_address_book_pages(query, grouptype, prefetch):
+            for acl in acls_data:
+                yield acl
+
+    async def describe_address_book(self, query, grouptype, fresh=False):
+        """查询地址组；fresh=True 时不使用查询缓存（见 FwVolcengineApp.describe_address_book）"""
+        cache = get_read_cache()
+        cache_key = self._cache_key('address_book', query, grouptype)
+        if fresh:
+            return await self._describe_address_book(query, grouptype, cache, cache_key, cache.generation())
+        res = cache.get(cache_key)
+        if res is not None:
+            return res
+        # 同一租户并发的相同查询合并为一次API调用（键包含缓存代数，写操作之后发起的查询不会复用写之前的结果）
+        generation = cache.generation()
+        return await async_single_flight.do((cache_key, generation), lambda: self._describe_address_book(query, grouptype, cache, cache_key, generation))
+
+    async def _describe_address_book(self, query, grouptype, cache, cache_key, generation):
+        """查询全部分页的地址组，成功后写入查询缓存"""
+        try:
+            status = None
+            acls_data = []
+            prefetch = utils.get_config('describe_address_book.prefetch', False)
+            async for status, total_count, page_acls in self._iter_address_book_pages(query, grouptype, prefetch):
+                acls_data.extend(page_acls)
+            res = {
+                "statusCode": status,
+                "body": {
+                    "Acls": acls_data
+                }
+            }
+            cache.set(cache_key, res, generation)
+            return res
+        except Exception as e:
+            logger.error(f'{e}')
+            return str(e)
+
+    async def modify_address_book(self, groupname, groupuuid, description, addresslist):
+        request = volcenginesdkfwcenter.ModifyAddressBookRequest(
+            group_name=groupname,
+            group_uuid=groupuuid,
+            description=description,
+            address_list=to_address_list(addresslist)
+        )
+        try:
+            resp, status, headers = await self._call('ModifyAddressBook', request, 'ModifyAddressBookResponse')
+            utils.log_payload('modify_address_book响应: ', resp)
+            return {"statusCode": status}
+        except Exception as e:
+            logger.error(f'{e}')
+            return str(e)
+        finally:
+            self._invalidate_cache('address_book')
+
+    async def read_address_list(self, addrgrp):
+        """不经查询缓存回读地址组的最新地址列表，地址组不存在时返回 None"""
+        async for acl in self.iter_address_books(addrgrp['GroupName'], addrgrp.get('GroupType')):
+            if acl['GroupUuid'] == addrgrp['GroupUuid']:
+                return acl.get('AddressList') or []
+        return None
+
+    async def wait_address_list_visible(self, addrgrp, add_addrs=(), remove_addrs=(), timeout=None):
+        """写入地址组后回读校验，等待本次写入在查询结果中可见，返回结果与 FwVolcengineApp.wait_address_list_visible 一致"""
+        if timeout is None:
+            timeout = utils.get_config('add_address_book.ready_timeout', 30)
+        backoff_base = utils.get_config('add_address_book.ready_backoff_base', 0.5)
+        backoff_max = utils.get_config('add_address_book.ready_backoff_max', 5)
+        deadline = time.monotonic() + timeout
+        with tracing.span('wait_address_list_visible', {"fw.group_name": addrgrp['GroupName']}) as wait_span:
+            attempt = 0
+            while True:
+                try:
+                    current_addresslist = await self.read_address_list(addrgrp)
+                    if current_addresslist is None:
+                        state = 'deleted'
+                    else:
+                        state = 'conflict' if lost_address_entries(current_addresslist, add_addrs, remove_addrs) else 'visible'
+                except Exception as e:
+                    logger.error(f'地址组回读校验失败: {e}')
+                    state, current_addresslist = 'unknown', None
+                remaining = deadline - time.monotonic()
+                if state in ('visible', 'deleted') or remaining <= 0:
+                    break
+                await metrics.async_sleep(min(utils.backoff_delay(attempt, backoff_base, backoff_max), remaining), 'ready_wait')
+                attempt += 1
+            wait_span.set_attributes({"fw.state": state, "fw.attempts": attempt + 1})
+        return state, current_addresslist
+
+    async def merge_modify_address_book(self, addrgrp, base_addresslist, add_addrs=(), remove_addrs=(), max_addresses=None):
+        """合并-写-回读校验，返回结果与 FwVolcengineApp.merge_modify_address_book 一致"""
+        retries = utils.get_config('modify_address_book.conflict_retries', 3)
+        backoff_base = utils.get_config('modify_address_book.conflict_backoff_base', 0.2)
+        backoff_max = utils.get_config('modify_address_book.conflict_backoff_max', 2)
+        conflicts = 0
+        for attempt in range(retries + 1):
+            new_address_list = merge_address_list(base_addresslist, add_addrs, remove_addrs)
+            if max_addresses and len(new_address_list) > max_addresses:
+                logger.error(f'地址组容量不足: {addrgrp["GroupName"]}, len={len(new_address_list)}')
+                return {"statusCode": 413, "desc": "地址组容量不足", "conflicts": conflicts}
+            res = await self.modify_address_book(
+                groupname=addrgrp['GroupName'],
+                groupuuid=addrgrp['GroupUuid'],
+                description=addrgrp['Description'],
+                addresslist=new_address_list
+            )
+            if not isinstance(res, dict) or res.get('statusCode') != 200:
+                return res
+            state, current_addresslist = await self.wait_address_list_visible(addrgrp, add_addrs, remove_addrs)
+            if state == 'unknown':
+                logger.warning(f'地址组写入后回读失败，无法确认，按写入成功处理: {addrgrp["GroupName"]}')
+                return {"statusCode": 200, "addresslist": new_address_list, "conflicts": conflicts, "unverified": True}
+            if state == 'deleted':
+                logger.error(f'地址组回读校验时已不存在: {addrgrp["GroupName"]}')
+                return {"statusCode": 409, "desc": "地址组已被删除", "conflicts": conflicts}
+            metrics.record_group_write(state == 'conflict')
+            if state == 'visible':
+                return {"statusCode": 200, "addresslist": current_addresslist, "conflicts": conflicts}
+            conflicts += 1
+            logger.warning(f'地址组并发写冲突: {addrgrp["GroupName"]}, '
+                           f'丢失地址: {lost_address_entries(current_addresslist, add_addrs, remove_addrs)}, 第{conflicts}次')
+            # 等待超时后的回读结果已同步，以其为基础重新合并
+            base_addresslist = current_addresslist
+            if attempt < retries:
+                await metrics.async_sleep(utils.backoff_delay(attempt, backoff_base, backoff_max), 'conflict_backoff')
+        return {"statusCode": 409, "desc": "地址组并发写冲突", "conflicts": conflicts}
+
+    async def _describe_control_policy_page(self, direction, description, page_number, page_size):
+        """查询单页控制策略，返回 (status, total_count, 阿里云格式的策略列表)"""
+        request_params = {
+            'direction': direction,
+            'page_number': page_number,
+            'page_size': page_size
+        }
+        if description:
+            request_params['description'] = description
+        request = volcenginesdkfwcenter.DescribeControlPolicyRequest(**request_params)
+        resp, status, headers = await self._call('DescribeControlPolicy', request, 'DescribeControlPolicyResponse')
+        data = resp.to_dict()
+        utils.log_payload('describe_control_policy响应: ', data)
+        policys_data = [convert_control_policy(item) for item in data.get('data') or []]
+        return status, data.get('total_count'), policys_data
+
+    def _iter_control_policy_pages(self, direction, description=None, prefetch=False):
+        return self._iter_pages(
+            lambda page_number, page_size: self._describe_control_policy_page(direction, description, page_number, page_size),
+            1,
+            utils.get_config('describe_control_policy.page_size', 100),
+            prefetch
+        )
+
+    async def load_control_policy_index(self, direction):
+        """分页查询该方向的全部控制策略（可命中查询缓存）构建索引，查询失败时返回 None"""
+        res_describe_control_policy = await self.describe_control_policy(direction)
+        if not isinstance(res_describe_control_policy, dict) or res_describe_control_policy.get('statusCode') != 200:
+            logger.error(f'加载控制策略索引失败: {res_describe_control_policy}')
+            return None
+        return ControlPolicyIndex(direction, res_describe_control_policy['body']['Policys'])
+
+    async def describe_control_policy(self, direction, description=None):
+        cache = get_read_cache()
+        cache_key = self._cache_key('control_policy', direction, description)
+        res = cache.get(cache_key)
+        if res is not None:
+            return res
+        # 同一租户并发的相同查询合并为一次API调用（键包含缓存代数，写操作之后发起的查询不会复用写之前的结果）
+        generation = cache.generation()
+        return await async_single_flight.do((cache_key, generation), lambda: self._describe_control_policy(direction, description, cache, cache_key, generation))
+
+    async def _describe_control_policy(self, direction, description, cache, cache_key, generation):
+        """查询全部分页的控制策略，成功后写入查询缓存"""
+        try:
+            status = None
+            total_count = None
+            policys_data = []
+            async for status, total_count, page_policys in self._iter_control_policy_pages(direction, description):
+                policys_data.extend(page_policys)
+            res = {
+                "statusCode": status,
+                "body": {
+                    "TotalCount": total_count if total_count is not None else len(policys_data),
+                    "Policys": policys_data
+                }
+            }
+            cache.set(cache_key, res, generation)
+            return res
+        except Exception as e:
+            logger.error(f'{e}')
+            return str(e)
+
+    async def add_control_policy(self, aclaction, description, destination, destinationtype, direction, proto, source,
+                                 sourcetype, neworder, applicationname=None, applicationnamelist=None, domainresolvetype=None):
+        logger.debug("创建控制策略参数: source={}, sourcetype={}, destination={}, destinationtype={}", source, sourcetype, destination, destinationtype)
+        request = volcenginesdkfwcenter.AddControlPolicyRequest(
+            prio=int(neworder),
+            direction=direction,
+            source_type=sourcetype,
+            source=source,
+            destination_type=destinationtype,
+            destination=destination,
+            dest_port=utils.get_config('add_control_policy.dest_port', 'ANY'),
+            dest_port_type=utils.get_config('add_control_policy.dest_port_type', 'port'),
+            proto=proto,
+            action=aclaction,
+            description=description,
+            status=utils.get_config('add_control_policy.status', True)
+        )
+        try:
+            resp, status, headers = await self._call('AddControlPolicy', request, 'AddControlPolicyResponse', idempotent=False)
+            data = resp.to_dict()
+            utils.log_payload('add_control_policy响应: ', data)
+            if status == 200:
+                return {
+                    "desc": "创建成功",
+                    "acluuid": data.get('rule_id', '')
+                }
+            return {"desc": "创建失败"}
+        except Exception as e:
+            logger.error(f'{e}')
+            return str(e)
+        finally:
+            self._invalidate_cache('control_policy', direction)
+
+    async def delete_control_policy(self, acluuid, direction):
+        request = volcenginesdkfwcenter.DeleteControlPolicyRequest(
+            rule_id=acluuid,
+            direction=direction
+        )
+        try:
+            resp, status, headers = await self._call('DeleteControlPolicy', request, 'DeleteControlPolicyResponse')
+            utils.log_payload('delete_control_policy响应: ', resp)
+            return {"statusCode": status}
+        except Exception as e:
+            logger.error(f'{e}')
+            return str(e)
+        finally:
+            self._invalidate_cache('control_policy', direction)
+
+    # 批量封禁/解封任务，处理流程与 FwVolcengineApp 一致
+
+    async def _add_block_control_policy(self, direction, grouptype, groupuuid, description):
+        params = block_control_policy_params(direction, grouptype, groupuuid, description)
+        if params is None:
+            return None
+        return await self.add_control_policy(**params)
+
+    async def _block_fill_group(self, addrgrp, existing_addresslist, list_addrgrp_addresslist):
+        """将待封禁的地址写入现有地址组，返回结果消息（desc 为 封禁成功/封禁失败）"""
+        res_modify_address_book = await self.merge_modify_address_book(
+            addrgrp,
+            existing_addresslist,
+            add_addrs=list_addrgrp_addresslist,
+            max_addresses=utils.get_config('modify_address_book.max_addresses_per_group')
+        )
+        return block_fill_msg(addrgrp, list_addrgrp_addresslist, res_modify_address_book)
+
+    async def _block_create_group(self, query_prefix, grouptype, list_addrgrp_addresslist):
+        """以最终地址列表创建新的封禁地址组（不等待可见），失败返回 None"""
+        random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
+        res_add_address_book = await self.add_address_book(
+            groupname=f"{query_prefix}-{random_string}",
+            grouptype=grouptype,
+            description=f"{query_prefix}-{random_string}",
+            addresslist=list_addrgrp_addresslist,
+            verify=False
+        )
+        if isinstance(res_add_address_book, dict) and res_add_address_book.get('desc') == "创建成功":
+            return res_add_address_book
+        logger.error(f"创建地址资源组失败: {res_add_address_book}")
+        return None
+
+    async def _block_create_group_policy(self, direction, grouptype, res_add_address_book, list_addrgrp_addresslist, ready=True):
+        """为新建的封禁地址组创建同名控制策略，失败时删除该地址组，返回结果消息（desc 为 封禁成功/创建失败）"""
+        if not ready:
+            logger.warning(f"地址组尚未可见，仍尝试创建控制策略: {res_add_address_book['groupname']}")
+        res_add_control_policy = await self._add_block_control_policy(
+            direction=direction,
+            grouptype=grouptype,
+            groupuuid=res_add_address_book['groupuuid'],
+            description=res_add_address_book['description']
+        )
+        if not (isinstance(res_add_control_policy, dict) and res_add_control_policy.get('desc') == "创建成功"):
+            await self.delete_address_book(groupuuid=res_add_address_book['groupuuid'])
+        return block_policy_msg(res_add_address_book, list_addrgrp_addresslist, res_add_control_policy)
+
+    async def auto_block_task(self, addr, direction=None):
+        # 验证direction参数
+        if direction not in ['in', 'out']:
+            return invalid_direction_result(addr)
+
+        # 验证SOAR入参IP（单个IP） or 手动入参IPS（多个IP）
+        return await self._block_addrs(*utils.classify_ip_list(addr), direction)
+
+    async def auto_block_stream(self, source, direction=None, chunk_size=None):
+        """流式封禁：按块读取本地文件或迭代器中的地址，逐块执行封禁并产出每块的结果（body 中增加 chunk 块序号）"""
+        if direction not in ['in', 'out']:
+            yield invalid_direction_result(source)
+            return
+        chunk_size = chunk_size or utils.get_config('stream.chunk_size', 1000)
+        for chunk_index, (addrs, buckets) in enumerate(utils.iter_address_chunks(source, chunk_size)):
+            res = await self._block_addrs(addrs, buckets, direction)
+            res['body']['chunk'] = chunk_index
+            yield res
+
+    async def _block_addrs(self, addrs, buckets, direction):
+        """封禁标准化后的地址列表（buckets 为解析时的分类结果，见 utils.classify_ip_list），返回统一格式的封禁结果"""
+        if not addrs:
+            return block_task_result(addrs, [], [], [])
+
+        # 写合并：同一租户同一方向的封禁/解封请求按到达顺序串行执行，排队期间到达的封禁请求合并为一次执行
+        batcher = get_async_write_batcher()
+        if batcher is None:
+            list_success_addrs, list_failed_addrs, list_existed_addrs, task_metrics = await self._run_block_task(buckets, direction)
+        else:
+            list_success_addrs, list_failed_addrs, list_existed_addrs, task_metrics = await batcher.submit(
+                self._batch_key(direction, 'block'),
+                self._batch_key(direction),
+                utils.classified_items(buckets),
+                lambda batch_items: self._run_block_task(utils.group_classified(batch_items), direction)
+            )
+        # 结果消息中的地址段（归并、合并执行）映射回本次调用输入的地址
+        list_success_addrs, list_failed_addrs, list_existed_addrs = [
+            filter_task_msgs(msgs, addrs) for msgs in (list_success_addrs, list_failed_addrs, list_existed_addrs)
+        ]
+        res = block_task_result(addrs, list_success_addrs, list_failed_addrs, list_existed_addrs)
+        return task_metrics_result(res, task_metrics)
+
+    async def _run_block_task(self, buckets, direction):
+        """执行封禁任务，返回 (list_success_addrs, list_failed_addrs, list_existed_addrs, 任务指标 metrics.TaskMetrics)"""
+        address_count = sum(len(list_addrs) for list_addrs in buckets.values())
+        with metrics.task_scope('block') as task_metrics, \
+                tracing.span('block_task', {"fw.direction": direction, "fw.address_count": address_count}) as task_span:
+            list_success_addrs, list_failed_addrs, list_existed_addrs = await self._block_task_loop(buckets, direction, task_metrics)
+            task_span.set_attributes({"fw.success_count": len(list_success_addrs), "fw.failed_count": len(list_failed_addrs),
+                                      "fw.existed_count": len(list_existed_addrs), "fw.iterations": task_metrics.iterations,
+                                      "fw.retries": task_metrics.retries})
+        return list_success_addrs, list_failed_addrs, list_existed_addrs, task_metrics
+
+    async def _block_task_loop(self, buckets, direction, task_metrics):
+        """封禁任务主循环（规划与结果见 BlockTask），返回 (list_success_addrs, list_failed_addrs, list_existed_addrs)"""
+        task = BlockTask(buckets, direction)
+
+        while task.remain_count():
+            task_metrics.record_iteration()
+            with tracing.span('block.iteration', {"fw.iteration": task_metrics.iterations, "fw.remain_count": task.remain_count()}) as iteration_span:
+                for describe_address_book_grouptype, list_addrs_groups in task.start_iteration():
+                    # 步骤1：判断需要封禁的地址资源是否已存在于现有封禁策略中
+                    with tracing.span('block.step1.lookup', {"fw.group_type": describe_address_book_grouptype, "fw.address_count": len(list_addrs_groups)}) as step_span:
+                        # 获取该类型的现有地址组（不使用查询缓存，地址组写入以此为基础合并）
+                        res_describe_address_book = await self.describe_address_book(
+                            query=task.query_prefix,
+                            grouptype=describe_address_book_grouptype,
+                            fresh=True
+                        )
+                        snapshot = task.build_snapshot(res_describe_address_book)
+                        if snapshot is None:
+                            step_span.set_status(tracing.STATUS_ERROR, '查询地址组失败')
+                            continue
+                        list_addrs_groups, existed_count = task.check_existed(describe_address_book_grouptype, snapshot, list_addrs_groups)
+                        step_span.set_attribute("fw.existed_count", existed_count)
+
+                    # 步骤2：装箱规划，填满现有且已有封禁策略的地址簿空位（控制策略索引每个任务只加载一次）
+                    # 并发模式下（concurrency.max_workers > 1），地址簿修改并发执行
+                    with tracing.span('block.step2.fill', {"fw.group_type": describe_address_book_grouptype, "fw.address_count": len(list_addrs_groups)}) as step_span:
+                        if task.needs_policy_index(snapshot, list_addrs_groups):
+                            task.policy_index = await self.load_control_policy_index(direction)
+                        fills, new_groups = task.plan(snapshot, list_addrs_groups)
+                        # 将需要封禁的地址资源更新至地址资源组
+                        list_fill_msgs = await self._gather(
+                            lambda fill: self._block_fill_group(fill[0], snapshot.address_list(fill[0]['GroupUuid']), fill[1]),
+                            fills,
+                            task.max_workers
+                        )
+                        task.record_fills(describe_address_book_grouptype, snapshot, fills, list_fill_msgs)
+                        step_span.set_attributes({"fw.fill_group_count": len(fills), "fw.new_group_count": len(new_groups),
+                                                  "fw.fill_address_count": sum(len(fill[1]) for fill in fills)})
+
+                    # 步骤3：按规划创建新的地址簿和同名控制策略
+                    # 先创建全部地址簿，再统一等待其可见，等待时间相互重叠而不是逐个累加
+                    with tracing.span('block.step3.create', {"fw.group_type": describe_address_book_grouptype, "fw.new_group_count": len(new_groups)}) as step_span:
+                        list_res_add_address_book = await self._gather(
+                            lambda list_addrgrp_addresslist: self._block_create_group(task.query_prefix, describe_address_book_grouptype, list_addrgrp_addresslist),
+                            new_groups,
+                            task.max_workers
+                        )
+                        list_created_groups = [(res_add_address_book, list_addrgrp_addresslist)
+                                               for res_add_address_book, list_addrgrp_addresslist in zip(list_res_add_address_book, new_groups)
+                                               if res_add_address_book]
+
+                        # 等待地址组创建完成，火山云API需要时间同步
+                        set_ready_groupuuids = set()
+                        if list_created_groups:
+                            set_ready_groupuuids = await self.wait_address_books_ready(
+                                query=task.query_prefix,
+                                grouptype=describe_address_book_grouptype,
+                                groupuuids=[res_add_address_book['groupuuid'] for res_add_address_book, _ in list_created_groups]
+                            )
+
+                        # 地址资源组创建成功，则创建同名的控制策略组
+                        list_policy_msgs = await self._gather(
+                            lambda created: self._block_create_group_policy(
+                                direction, describe_address_book_grouptype, created[0], created[1],
+                                ready=created[0]['groupuuid'] in set_ready_groupuuids
+                            ),
+                            list_created_groups,
+                            task.max_workers
+                        )
+                        policy_success_count = task.record_created(describe_address_book_grouptype, list_created_groups, list_policy_msgs)
+                        step_span.set_attributes({"fw.created_group_count": len(list_created_groups), "fw.ready_group_count": len(set_ready_groupuuids),
+                                                  "fw.policy_success_count": policy_success_count})
+                iteration_span.set_attribute("fw.remain_count_after", task.remain_count())
+            # while主循环保护机制：连续2轮没有处理任何地址时，剩余地址记为封禁失败并退出循环
+            if not task.end_iteration():
+                break
+        return task.results()
+
+    async def _unblock_group(self, direction, addrgrp, matched_addrs, new_address_list, remove_addrs, add_addrs,
+                             policy_index=None):
+        """从地址组中移除匹配的IP，地址组为空时删除地址组及引用该地址组的控制策略，返回每个匹配IP的结果消息"""
+        addrgrp_groupname = addrgrp['GroupName']
+        addrgrp_groupuuid = addrgrp['GroupUuid']
+        base_addresslist = addrgrp['AddressList']
+        if len(new_address_list) == 0:
+            # 删除前回读最新内容，期间若有其他进程写入了新地址，则改为修改地址组
+            try:
+                current_addresslist = await self.read_address_list(addrgrp)
+            except Exception as e:
+                logger.error(f'地址组回读失败: {e}')
+                current_addresslist = None
+            if current_addresslist:
+                base_addresslist = current_addresslist
+                new_address_list = merge_address_list(current_addresslist, add_addrs, remove_addrs)
+        if len(new_address_list) == 0:
+            if policy_index is None:
+                logger.error(f"控制策略索引不可用，跳过删除地址组的控制策略: {addrgrp_groupname}")
+            else:
+                for policy_id in policy_index.group_rules(addrgrp_groupuuid):
+                    res_delete_policy = await self.delete_control_policy(policy_id, direction)
+                    if isinstance(res_delete_policy, dict) and res_delete_policy.get('statusCode') == 200:
+                        policy_index.remove(policy_id)
+                        logger.info(f"成功删除控制策略: {policy_id}")
+                    else:
+                        logger.error(f"删除控制策略失败: {policy_id}")
+            res = await self.delete_address_book(addrgrp_groupuuid)
+            success_msg = {
+                "groupname": addrgrp_groupname,
+                "groupuuid": addrgrp_groupuuid,
+                "desc": "解封成功"
+            }
+        else:
+            # 拆分地址段时追加的剩余部分可能超出地址组容量
+            max_addresses = utils.get_config('modify_address_book.max_addresses_per_group') if add_addrs else None
+            res = await self.merge_modify_address_book(addrgrp, base_addresslist, add_addrs, remove_addrs, max_addresses)
+            success_msg = {
+                "groupname": addrgrp_groupname,
+                "groupuuid": addrgrp_groupuuid,
+                "grouplen": len(res['addresslist']) if isinstance(res, dict) and 'addresslist' in res else len(new_address_list),
+                "desc": "解封成功"
+            }
+        return unblock_group_msgs(res, matched_addrs, success_msg)
+
+    async def auto_unblock_task(self, addr, direction=None):
+        # 验证direction参数
+        if direction not in ['in', 'out']:
+            return invalid_direction_result(addr)
+
+        # 验证SOAR入参IP（单个IP） or 手动入参IPS（多个IP）
+        return await self._unblock_addrs(*utils.classify_ip_list(addr), direction)
+
+    async def auto_unblock_stream(self, source, direction=None, chunk_size=None):
+        """流式解封：按块读取本地文件或迭代器中的地址，逐块执行解封并产出每块的结果（body 中增加 chunk 块序号）"""
+        if direction not in ['in', 'out']:
+            yield invalid_direction_result(source)
+            return
+        chunk_size = chunk_size or utils.get_config('stream.chunk_size', 1000)
+        for chunk_index, (addrs, buckets) in enumerate(utils.iter_address_chunks(source, chunk_size)):
+            res = await self._unblock_addrs(addrs, buckets, direction)
+            res['body']['chunk'] = chunk_index
+            yield res
+
+    async def _unblock_addrs(self, addrs, buckets, direction):
+        """解封标准化后的地址列表（buckets 为解析时的分类结果，见 utils.classify_ip_list），返回统一格式的解封结果"""
+        if not addrs:
+            return unblock_task_result(addrs, [], [])
+
+        # 写合并：同一租户同一方向的封禁/解封请求按到达顺序串行执行，排队期间到达的解封请求合并为一次执行
+        batcher = get_async_write_batcher()
+        if batcher is None:
+            list_success_addrs, list_failed_addrs, task_metrics = await self._run_unblock_task(buckets, direction)
+        else:
+            list_success_addrs, list_failed_addrs, task_metrics = await batcher.submit(
+                self._batch_key(direction, 'unblock'),
+                self._batch_key(direction),
+                utils.classified_items(buckets),
+                lambda batch_items: self._run_unblock_task(utils.group_classified(batch_items), direction)
+            )
+        # 结果消息映射回本次调用输入的地址（合并执行时只保留本次调用的地址）
+        list_success_addrs, list_failed_addrs = [
+            filter_task_msgs(msgs, addrs) for msgs in (list_success_addrs, list_failed_addrs)
+        ]
+        res = unblock_task_result(addrs, list_success_addrs, list_failed_addrs)
+        return task_metrics_result(res, task_metrics)
+
+    async def _run_unblock_task(self, buckets, direction):
+        """执行解封任务，返回 (list_success_addrs, list_failed_addrs, 任务指标 metrics.TaskMetrics)"""
+        address_count = sum(len(list_addrs) for list_addrs in buckets.values())
+        with metrics.task_scope('unblock') as task_metrics, \
+                tracing.span('unblock_task', {"fw.direction": direction, "fw.address_count": address_count}) as task_span:
+            list_success_addrs, list_failed_addrs = await self._unblock_task_plan(buckets, direction)
+            task_span.set_attributes({"fw.success_count": len(list_success_addrs), "fw.failed_count": len(list_failed_addrs),
+                                      "fw.retries": task_metrics.retries})
+        return list_success_addrs, list_failed_addrs, task_metrics
+
+    async def _unblock_task_plan(self, buckets, direction):
+        """按地址组快照一次性规划并执行解封（规划与结果见 UnblockTask），返回 (list_success_addrs, list_failed_addrs)"""
+        task = UnblockTask(buckets, direction)
+
+        # 每个类型只查询一次地址组，一次性规划后批量执行
+        for describe_address_book_grouptype, list_addrs_groups in task.addrs_groups:
+            with tracing.span('unblock.plan', {"fw.group_type": describe_address_book_grouptype, "fw.address_count": len(list_addrs_groups)}) as step_span:
+                # 获取该类型的现有地址组（不使用查询缓存，地址组写入以此为基础合并）
+                res_describe_address_book = await self.describe_address_book(
+                    query=task.query_prefix,
+                    grouptype=describe_address_book_grouptype,
+                    fresh=True
+                )
+                snapshot = task.build_snapshot(res_describe_address_book)
+                not_found_before = len(task.notfound)
+                plans = task.plan(snapshot, list_addrs_groups)
+                if snapshot is None:
+                    step_span.set_status(tracing.STATUS_ERROR, '查询地址组失败')
+                    continue
+                step_span.set_attributes({"fw.group_count": len(plans), "fw.not_found_count": len(task.notfound) - not_found_before})
+
+            with tracing.span('unblock.apply', {"fw.group_type": describe_address_book_grouptype, "fw.group_count": len(plans)}) as step_span:
+                # 存在需要删除的地址组时，加载一次控制策略索引，用于查找引用这些地址组的控制策略
+                if task.needs_policy_index(plans):
+                    task.policy_index = await self.load_control_policy_index(direction)
+
+                # 批量执行各地址组的修改/删除（concurrency.max_workers > 1 时并发）
+                list_group_msgs = await self._gather(
+                    lambda plan: self._unblock_group(direction, *plan, policy_index=task.policy_index),
+                    plans,
+                    task.max_workers
+                )
+                step_span.set_attribute("fw.success_count", task.record_group_msgs(list_group_msgs))
+
+        return task.results()
+
+    async def check_blocked(self, addr, direction=None):
+        """查询IP是否已被封禁（最长前缀匹配），direction 为空时同时查询入/出方向"""
+        if direction not in (None, '', 'in', 'out'):
+            return invalid_direction_result(addr)
+
+        addrs, buckets = utils.classify_ip_list(addr)
+        addrs_groups, _ = split_addrs_by_type(buckets)
+        snapshots = {}
+        for check_direction in ([direction] if direction else ['in', 'out']):
+            for grouptype, list_addrs in addrs_groups.items():
+                if not list_addrs:
+                    continue
+                snapshot = await self.blocklist_snapshot(check_direction, grouptype)
+                if snapshot is None:
+                    return check_blocked_error_result(addrs, check_direction, grouptype)
+                snapshots.setdefault(check_direction, {})[grouptype] = snapshot
+        return check_blocked_result(addrs, buckets, snapshots)
+
+    async def blocklist_snapshot(self, direction, grouptype):
+        """获取某方向某类型的封禁地址组快照（优先复用缓存），查询失败返回 None"""
+        key = (self.ak, self.region, direction, grouptype)
+        snapshot = cached_blocklist_snapshot(key)
+        if snapshot is not None:
+            return snapshot
+
+        generation = get_read_cache().generation()
+        query_prefix = block_query_prefix(direction)
+        res_describe_address_book = await self.describe_address_book(query=query_prefix, grouptype=grouptype)
+        snapshot = AddressBookSnapshot.from_describe(
+            res_describe_address_book, query_prefix,
+            utils.get_config('modify_address_book.max_addresses_per_group')
+        )
+        if snapshot is not None:
+            store_blocklist_snapshot(key, generation, snapshot)
+        return snapshot
@@ -4,10 +4,759 @@ import volcenginesdkcore
 import volcenginesdkfwcenter
 from volcenginesdkcore.rest import ApiException
 from loguru import logger
-from apps.fw_volcengine import utils
-import ipaddress
+from apps.fw_volcengine import metrics, tracing, utils
+from apps.fw_volcengine.address_book import AddressBookSnapshot, exclude_blocked, plan_block, plan_unblock
+from apps.fw_volcengine.cidr import PrefixTrie, aggregate_addresses, network_contains, parse_network
+from apps.fw_volcengine.control_policy import ControlPolicyIndex
+from apps.fw_volcengine.batcher import get_write_batcher
+from apps.fw_volcengine.cache import get_read_cache
+from apps.fw_volcengine.retry import THROTTLED, api_error_code, classify_api_error, should_retry
+from apps.fw_volcengine.concurrency import single_flight, run_concurrently, get_rate_limiter
+import ast
 import random
 import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 客户端缓存：按资产参数复用 FWCENTERApi（含底层 urllib3 长连接池），跨 handle_action 调用保持
+_client_cache = {}
+_client_cache_lock = threading.Lock()
+
+# 封禁名单快照缓存：(ak, region, 方向, 地址组类型) -> (查询缓存代数, 过期时间, AddressBookSnapshot)，供 CheckBlocked 高频查询复用前缀树
+_blocklist_cache = {}
+_blocklist_cache_lock = threading.Lock()
+
+
+def to_address_list(addresslist):
+    """处理addresslist格式 - 确保是列表（支持逗号分隔的字符串）"""
+    if isinstance(addresslist, str):
+        return [addr.strip() for addr in addresslist.split(',') if addr.strip()]
+    elif not isinstance(addresslist, list):
+        return []
+    return addresslist
+
+
+def convert_address_book(item):
+    """火山云SDK返回的是小写下划线格式，转换为阿里云的大写驼峰格式"""
+    return {
+        "GroupName": item.get('group_name', ''),
+        "GroupUuid": item.get('group_uuid', ''),
+        "Description": item.get('description', ''),
+        "AddressList": item.get('address_list', []),
+        "GroupType": item.get('group_type', ''),
+        "RefCnt": item.get('ref_cnt', 0)
+    }
+
+
+def convert_control_policy(item):
+    """火山云SDK返回的是小写下划线格式，转换为阿里云的大写驼峰格式"""
+    return {
+        "AclUuid": item.get('rule_id', ''),
+        "Action": item.get('action', ''),
+        "Description": item.get('description', ''),
+        "Destination": item.get('destination', ''),
+        "DestinationType": item.get('destination_type', ''),
+        "Direction": item.get('direction', ''),
+        "Proto": item.get('proto', ''),
+        "Source": item.get('source', ''),
+        "SourceType": item.get('source_type', ''),
+        "Status": item.get('status', True),
+        "Prio": item.get('prio', 0)
+    }
+
+
+def api_span_attributes(obj):
+    """SDK请求/响应对象中记录到 span 的属性：地址组与控制策略的 UUID、名称、方向、地址数量、分页等"""
+    attributes = {}
+    for attr, key in (('group_uuid', 'fw.group_uuid'), ('group_name', 'fw.group_name'), ('group_type', 'fw.group_type'),
+                      ('rule_id', 'fw.rule_id'), ('direction', 'fw.direction'), ('source', 'fw.source'),
+                      ('destination', 'fw.destination'), ('query', 'fw.query'), ('page_number', 'fw.page_number'),
+                      ('page_size', 'fw.page_size'), ('total_count', 'fw.total_count')):
+        value = getattr(obj, attr, None)
+        if value is not None:
+            attributes[key] = value
+    address_list = getattr(obj, 'address_list', None)
+    if address_list is not None:
+        attributes['fw.address_count'] = len(address_list)
+    data = getattr(obj, 'data', None)
+    if isinstance(data, list):
+        attributes['fw.item_count'] = len(data)
+    return attributes
+
+
+def block_control_policy_params(direction, grouptype, groupuuid, description):
+    """封禁地址组同名控制策略的创建参数（入方向以地址组为源，出方向以地址组为目的）"""
+    if direction == 'in':
+        return dict(
+            aclaction=utils.get_config('add_control_policy.action', 'deny'),
+            description=description,
+            destination=utils.get_config('add_control_policy.destination_any', '0.0.0.0/0'),
+            destinationtype='net',
+            direction=direction,
+            proto=utils.get_config('add_control_policy.proto', 'ANY'),
+            source=groupuuid,  # 修改：使用UUID而不是名称
+            sourcetype='group',
+            neworder=utils.get_config('add_control_policy.prio', 2)
+        )
+    elif direction == 'out':
+        if grouptype == 'ip':
+            return dict(
+                aclaction=utils.get_config('add_control_policy.action', 'deny'),
+                description=description,
+                destination=groupuuid,  # 修改：使用UUID而不是名称
+                destinationtype='group',
+                direction=direction,
+                proto=utils.get_config('add_control_policy.proto', 'ANY'),
+                source=utils.get_config('add_control_policy.source_any', '0.0.0.0/0'),
+                sourcetype='net',
+                neworder=utils.get_config('add_control_policy.prio', 2)
+            )
+        elif grouptype == 'domain':
+            return dict(
+                aclaction=utils.get_config('add_control_policy.action', 'deny'),
+                description=description,
+                destination=groupuuid,  # 修改：使用UUID而不是名称
+                destinationtype='group',
+                direction=direction,
+                proto=utils.get_config('add_control_policy.proto', 'TCP'),
+                source=utils.get_config('add_control_policy.source_any', '0.0.0.0/0'),
+                sourcetype='net',
+                neworder=utils.get_config('add_control_policy.prio', 2)
+            )
+    return None
+
+
+def merge_address_list(base_addresslist, add_addrs=(), remove_addrs=()):
+    """以 base_addresslist 为基础移除 remove_addrs、追加 add_addrs（按标准化地址比较，保持原有顺序）"""
+    set_remove = {utils.classify_ip(x)[0] for x in remove_addrs}
+    merged = {}
+    for addr in list(base_addresslist) + list(add_addrs):
+        normalized_addr = utils.classify_ip(addr)[0]
+        if normalized_addr not in set_remove:
+            merged.setdefault(normalized_addr, addr)
+    return list(merged.values())
+
+
+def lost_address_entries(current_addresslist, add_addrs=(), remove_addrs=()):
+    """回读校验：返回写入后丢失的地址（应存在却不存在、应移除却仍存在），为空表示未被并发写覆盖"""
+    set_current = {utils.classify_ip(x)[0] for x in current_addresslist}
+    return ([x for x in add_addrs if utils.classify_ip(x)[0] not in set_current] +
+            [x for x in remove_addrs if utils.classify_ip(x)[0] in set_current])
+
+
+def api_rate_limiter(ak, region, method):
+    """获取 (ak, region, API) 的令牌桶限流器，未配置速率上限时返回 None
+
+    速率取 rate_limit.api_qps.<API> ，未单独配置时取 rate_limit.qps；同一进程内所有线程共享令牌桶，
+    rate_limit.backend 为 file 时通过 rate_limit.state_dir 下的文件锁在多个工作进程间共享
+    """
+    qps = utils.get_config(f'rate_limit.api_qps.{method}') or utils.get_config('rate_limit.qps', 0)
+    if not qps:
+        return None
+    state_dir = utils.get_config('rate_limit.state_dir') if utils.get_config('rate_limit.backend', 'thread') == 'file' else None
+    return get_rate_limiter((ak, region, method), qps, utils.get_config('rate_limit.burst'), state_dir)
+
+
+def has_next_page(page_items, page_size, fetched, total_count):
+    """翻页时是否还有下一页
+
+    服务端返回了总数时以总数为准：服务端可能把 PageSize 限制为更小的值，返回不足一页不代表已取完；
+    未返回总数时以返回不足一页为结束；空页总是结束，避免死循环
+    """
+    if not page_items:
+        return False
+    if total_count is not None:
+        return fetched < total_count
+    return len(page_items) >= page_size
+
+
+def split_addrs_by_type(buckets):
+    """将解析时的地址分类结果（utils.classify_ip_list 返回的 buckets）转换为地址组类型分组，不再重新分类
+
+    Returns:
+        (addrs_groups, ipv6_addrs)
+        addrs_groups: {"ip": [...], "domain": [...]}，ipv4 地址/网段归入 ip，无法解析为IP的归入 domain
+        ipv6_addrs: IPV6 地址列表（无需封禁）
+    """
+    addrs_groups = {
+        "ip" : list(buckets["ipv4"]),
+        "domain": list(buckets["domain"])
+    }
+    return addrs_groups, list(buckets["ipv6"])
+
+
+def unblock_group_msgs(res, matched_addrs, success_msg):
+    """根据地址组修改/删除结果，生成每个匹配IP的解封结果消息"""
+    list_msgs = []
+    for matched_addr in matched_addrs:
+        if isinstance(res, dict) and res.get('statusCode') == 200:
+            msg = dict({"addr": f"{matched_addr}"}, **success_msg)
+        else:
+            msg = {
+                "addr": f"{matched_addr}",
+                "desc": "解封失败"
+            }
+        utils.log_payload('', msg)
+        list_msgs.append(msg)
+    return list_msgs
+
+
+def invalid_direction_result(addr):
+    """direction参数错误时的返回结果"""
+    msg = {
+        "addr": f"{addr}",
+        "desc": "direction参数必须为'in'或'out'"
+    }
+    logger.error(f'{msg}')
+    return msg
+
+
+def filter_task_msgs(msgs, addrs):
+    """从任务的结果消息中筛选出与 addrs 相关的消息，消息中的 addr 字段替换为 addrs 中与之重叠的地址
+
+    封禁时写入的地址段与调用方输入的地址不一定相同：地址段可能被归并（如 10.0.0.0/32 + 10.0.0.1/32 -> 10.0.0.0/31）、
+    或剔除了地址组中已有的部分（如 10.0.0.0/31 中已封禁 10.0.0.0 时只写入 10.0.0.1/32），按覆盖关系映射回输入的地址
+    """
+    set_addrs = set(addrs)
+    addrs_trie = None
+    list_msgs = []
+    for msg in msgs:
+        msg_addr = msg.get('addr', '')
+        if msg_addr.startswith('['):
+            # 批量失败消息的 addr 为地址列表的字符串形式
+            try:
+                msg_addrs = ast.literal_eval(msg_addr)
+            except (ValueError, SyntaxError):
+                msg_addrs = []
+        else:
+            msg_addrs = [x.strip() for x in msg_addr.split(',')]
+        matched_addrs = {}      # dict 保持顺序，当作有序集合使用
+        for x in msg_addrs:
+            exact = x in set_addrs
+            if exact:
+                matched_addrs[x] = None
+                if x.endswith('/32') or '/' not in x:
+                    # 单个地址或域名，不会覆盖其他输入
+                    continue
+            network = parse_network(x)
+            if network is None:
+                continue
+            if addrs_trie is None:
+                addrs_trie = PrefixTrie()
+                for addr in addrs:
+                    addr_network = parse_network(addr)
+                    if addr_network is not None:
+                        addrs_trie.insert(addr_network, addr)
+            # 被该地址段覆盖的输入地址（如输入 10.0.0.0/24 与 10.0.0.5/32 归并为 10.0.0.0/24），
+            # 地址段不是输入地址时（归并或剔除已封禁部分后的地址段）还包括覆盖该地址段的输入地址
+            matches = addrs_trie.subnets(network) if exact else addrs_trie.matches(network) + addrs_trie.subnets(network)
+            for _, addr in matches:
+                matched_addrs[addr] = None
+        if matched_addrs:
+            matched_addrs = list(matched_addrs)
+            list_msgs.append(dict(msg, addr=f"{matched_addrs}" if msg_addr.startswith('[') else ','.join(matched_addrs)))
+    return list_msgs
+
+
+def block_aggregate_addresses(addrs):
+    """按 cidr 配置归并待封禁地址，cidr.aggregate 为 false 时原样返回"""
+    if not utils.get_config('cidr.aggregate', True):
+        return addrs
+    return aggregate_addresses(
+        addrs,
+        utils.get_config('cidr.summarize_density', 0),
+        utils.get_config('cidr.summarize_min_prefixlen', 24)
+    )
+
+
+def cached_blocklist_snapshot(key):
+    """获取仍然有效的封禁名单快照：构建后没有发生写操作（查询缓存代数未变）且未超过 cache.ttl，否则返回 None"""
+    with _blocklist_cache_lock:
+        entry = _blocklist_cache.get(key)
+    if entry and entry[0] == get_read_cache().generation() and entry[1] > time.monotonic():
+        return entry[2]
+    return None
+
+
+def store_blocklist_snapshot(key, generation, snapshot):
+    """缓存封禁名单快照（预先构建前缀树），generation 为查询地址组前的查询缓存代数"""
+    ttl = utils.get_config('cache.ttl', 0)
+    if ttl <= 0:
+        return
+    snapshot.prefix_trie()
+    with _blocklist_cache_lock:
+        _blocklist_cache[key] = (generation, time.monotonic() + ttl, snapshot)
+
+
+def check_blocked_result(addrs, buckets, snapshots):
+    """组装 CheckBlocked 的返回结果
+
+    Args:
+        addrs: 标准化地址列表
+        buckets: addrs 的分类结果，见 utils.classify_ip_list
+        snapshots: {方向: {地址组类型: AddressBookSnapshot}}
+    """
+    if not addrs:
+        return {
+            "statusCode": 400,
+            "error": "没有有效的IP地址",
+            "body": {
+                "total_ips": 0,
+                "blocked_count": 0,
+                "results": []
+            }
+        }
+
+    addrs_groups, _ = split_addrs_by_type(buckets)
+    addr_grouptypes = {addr: grouptype for grouptype, list_addrs in addrs_groups.items() for addr in list_addrs}
+    results = []
+    for addr in addrs:
+        matches = []
+        for direction, grouptype_snapshots in snapshots.items():
+            snapshot = grouptype_snapshots.get(addr_grouptypes.get(addr))
+            hit = snapshot.longest_match(addr) if snapshot is not None else None
+            if hit:
+                matches.append({
+                    "direction": direction,
+                    "groupname": hit[1],
+                    "groupuuid": hit[0],
+                    "matched": hit[2]
+                })
+        results.append({
+            "addr": f"{addr}",
+            "blocked": bool(matches),
+            "matches": matches,
+            "desc": "已封禁" if matches else "未封禁"
+        })
+
+    blocked_count = sum(1 for result in results if result['blocked'])
+    return {
+        "statusCode": 200,
+        "message": f"{len(addrs)} 个IP中 {blocked_count} 个已被火山云防火墙封禁",
+        "body": {
+            "total_ips": len(addrs),
+            "blocked_count": blocked_count,
+            "results": results
+        }
+    }
+
+
+def check_blocked_error_result(addrs, direction, grouptype):
+    """CheckBlocked 查询地址组失败时的返回结果"""
+    msg = f"查询地址组失败: direction={direction}, grouptype={grouptype}"
+    logger.error(msg)
+    return {
+        "statusCode": 500,
+        "error": msg,
+        "body": {
+            "total_ips": len(addrs),
+            "blocked_count": 0,
+            "results": []
+        }
+    }
+
+
+def block_task_result(addrs, list_success_addrs, list_failed_addrs, list_existed_addrs):
+    """组装封禁任务统一的返回结果格式"""
+    if not addrs:
+        return {
+            "statusCode": 400,
+            "error": "没有有效的IP地址",
+            "body": {
+                "total_ips": 0,
+                "success_count": 0,
+                "failed_count": 0,
+                "existed_count": 0,
+                "results": []
+            }
+        }
+
+    all_results = list_success_addrs + list_failed_addrs + list_existed_addrs
+    
+    if list_success_addrs:
+        return {
+            "statusCode": 200,
+            "message": f"成功将 {len(list_success_addrs)} 个IP添加到火山云防火墙封禁列表",
+            "body": {
+                "total_ips": len(addrs),
+                "success_count": len(list_success_addrs),
+                "failed_count": len(list_failed_addrs),
+                "existed_count": len(list_existed_addrs),
+                "results": all_results
+            }
+        }
+    else:
+        return {
+            "statusCode": 400,
+            "error": "所有IP都无法添加到火山云防火墙封禁列表",
+            "body": {
+                "total_ips": len(addrs),
+                "success_count": len(list_success_addrs),
+                "failed_count": len(list_failed_addrs),
+                "existed_count": len(list_existed_addrs),
+                "results": all_results
+            }
+        }
+
+
+def unblock_task_result(addrs, list_success_addrs, list_failed_addrs):
+    """组装解封任务统一的返回结果格式"""
+    if not addrs:
+        return {
+            "statusCode": 400,
+            "error": "没有有效的IP地址",
+            "body": {
+                "total_ips": 0,
+                "success_count": 0,
+                "failed_count": 0,
+                "results": []
+            }
+        }
+
+    all_results = list_success_addrs + list_failed_addrs
+    
+    if list_success_addrs:
+        return {
+            "statusCode": 200,
+            "message": f"成功从火山云防火墙封禁列表中移除 {len(list_success_addrs)} 个IP",
+            "body": {
+                "total_ips": len(addrs),
+                "success_count": len(list_success_addrs),
+                "failed_count": len(list_failed_addrs),
+                "results": all_results
+            }
+        }
+    else:
+        return {
+            "statusCode": 400,
+            "error": "没有找到需要移除的IP",
+            "body": {
+                "total_ips": len(addrs),
+                "success_count": len(list_success_addrs),
+                "failed_count": len(list_failed_addrs),
+                "results": all_results
+            }
+        }
+
+
+def task_metrics_result(res, task_metrics):
+    """将任务指标写入任务结果：retries 为API调用的重试次数，metrics.enabled 时增加 metrics 指标汇总；
+    配置了 metrics.prometheus_file 时将进程内累计的指标写入该文件（Prometheus 文本格式）
+    """
+    res['body']['retries'] = task_metrics.retries
+    if utils.get_config('metrics.enabled', False):
+        res['body']['metrics'] = task_metrics.summary()
+    prometheus_file = utils.get_config('metrics.prometheus_file', '')
+    if prometheus_file:
+        try:
+            metrics.registry.write_prometheus(prometheus_file)
+        except OSError as e:
+            logger.error(f'写入指标文件失败: {e}')
+    return res
+
+
+def stream_task_result(chunk_results):
+    """汇总流式任务逐块产出的结果：累加各块的计数，只保留未成功的块的错误信息，不保留逐IP结果"""
+    summary = {"chunks": 0, "total_ips": 0, "success_count": 0, "failed_count": 0, "existed_count": 0, "retries": 0}
+    failed_chunks = []
+    chunk_metrics = []
+    for res in chunk_results:
+        body = res.get('body') if isinstance(res, dict) else None
+        if body is None:
+            # direction 参数错误等整体失败
+            return res
+        summary["chunks"] += 1
+        for key in ("total_ips", "success_count", "failed_count", "existed_count", "retries"):
+            summary[key] += body.get(key, 0)
+        if body.get('metrics'):
+            chunk_metrics.append(body['metrics'])
+        if res.get('statusCode') != 200:
+            failed_chunks.append({"chunk": body.get('chunk'), "statusCode": res.get('statusCode'), "error": res.get('error')})
+    summary["failed_chunks"] = failed_chunks
+    if chunk_metrics:
+        summary["metrics"] = metrics.merge_summaries(chunk_metrics)
+    if not summary["chunks"]:
+        return {"statusCode": 400, "error": "没有有效的IP地址", "body": summary}
+    message = f"共处理 {summary['chunks']} 块 {summary['total_ips']} 个IP，成功 {summary['success_count']} 个"
+    if summary["success_count"]:
+        return {"statusCode": 200, "message": message, "body": summary}
+    return {"statusCode": 400, "error": message, "body": summary}
+
+
+def block_query_prefix(direction):
+    """封禁地址组/控制策略的名称前缀（按方向区分）"""
+    return f"{utils.get_config('add_address_book.group_name_prefix', '')}-{direction.title()}"
+
+
+def block_fill_msg(addrgrp, list_addrgrp_addresslist, res_modify_address_book):
+    """根据地址组读-合并-写结果，生成写入现有地址组的封禁结果消息（desc 为 封禁成功/封禁失败）"""
+    msg = {
+        "addr": f"{','.join(list_addrgrp_addresslist)}",
+        "groupname": f"{addrgrp['GroupName']}",
+        "groupuuid": f"{addrgrp['GroupUuid']}",
+    }
+    if isinstance(res_modify_address_book, dict) and res_modify_address_book.get('statusCode') == 200:
+        msg["grouplen"] = len(res_modify_address_book['addresslist'])
+        msg["desc"] = "封禁成功"
+        if res_modify_address_book['conflicts']:
+            msg["conflicts"] = res_modify_address_book['conflicts']
+    else:
+        msg["desc"] = "封禁失败"
+    utils.log_payload('', msg)
+    return msg
+
+
+def block_policy_msg(res_add_address_book, list_addrgrp_addresslist, res_add_control_policy):
+    """根据新建地址组的控制策略创建结果，生成封禁结果消息（desc 为 封禁成功/创建失败）"""
+    if isinstance(res_add_control_policy, dict) and res_add_control_policy.get('desc') == "创建成功":
+        msg = {
+            "addr": f"{','.join(list_addrgrp_addresslist)}",
+            "groupname": res_add_address_book['groupname'],
+            "groupuuid": res_add_address_book['groupuuid'],
+            "grouplen": len(list_addrgrp_addresslist),
+            "acluuid": res_add_control_policy['acluuid'],
+            "desc": "封禁成功"
+        }
+    else:
+        msg = {
+            "groupname": res_add_address_book['groupname'],
+            "groupuuid": res_add_address_book['groupuuid'],
+            "description": res_add_address_book['description'],
+            "acluuid": res_add_control_policy.get('acluuid', '') if isinstance(res_add_control_policy, dict) else '',
+            "desc": "创建失败"
+        }
+    utils.log_payload('', msg)
+    return msg
+
+
+class _AddressTask:
+    """封禁/解封任务的公共状态：地址组名称前缀、地址组容量、并发度与任务内复用的控制策略索引"""
+
+    def __init__(self, direction):
+        self.direction = direction
+        self.query_prefix = block_query_prefix(direction)
+        self.max_addresses_per_group = utils.get_config('modify_address_book.max_addresses_per_group')
+        self.max_workers = utils.get_config('concurrency.max_workers', 1)
+        # 控制策略索引（首次需要时由调用方加载，任务内复用）
+        self.policy_index = None
+
+    def build_snapshot(self, res_describe_address_book):
+        """由地址组查询结果构建地址组快照（标准化地址 -> 地址组 的哈希索引），查询失败时记录日志并返回 None"""
+        snapshot = AddressBookSnapshot.from_describe(res_describe_address_book, self.query_prefix, self.max_addresses_per_group)
+        if snapshot is None:
+            logger.error(f"查询地址组失败: {res_describe_address_book}")
+        return snapshot
+
+
+class BlockTask(_AddressTask):
+    """封禁任务的规划与结果（同步/异步版本共用，调用方只负责执行API调用与记录 span）
+
+    任何一个需要封禁的地址同一时间只位于 待处理(remain)、success、failed、existed 中的一个，
+    remain 按地址类型保存待处理地址，会在执行过程中被消费直到为空。主循环每一轮对每种地址类型依次执行：
+        步骤1：判断需要封禁的地址资源是否已存在于现有封禁策略中（check_existed）
+        步骤2：装箱规划，先填满现有指定名称前缀、且已有同名控制策略的地址簿空位，
+               剩余IP按容量切分为若干新地址簿（plan / record_fills）
+        步骤3：按规划创建新的地址簿（创建时即写入最终地址列表） 和 同名称的控制策略组（record_created），
+               创建失败的IP保留在待处理地址中，交给下一轮重新规划
+    每轮结束后由 end_iteration 判断是否继续
+    """
+
+    def __init__(self, buckets, direction):
+        super().__init__(direction)
+        self.success = []       # 封禁成功的ip地址字典的列表
+        self.failed = []        # 封禁失败的ip地址字典的列表
+        self.existed = []       # 已存在于现有封禁策略中的ip地址字典的列表
+        # 连续处理失败次数计数器（防止while由于某些原因导致死循环）
+        self.consecutive_failures = 0
+        self._remain_count_before = 0
+        # 按解析时的地址分类分组；IPV6 无需封禁
+        # 步骤1 判断已存在后，待处理地址替换为归并并剔除已封禁部分后需要写入的地址段
+        self.remain, list_ipv6_addrs = split_addrs_by_type(buckets)
+        for addr in list_ipv6_addrs:
+            self.existed.append({
+                "addr": f"{addr}",
+                "desc": "无需封禁"
+            })
+
+    def remain_addrs(self):
+        """待处理地址列表"""
+        return [addr for list_addrs in self.remain.values() for addr in list_addrs]
+
+    def remain_count(self):
+        return sum(len(list_addrs) for list_addrs in self.remain.values())
+
+    def start_iteration(self):
+        """开始新的一轮，返回本轮各地址类型的待处理地址 [(地址组类型, 地址列表), ...]"""
+        self._remain_count_before = self.remain_count()
+        utils.log_payload(f'待处理地址 len({self._remain_count_before}): ', self.remain_addrs())
+        return [(grouptype, list(list_addrs)) for grouptype, list_addrs in self.remain.items() if list_addrs]
+
+    def _consume(self, grouptype, addrs):
+        """将已处理的地址从待处理地址中移除，保证下一轮不再处理"""
+        set_addrs = set(addrs)
+        self.remain[grouptype] = [x for x in self.remain[grouptype] if x not in set_addrs]
+
+    def check_existed(self, grouptype, snapshot, list_addrs):
+        """步骤1：已存在于地址组中、或已被地址组中的地址段覆盖的地址记为已存在（快照索引查询），
+        其余地址合并重叠/相邻的地址段以节省地址组容量（可选将稠密地址段汇总为一个前缀），
+        并剔除已被地址组中更精确的条目封禁的部分，作为该类型新的待处理地址
+
+        Returns:
+            (需要写入的地址列表, 已存在的地址数量)
+        """
+        existed_count = 0
+        list_pending_addrs = []
+        for addr in list_addrs:
+            hit = snapshot.lookup(addr) or snapshot.covering(addr)
+            if hit:
+                self._record_existed(addr, hit[1])
+                existed_count += 1
+            else:
+                list_pending_addrs.append(addr)
+
+        list_new_addrs, blocked = exclude_blocked(snapshot, block_aggregate_addresses(list_pending_addrs))
+        for supernet, hit in blocked.items():
+            # 地址段的每一部分都已被更精确的条目封禁
+            for addr in list_pending_addrs:
+                if network_contains(supernet, addr):
+                    self._record_existed(addr, hit[1])
+                    existed_count += 1
+        self.remain[grouptype] = list_new_addrs
+        return list_new_addrs, existed_count
+
+    def _record_existed(self, addr, groupname):
+        msg = {
+            "addr": f"{addr}",
+            "groupname": groupname,
+            "desc": "无需封禁"
+        }
+        self.existed.append(msg)
+        utils.log_payload('', msg)
+
+    def needs_policy_index(self, snapshot, list_addrs):
+        """步骤2 是否需要加载控制策略索引：尚未加载，且存在可以填充的现有地址组"""
+        return self.policy_index is None and bool(list_addrs) and bool(snapshot.groups_with_free_slots())
+
+    def plan(self, snapshot, list_addrs):
+        """步骤2：装箱规划，地址组是否已有封禁策略通过控制策略索引判断，没有则跳过该地址组
+
+        Returns:
+            (fills, new_groups)，见 address_book.plan_block
+        """
+        return plan_block(
+            snapshot,
+            list_addrs,
+            lambda addrgrp: self.policy_index is not None and self.policy_index.has_group_policy(addrgrp)
+        )
+
+    def record_fills(self, grouptype, snapshot, fills, list_fill_msgs):
+        """记录步骤2 写入现有地址组的结果，写入的地址无论成败都视为已处理"""
+        for (addrgrp, list_addrgrp_addresslist), msg in zip(fills, list_fill_msgs):
+            if msg['desc'] == "封禁成功":
+                snapshot.add(addrgrp['GroupUuid'], list_addrgrp_addresslist)
+                self.success.append(msg)
+            else:
+                self.failed.append(msg)
+            self._consume(grouptype, list_addrgrp_addresslist)
+
+    def record_created(self, grouptype, list_created_groups, list_policy_msgs):
+        """记录步骤3 新建地址组及控制策略的结果，只有封禁成功的地址视为已处理
+
+        Returns:
+            封禁成功的地址组数量
+        """
+        success_count = 0
+        for (res_add_address_book, list_addrgrp_addresslist), msg in zip(list_created_groups, list_policy_msgs):
+            if msg['desc'] == "封禁成功":
+                success_count += 1
+                self.success.append(msg)
+                if self.policy_index is not None:
+                    self.policy_index.add_group_policy(msg['acluuid'], res_add_address_book['description'], res_add_address_book['groupuuid'])
+                self._consume(grouptype, list_addrgrp_addresslist)
+        return success_count
+
+    def end_iteration(self):
+        """while主循环保护机制：连续2轮待处理地址的数量没有变化时，剩余地址记为封禁失败
+
+        Returns:
+            是否继续下一轮
+        """
+        if not self.remain_count():
+            return False
+        if self.remain_count() != self._remain_count_before:
+            # 本轮处理了地址，连续处理失败次数归零
+            self.consecutive_failures = 0
+            return True
+        self.consecutive_failures += 1
+        if self.consecutive_failures < 2:
+            return True
+        msg = {
+            "addr": f"{self.remain_addrs()}",
+            "desc": "封禁失败"
+        }
+        utils.log_payload('', msg)
+        self.failed.append(msg)
+        return False
+
+    def results(self):
+        """返回 (list_success_addrs, list_failed_addrs, list_existed_addrs)"""
+        return self.success, self.failed, self.existed
+
+
+class UnblockTask(_AddressTask):
+    """解封任务的规划与结果（同步/异步版本共用）：每种地址类型只查询一次地址组，按快照一次性规划后批量执行"""
+
+    def __init__(self, buckets, direction):
+        super().__init__(direction)
+        self.success = []       # 解封成功的ip地址字典的列表
+        self.failed = []        # 解封失败的ip地址字典的列表
+        self.notfound = []      # 未找到的ip地址列表
+        # 按地址类型分组处理，IPV6 直接跳过
+        addrs_groups, _ = split_addrs_by_type(buckets)
+        self.addrs_groups = [(grouptype, list_addrs) for grouptype, list_addrs in addrs_groups.items() if list_addrs]
+
+    def plan(self, snapshot, list_addrs):
+        """按快照索引将待解封的IP归集到其所在的地址组，规划每个地址组的修改/删除，未找到的IP记为失败
+
+        Returns:
+            plans，见 address_book.plan_unblock；快照为 None（查询地址组失败）时返回空列表
+        """
+        if snapshot is None:
+            self.notfound.extend(list_addrs)
+            return []
+        plans, not_found = plan_unblock(snapshot, list_addrs)
+        self.notfound.extend(not_found)
+        return plans
+
+    def needs_policy_index(self, plans):
+        """存在需要删除的地址组、且尚未加载控制策略索引（用于查找引用这些地址组的控制策略）"""
+        return self.policy_index is None and any(not plan[2] for plan in plans)
+
+    def record_group_msgs(self, list_group_msgs):
+        """记录各地址组修改/删除的结果消息，返回解封成功的IP数量"""
+        success_count = 0
+        for list_msgs in list_group_msgs:
+            for msg in list_msgs:
+                if msg['desc'] == "解封成功":
+                    success_count += 1
+                    self.success.append(msg)
+                else:
+                    self.failed.append(msg)
+        return success_count
+
+    def results(self):
+        """处理未找到的IP，返回 (list_success_addrs, list_failed_addrs)"""
+        for addr in self.notfound:
+            msg = {
+                "addr": f"{addr}",
+                "desc": "未找到该IP"
+            }
+            utils.log_payload('', msg)
+            self.failed.append(msg)
+        self.notfound = []
+        return self.success, self.failed
+
 
 class FwVolcengineApp:
     def __init__(self, ak, sk, endpoint, region, proxies=None):
@@ -18,27 +767,106 @@ class FwVolcengineApp:
         self.proxies = proxies
 
     def create_client(self):
-        """创建火山云防火墙客户端"""
-        configuration = volcenginesdkcore.Configuration()
-        configuration.ak = self.ak
-        configuration.sk = self.sk
-        configuration.region = self.region # 这个参数必须有
-        configuration.client_side_validation = True
-        configuration.host = self.endpoint
-        if self.proxies:
-            configuration.proxy = self.proxies
-        volcenginesdkcore.Configuration.set_default(configuration)
-        return volcenginesdkfwcenter.FWCENTERApi()
+        """获取火山云防火墙客户端
 
-    # 火山云云防火墙原子方法
+        同一组 (ak, sk, endpoint, region, proxies) 在进程内只创建一次客户端，
+        后续调用复用同一个连接池；使用独立的 ApiClient，不修改 SDK 全局默认配置
+        """
+        cache_key = (self.ak, self.sk, self.endpoint, self.region, self.proxies)
+        client = _client_cache.get(cache_key)
+        if client is not None:
+            return client
+        with _client_cache_lock:
+            client = _client_cache.get(cache_key)
+            if client is None:
+                configuration = volcenginesdkcore.Configuration()
+                configuration.ak = self.ak
+                configuration.sk = self.sk
+                configuration.region = self.region # 这个参数必须有
+                configuration.client_side_validation = True
+                configuration.host = self.endpoint
+                configuration.connection_pool_maxsize = utils.get_config('client.pool_maxsize', 10)
+                configuration.auto_retry = False  # 重试统一由 _call_api 处理
+                if self.proxies:
+                    configuration.proxy = self.proxies
+                api_client = volcenginesdkcore.ApiClient(configuration)
+                client = volcenginesdkfwcenter.FWCENTERApi(api_client)
+                _client_cache[cache_key] = client
+        return client
+
+    def _throttle(self, method):
+        """按 (ak, region, API) 限流，令牌不足时阻塞等待，返回等待的秒数"""
+        limiter = api_rate_limiter(self.ak, self.region, method)
+        return limiter.acquire() if limiter else 0.0
 
-    def add_address_book(self, groupname, grouptype, description, addresslist):
+    def _call_api(self, method, request, idempotent=True):
+        """统一的SDK调用入口：限流、错误分类与重试
+
+        可重试的错误（限流、连接失败、5xx、服务端内部错误）按指数退避 + 随机抖动重试，
+        受 retry.max_attempts 次数与 retry.budget 时间预算约束；被限流时重试请求还需从该租户共享的
+        限流令牌桶（retry.throttle_qps）取令牌，避免集中重试再次触发限流；
+        非幂等调用（创建类接口）仅在请求确定未被处理时重试
+
+        Returns:
+            (resp, status, headers)，与 *_with_http_info 一致；不可重试或重试耗尽时抛出最后一次的异常
+        """
         client = self.create_client()
+        max_attempts = utils.get_config('retry.max_attempts', 5)
+        backoff_base = utils.get_config('retry.backoff_base', 0.5)
+        backoff_max = utils.get_config('retry.backoff_max', 8)
+        deadline = time.monotonic() + utils.get_config('retry.budget', 30)
+        span_attributes = {"rpc.system": "volcengine", "rpc.service": "fwcenter", "rpc.method": method}
+        span_attributes.update(api_span_attributes(request))
+        with tracing.span(f'fwcenter.{method}', span_attributes, tracing.SPAN_KIND_CLIENT) as call_span:
+            attempt = 0
+            while True:
+                self._throttle(method)
+                started = time.perf_counter()
+                try:
+                    result = getattr(client, f'{method}_with_http_info')(request, _return_http_data_only=False)
+                except Exception as e:
+                    kind = classify_api_error(e)
+                    metrics.record_call(method, time.perf_counter() - started, kind or metrics.OUTCOME_ERROR)
+                    call_span.set_attributes({"fw.attempts": attempt + 1, "http.status_code": getattr(e, 'status', None),
+                                              "fw.error_code": api_error_code(e), "fw.error_kind": kind})
+                    delay = utils.backoff_delay(attempt, backoff_base, backoff_max)
+                    if kind == THROTTLED:
+                        delay = max(delay, get_rate_limiter((self.ak, self.region, 'throttled'), utils.get_config('retry.throttle_qps', 5)).reserve())
+                    attempt += 1
+                    if (not should_retry(kind, idempotent) or attempt >= max_attempts or
+                            time.monotonic() + delay > deadline):
+                        raise
+                    metrics.record_retry(method)
+                    logger.warning(f'{method} 调用失败（{kind}），{delay:.2f}秒后第{attempt}次重试: {e}')
+                    metrics.sleep(delay, 'retry_backoff')
+                else:
+                    metrics.record_call(method, time.perf_counter() - started)
+                    call_span.set_attributes({"fw.attempts": attempt + 1, "http.status_code": result[1]})
+                    call_span.set_attributes(api_span_attributes(result[0]))
+                    return result
+
+    def _cache_key(self, *parts):
+        """查询结果缓存键：(ak, region, 资源类型, 查询参数...)"""
+        return (self.ak, self.region) + parts
+
+    def _batch_key(self, *parts):
+        """写合并的批次键/执行顺序键：(ak, sk, endpoint, region, 方向[, 操作])，只有同一客户端配置的请求才会合并执行"""
+        return (self.ak, self.sk, self.endpoint, self.region) + parts
+
+    def _invalidate_cache(self, *parts):
+        """写操作后失效该租户对应资源的查询缓存（地址组写操作失效全部地址组查询，控制策略写操作失效该方向的策略查询）"""
+        get_read_cache().invalidate(self._cache_key(*parts))
+
+    # 火山云云防火墙原子方法
+
+    def add_address_book(self, groupname, grouptype, description, addresslist, verify=True):
+        """创建地址组
+
+        verify=True 时轮询等待地址组在查询结果中可见后才返回创建成功；
+        批量创建时可传 verify=False，由调用方统一调用 wait_address_books_ready 等待
+        """
         # 处理addresslist格式 - 确保是列表
-        if isinstance(addresslist, str):
-            addresslist = [addr.strip() for addr in addresslist.split(',') if addr.strip()]
-        elif not isinstance(addresslist, list):
-            addresslist = []
+        addresslist = to_address_list(addresslist)
         
         request = volcenginesdkfwcenter.AddAddressBookRequest(
             group_name=groupname,
@@ -47,34 +875,26 @@ class FwVolcengineApp:
             address_list=addresslist
         )
         try:
-            resp, status, headers = client.add_address_book_with_http_info(request, _return_http_data_only=False)
+            resp, status, headers = self._call_api('add_address_book', request, idempotent=False)
             data = resp.to_dict()
-            logger.info(f'add_address_book响应: status={status}, data={data}')
+            utils.log_payload(f'add_address_book响应: status={status}, data=', data)
             
             # 检查是否真正创建成功：状态码200且有group_uuid
             if status == 200 and data.get('group_uuid'):
-                # 再次验证地址组是否真的存在
-                import time
-                time.sleep(1)  # 等待1秒
-                verify_result = self.describe_address_book(query=groupname, grouptype=grouptype)
-                logger.info(f'验证地址组创建结果: {verify_result}')
-                
-                if (isinstance(verify_result, dict) and 
-                    verify_result.get('statusCode') == 200 and 
-                    verify_result.get('body', {}).get('Acls')):
-                    msg = {
-                        "desc": "创建成功",
-                        "groupname": groupname,
-                        "groupuuid": data.get('group_uuid', ''),
-                        "description": description
-                    }
-                    return msg
-                else:
-                    logger.error(f'地址组创建后验证失败: {verify_result}')
+                # 再次验证地址组是否真的存在（可见即返回，超时视为失败）
+                if verify and data['group_uuid'] not in self.wait_address_books_ready(groupname, grouptype, [data['group_uuid']]):
+                    logger.error(f'地址组创建后验证失败: {groupname}')
                     msg = {
                         "desc": "创建失败"
                     }
                     return msg
+                msg = {
+                    "desc": "创建成功",
+                    "groupname": groupname,
+                    "groupuuid": data.get('group_uuid', ''),
+                    "description": description
+                }
+                return msg
             else:
                 logger.error(f'地址组创建失败: status={status}, data={data}')
                 msg = {
@@ -84,14 +904,59 @@ class FwVolcengineApp:
         except Exception as e:
             logger.error(f'地址组创建异常: {e}')
             return str(e)
+        finally:
+            self._invalidate_cache('address_book')
+
+    def wait_address_books_ready(self, query, grouptype, groupuuids, timeout=None):
+        """等待新建的地址组在查询结果中可见
+
+        火山云API创建地址组后需要时间同步。多个待确认的地址组共享同一轮查询，
+        全部可见即返回；未全部可见时按指数退避 + 随机抖动间隔重试，直至超时
+
+        Args:
+            query: 查询条件，需能匹配到全部待确认的地址组（如地址组名称前缀）
+            grouptype: 地址组类型
+            groupuuids: 待确认的地址组UUID列表
+            timeout: 等待超时（秒），默认读取 add_address_book.ready_timeout
+
+        Returns:
+            已可见的地址组UUID集合
+        """
+        if timeout is None:
+            timeout = utils.get_config('add_address_book.ready_timeout', 30)
+        backoff_base = utils.get_config('add_address_book.ready_backoff_base', 0.5)
+        backoff_max = utils.get_config('add_address_book.ready_backoff_max', 5)
+        deadline = time.monotonic() + timeout
+        pending = set(groupuuids)
+        ready = set()
+        with tracing.span('wait_address_books_ready', {"fw.group_type": grouptype, "fw.group_count": len(pending)}) as wait_span:
+            attempt = 0
+            while pending:
+                try:
+                    for acl in self.iter_address_books(query, grouptype):
+                        if acl['GroupUuid'] in pending:
+                            pending.discard(acl['GroupUuid'])
+                            ready.add(acl['GroupUuid'])
+                            if not pending:
+                                break
+                except Exception as e:
+                    logger.error(f'查询地址组可见性失败: {e}')
+                remaining = deadline - time.monotonic()
+                if not pending or remaining <= 0:
+                    break
+                metrics.sleep(min(utils.backoff_delay(attempt, backoff_base, backoff_max), remaining), 'ready_wait')
+                attempt += 1
+            if pending:
+                logger.error(f'等待地址组可见超时: {pending}')
+            wait_span.set_attributes({"fw.ready_group_count": len(ready), "fw.attempts": attempt + 1})
+        return ready
 
     def delete_address_book(self, groupuuid):
-        client = self.create_client()
         request = volcenginesdkfwcenter.DeleteAddressBookRequest(
             group_uuid=groupuuid
         )
         try:
-            resp, status, headers = client.delete_address_book_with_http_info(request, _return_http_data_only=False)
+            resp, status, headers = self._call_api('delete_address_book', request)
             logger.info(f'删除地址簿成功: {groupuuid}')
             # 完全模拟阿里云的返回格式
             res = {
@@ -101,53 +966,110 @@ class FwVolcengineApp:
         except Exception as e:
             logger.error(f'{e}')
             return str(e)
+        finally:
+            self._invalidate_cache('address_book')
 
-    def describe_address_book(self, query, grouptype):
-        client = self.create_client()
+    def _describe_address_book_page(self, query, grouptype, page_number, page_size):
+        """查询单页地址组，返回 (status, total_count, 阿里云格式的地址组列表)"""
         request = volcenginesdkfwcenter.DescribeAddressBookRequest(
             query=query,
             group_type=grouptype,
-            page_number=utils.get_config('describe_address_book.page_number', 1),
-            page_size=utils.get_config('describe_address_book.page_size', 500)
+            page_number=page_number,
+            page_size=page_size
         )
+        resp, status, headers = self._call_api('describe_address_book', request)
+        data = resp.to_dict()
+        utils.log_payload('describe_address_book响应: ', data)
+        # 火山云SDK返回的是小写下划线格式，需要转换为阿里云的大写驼峰格式
+        # 注意：火山云SDK在没有数据时返回data=None，需要转换为空数组
+        acls_data = [convert_address_book(item) for item in data.get('data') or []]
+        return status, data.get('total_count'), acls_data
+
+    def _iter_pages(self, fetch_page, page_number, page_size, prefetch=False):
+        """通用翻页生成器，每次产出 (status, total_count, 当前页数据列表)
+
+        fetch_page(page_number, page_size) 需返回 (status, total_count, items)；
+        已取完服务端总数（未返回总数时为返回不足一页）或返回空页时停止。调用方提前结束迭代时不再请求后续页。
+        prefetch=True 时在调用方处理当前页的同时，后台线程预取下一页
+        """
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        future = None
         try:
-            resp, status, headers = client.describe_address_book_with_http_info(request, _return_http_data_only=False)
-            data = resp.to_dict()
-            logger.info(f'{data}')
-            # 完全模拟阿里云的返回格式
-            # 火山云SDK返回的是小写下划线格式，需要转换为阿里云的大写驼峰格式
-            # 注意：火山云SDK在没有数据时返回data=None，需要转换为空数组
-            raw_data = data.get('data') or []
+            fetched = 0
+            page = fetch_page(page_number, page_size)
+            while True:
+                status, total_count, items = page
+                fetched += len(items)
+                has_next = has_next_page(items, page_size, fetched, total_count)
+                if has_next and executor:
+                    future = metrics.copy_context_submit(executor, fetch_page, page_number + 1, page_size)
+                yield page
+                if not has_next:
+                    break
+                page_number += 1
+                if future:
+                    page = future.result()
+                    future = None
+                else:
+                    page = fetch_page(page_number, page_size)
+        finally:
+            if executor:
+                if future:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+    def _iter_address_book_pages(self, query, grouptype, prefetch=False):
+        """逐页查询地址组（生成器），每次产出 (status, total_count, 当前页地址组列表)"""
+        return self._iter_pages(
+            lambda page_number, page_size: self._describe_address_book_page(query, grouptype, page_number, page_size),
+            utils.get_config('describe_address_book.page_number', 1),
+            utils.get_config('describe_address_book.page_size', 500),
+            prefetch
+        )
+
+    def iter_address_books(self, query, grouptype, prefetch=False):
+        """遍历全部分页的地址组（生成器），按需逐页拉取，产出阿里云格式的地址组字典"""
+        for status, total_count, acls_data in self._iter_address_book_pages(query, grouptype, prefetch):
+            yield from acls_data
+
+    def describe_address_book(self, query, grouptype, fresh=False):
+        """查询地址组；fresh=True 时不使用查询缓存（封禁/解封规划写入前的查询，避免以其他进程写入前的缓存为基础覆盖其写入），结果仍写入缓存"""
+        # 优先使用进程内查询缓存（cache.ttl 秒内有效，写操作自动失效）
+        cache = get_read_cache()
+        cache_key = self._cache_key('address_book', query, grouptype)
+        if fresh:
+            return self._describe_address_book(query, grouptype, cache, cache_key, cache.generation())
+        res = cache.get(cache_key)
+        if res is not None:
+            return res
+        # 同一租户并发的相同查询合并为一次API调用（键包含缓存代数，写操作之后发起的查询不会复用写之前的结果）
+        generation = cache.generation()
+        return single_flight.do((cache_key, generation), lambda: self._describe_address_book(query, grouptype, cache, cache_key, generation))
+
+    def _describe_address_book(self, query, grouptype, cache, cache_key, generation):
+        """查询全部分页的地址组，成功后写入查询缓存"""
+        try:
+            status = None
             acls_data = []
-            for item in raw_data:
-                converted_item = {
-                    "GroupName": item.get('group_name', ''),
-                    "GroupUuid": item.get('group_uuid', ''),
-                    "Description": item.get('description', ''),
-                    "AddressList": item.get('address_list', []),
-                    "GroupType": item.get('group_type', ''),
-                    "RefCnt": item.get('ref_cnt', 0)
-                }
-                acls_data.append(converted_item)
-            
+            prefetch = utils.get_config('describe_address_book.prefetch', False)
+            for status, total_count, page_acls in self._iter_address_book_pages(query, grouptype, prefetch):
+                acls_data.extend(page_acls)
+            # 完全模拟阿里云的返回格式
             res = {
                 "statusCode": status,
                 "body": {
                     "Acls": acls_data
                 }
             }
+            cache.set(cache_key, res, generation)
             return res
         except Exception as e:
             logger.error(f'{e}')
             return str(e)
 
     def modify_address_book(self, groupname, groupuuid, description, addresslist):
-        client = self.create_client()
         # 处理addresslist格式
-        if isinstance(addresslist, str):
-            addresslist = [addr.strip() for addr in addresslist.split(',') if addr.strip()]
-        elif not isinstance(addresslist, list):
-            addresslist = []
+        addresslist = to_address_list(addresslist)
         
         request = volcenginesdkfwcenter.ModifyAddressBookRequest(
             group_name=groupname,
@@ -156,8 +1078,8 @@ class FwVolcengineApp:
             address_list=addresslist
         )
         try:
-            resp, status, headers = client.modify_address_book_with_http_info(request, _return_http_data_only=False)
-            logger.info(f'{resp}')
+            resp, status, headers = self._call_api('modify_address_book', request)
+            utils.log_payload('modify_address_book响应: ', resp)
             # 完全模拟阿里云的返回格式
             res = {
                 "statusCode": status
@@ -166,51 +1088,171 @@ class FwVolcengineApp:
         except Exception as e:
             logger.error(f'{e}')
             return str(e)
+        finally:
+            self._invalidate_cache('address_book')
 
-    def describe_control_policy(self, direction, description=None):
-        client = self.create_client()
+    def read_address_list(self, addrgrp):
+        """不经查询缓存回读地址组的最新地址列表，地址组不存在时返回 None"""
+        for acl in self.iter_address_books(addrgrp['GroupName'], addrgrp.get('GroupType')):
+            if acl['GroupUuid'] == addrgrp['GroupUuid']:
+                return acl.get('AddressList') or []
+        return None
+
+    def wait_address_list_visible(self, addrgrp, add_addrs=(), remove_addrs=(), timeout=None):
+        """写入地址组后回读校验，等待本次写入在查询结果中可见
+
+        查询接口存在同步延迟，写入后短时间内回读到的可能仍是写入前的内容，未可见时不能据此判定为并发写冲突：
+        按指数退避 + 随机抖动间隔继续回读（与 wait_address_books_ready 共用 add_address_book.ready_* 配置），
+        超时仍未可见才判定本次写入已被其他进程的并发写覆盖，此时的回读结果已同步，可作为重新合并的基础
+
+        Returns:
+            (状态, 最后一次回读的地址列表)，状态为 visible（已可见）/ conflict（超时仍未可见，已被并发写覆盖）/
+            deleted（地址组已不存在）/ unknown（回读失败，无法确认）
+        """
+        if timeout is None:
+            timeout = utils.get_config('add_address_book.ready_timeout', 30)
+        backoff_base = utils.get_config('add_address_book.ready_backoff_base', 0.5)
+        backoff_max = utils.get_config('add_address_book.ready_backoff_max', 5)
+        deadline = time.monotonic() + timeout
+        with tracing.span('wait_address_list_visible', {"fw.group_name": addrgrp['GroupName']}) as wait_span:
+            attempt = 0
+            while True:
+                try:
+                    current_addresslist = self.read_address_list(addrgrp)
+                    if current_addresslist is None:
+                        state = 'deleted'
+                    else:
+                        state = 'conflict' if lost_address_entries(current_addresslist, add_addrs, remove_addrs) else 'visible'
+                except Exception as e:
+                    logger.error(f'地址组回读校验失败: {e}')
+                    state, current_addresslist = 'unknown', None
+                remaining = deadline - time.monotonic()
+                if state in ('visible', 'deleted') or remaining <= 0:
+                    break
+                metrics.sleep(min(utils.backoff_delay(attempt, backoff_base, backoff_max), remaining), 'ready_wait')
+                attempt += 1
+            wait_span.set_attributes({"fw.state": state, "fw.attempts": attempt + 1})
+        return state, current_addresslist
+
+    def merge_modify_address_book(self, addrgrp, base_addresslist, add_addrs=(), remove_addrs=(), max_addresses=None):
+        """合并-写-回读校验：以 base_addresslist（规划时不经查询缓存读取的地址组内容）为基础增删地址后写入，写入后等待可见并校验
+
+        查询接口同步延迟不视为冲突：等待超时仍未可见才判定被其他进程的并发写覆盖（见 wait_address_list_visible），
+        以超时后回读到的内容为基础重新合并写入，按指数退避重试（modify_address_book.conflict_retries 次）；
+        回读失败无法确认时按写入成功返回（unverified 为 True），不会把已成功的写入报告为失败
+
+        Returns:
+            成功: {"statusCode": 200, "addresslist": 写入的地址列表, "conflicts": 冲突次数[, "unverified": True]}
+            失败: modify_address_book 的失败结果，或 {"statusCode": 409/413, "desc": ..., "conflicts": 冲突次数}
+        """
+        retries = utils.get_config('modify_address_book.conflict_retries', 3)
+        backoff_base = utils.get_config('modify_address_book.conflict_backoff_base', 0.2)
+        backoff_max = utils.get_config('modify_address_book.conflict_backoff_max', 2)
+        conflicts = 0
+        for attempt in range(retries + 1):
+            new_address_list = merge_address_list(base_addresslist, add_addrs, remove_addrs)
+            if max_addresses and len(new_address_list) > max_addresses:
+                logger.error(f'地址组容量不足: {addrgrp["GroupName"]}, len={len(new_address_list)}')
+                return {"statusCode": 413, "desc": "地址组容量不足", "conflicts": conflicts}
+            res = self.modify_address_book(
+                groupname=addrgrp['GroupName'],
+                groupuuid=addrgrp['GroupUuid'],
+                description=addrgrp['Description'],
+                addresslist=new_address_list
+            )
+            if not isinstance(res, dict) or res.get('statusCode') != 200:
+                return res
+
+            state, current_addresslist = self.wait_address_list_visible(addrgrp, add_addrs, remove_addrs)
+            if state == 'unknown':
+                logger.warning(f'地址组写入后回读失败，无法确认，按写入成功处理: {addrgrp["GroupName"]}')
+                return {"statusCode": 200, "addresslist": new_address_list, "conflicts": conflicts, "unverified": True}
+            if state == 'deleted':
+                logger.error(f'地址组回读校验时已不存在: {addrgrp["GroupName"]}')
+                return {"statusCode": 409, "desc": "地址组已被删除", "conflicts": conflicts}
+            metrics.record_group_write(state == 'conflict')
+            if state == 'visible':
+                return {"statusCode": 200, "addresslist": current_addresslist, "conflicts": conflicts}
+
+            conflicts += 1
+            logger.warning(f'地址组并发写冲突: {addrgrp["GroupName"]}, '
+                           f'丢失地址: {lost_address_entries(current_addresslist, add_addrs, remove_addrs)}, 第{conflicts}次')
+            # 等待超时后的回读结果已同步，以其为基础重新合并
+            base_addresslist = current_addresslist
+            if attempt < retries:
+                metrics.sleep(utils.backoff_delay(attempt, backoff_base, backoff_max), 'conflict_backoff')
+        return {"statusCode": 409, "desc": "地址组并发写冲突", "conflicts": conflicts}
+
+    def _describe_control_policy_page(self, direction, description, page_number, page_size):
+        """查询单页控制策略，返回 (status, total_count, 阿里云格式的策略列表)"""
         # 构建请求参数
         request_params = {
             'direction': direction,
-            'page_size': utils.get_config('describe_control_policy.page_size', 100)
+            'page_number': page_number,
+            'page_size': page_size
         }
         # 如果提供了description，添加到请求参数中进行过滤
         if description:
             request_params['description'] = description
-            
+
         request = volcenginesdkfwcenter.DescribeControlPolicyRequest(**request_params)
+        resp, status, headers = self._call_api('describe_control_policy', request)
+        data = resp.to_dict()
+        utils.log_payload('describe_control_policy响应: ', data)
+        # 火山云SDK返回的是小写下划线格式，需要转换为阿里云的大写驼峰格式
+        # 注意：火山云SDK在没有数据时返回data=None，需要转换为空数组
+        policys_data = [convert_control_policy(item) for item in data.get('data') or []]
+        return status, data.get('total_count'), policys_data
+
+    def _iter_control_policy_pages(self, direction, description=None, prefetch=False):
+        """逐页查询控制策略（生成器），每次产出 (status, total_count, 当前页策略列表)"""
+        return self._iter_pages(
+            lambda page_number, page_size: self._describe_control_policy_page(direction, description, page_number, page_size),
+            1,
+            utils.get_config('describe_control_policy.page_size', 100),
+            prefetch
+        )
+
+    def load_control_policy_index(self, direction):
+        """分页查询该方向的全部控制策略（可命中查询缓存），构建 描述/源/目的地址组UUID -> 策略ID 的索引
+
+        Returns:
+            ControlPolicyIndex；查询失败时返回 None
+        """
+        res_describe_control_policy = self.describe_control_policy(direction)
+        if not isinstance(res_describe_control_policy, dict) or res_describe_control_policy.get('statusCode') != 200:
+            logger.error(f'加载控制策略索引失败: {res_describe_control_policy}')
+            return None
+        return ControlPolicyIndex(direction, res_describe_control_policy['body']['Policys'])
+
+    def describe_control_policy(self, direction, description=None):
+        # 优先使用进程内查询缓存（cache.ttl 秒内有效，写操作自动失效）
+        cache = get_read_cache()
+        cache_key = self._cache_key('control_policy', direction, description)
+        res = cache.get(cache_key)
+        if res is not None:
+            return res
+        # 同一租户并发的相同查询合并为一次API调用（键包含缓存代数，写操作之后发起的查询不会复用写之前的结果）
+        generation = cache.generation()
+        return single_flight.do((cache_key, generation), lambda: self._describe_control_policy(direction, description, cache, cache_key, generation))
+
+    def _describe_control_policy(self, direction, description, cache, cache_key, generation):
+        """查询全部分页的控制策略，成功后写入查询缓存"""
         try:
-            resp, status, headers = client.describe_control_policy_with_http_info(request, _return_http_data_only=False)
-            data = resp.to_dict()
-            logger.info(f'{data}')
-            # 完全模拟阿里云的返回格式
-            # 火山云SDK返回的是小写下划线格式，需要转换为阿里云的大写驼峰格式
-            # 注意：火山云SDK在没有数据时返回data=None，需要转换为空数组
-            raw_data = data.get('data') or []
+            status = None
+            total_count = None
             policys_data = []
-            for item in raw_data:
-                converted_item = {
-                    "AclUuid": item.get('rule_id', ''),
-                    "Action": item.get('action', ''),
-                    "Description": item.get('description', ''),
-                    "Destination": item.get('destination', ''),
-                    "DestinationType": item.get('destination_type', ''),
-                    "Direction": item.get('direction', ''),
-                    "Proto": item.get('proto', ''),
-                    "Source": item.get('source', ''),
-                    "SourceType": item.get('source_type', ''),
-                    "Status": item.get('status', True),
-                    "Prio": item.get('prio', 0)
-                }
-                policys_data.append(converted_item)
-            
+            for status, total_count, page_policys in self._iter_control_policy_pages(direction, description):
+                policys_data.extend(page_policys)
+            # 完全模拟阿里云的返回格式
             res = {
                 "statusCode": status,
                 "body": {
-                    "TotalCount": len(policys_data),
+                    "TotalCount": total_count if total_count is not None else len(policys_data),
                     "Policys": policys_data
                 }
             }
+            cache.set(cache_key, res, generation)
             return res
         except Exception as e:
             logger.error(f'{e}')
@@ -218,10 +1260,9 @@ class FwVolcengineApp:
 
     def add_control_policy(self, aclaction, description, destination, destinationtype, direction, proto, source,
                           sourcetype, neworder, applicationname=None, applicationnamelist=None, domainresolvetype=None):
-        client = self.create_client()
         
         # 调试：打印控制策略参数
-        logger.info(f"创建控制策略参数: source={source}, sourcetype={sourcetype}, destination={destination}, destinationtype={destinationtype}")
+        logger.debug("创建控制策略参数: source={}, sourcetype={}, destination={}, destinationtype={}", source, sourcetype, destination, destinationtype)
         
         request = volcenginesdkfwcenter.AddControlPolicyRequest(
             prio=int(neworder),
@@ -238,9 +1279,9 @@ class FwVolcengineApp:
             status=utils.get_config('add_control_policy.status', True)
         )
         try:
-            resp, status, headers = client.add_control_policy_with_http_info(request, _return_http_data_only=False)
+            resp, status, headers = self._call_api('add_control_policy', request, idempotent=False)
             data = resp.to_dict()
-            logger.info(f"{data}")
+            utils.log_payload('add_control_policy响应: ', data)
             # 转换为阿里云兼容格式 - 业务逻辑层面
             if status == 200:
                 msg = {
@@ -256,16 +1297,17 @@ class FwVolcengineApp:
         except Exception as e:
             logger.error(f'{e}')
             return str(e)
+        finally:
+            self._invalidate_cache('control_policy', direction)
 
     def delete_control_policy(self, acluuid, direction):
-        client = self.create_client()
         request = volcenginesdkfwcenter.DeleteControlPolicyRequest(
             rule_id=acluuid,
             direction=direction
         )
         try:
-            resp, status, headers = client.delete_control_policy_with_http_info(request, _return_http_data_only=False)
-            logger.info(f'{resp}')
+            resp, status, headers = self._call_api('delete_control_policy', request)
+            utils.log_payload('delete_control_policy响应: ', resp)
             # 完全模拟阿里云的返回格式
             res = {
                 "statusCode": status
@@ -274,592 +1316,393 @@ class FwVolcengineApp:
         except Exception as e:
             logger.error(f'{e}')
             return str(e)
+        finally:
+            self._invalidate_cache('control_policy', direction)
+
+
+    def _add_block_control_policy(self, direction, grouptype, groupuuid, description):
+        """为封禁地址组创建同名控制策略"""
+        params = block_control_policy_params(direction, grouptype, groupuuid, description)
+        if params is None:
+            return None
+        return self.add_control_policy(**params)
+
+    def _block_fill_group(self, addrgrp, existing_addresslist, list_addrgrp_addresslist):
+        """将待封禁的地址写入现有地址组，返回结果消息（desc 为 封禁成功/封禁失败）"""
+        # 合并-写-回读校验，防止与其他进程并发修改同一地址组时丢失更新
+        res_modify_address_book = self.merge_modify_address_book(
+            addrgrp,
+            existing_addresslist,
+            add_addrs=list_addrgrp_addresslist,
+            max_addresses=utils.get_config('modify_address_book.max_addresses_per_group')
+        )
+        return block_fill_msg(addrgrp, list_addrgrp_addresslist, res_modify_address_book)
+
+    def _block_create_group(self, query_prefix, grouptype, list_addrgrp_addresslist):
+        """以最终地址列表创建新的封禁地址组（不等待可见），失败返回 None"""
+        random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
+        # 创建地址资源组
+        res_add_address_book = self.add_address_book(
+            groupname=f"{query_prefix}-{random_string}",
+            grouptype=grouptype,
+            description=f"{query_prefix}-{random_string}",
+            addresslist=list_addrgrp_addresslist,
+            verify=False
+        )
+        if isinstance(res_add_address_book, dict) and res_add_address_book.get('desc') == "创建成功":
+            return res_add_address_book
+        # 如果创建地址资源组失败，记录错误信息
+        logger.error(f"创建地址资源组失败: {res_add_address_book}")
+        msg = {
+            "groupname": f"{query_prefix}-{random_string}",
+            "desc": "创建地址资源组失败"
+        }
+        utils.log_payload('', msg)
+        return None
+
+    def _block_create_group_policy(self, direction, grouptype, res_add_address_book, list_addrgrp_addresslist, ready=True):
+        """为新建的封禁地址组创建同名控制策略，失败时删除该地址组，返回结果消息（desc 为 封禁成功/创建失败）"""
+        # 调试：打印地址组信息
+        utils.log_payload('准备创建控制策略，地址组信息: ', res_add_address_book)
+        if not ready:
+            logger.warning(f"地址组尚未可见，仍尝试创建控制策略: {res_add_address_book['groupname']}")
+
+        res_add_control_policy = self._add_block_control_policy(
+            direction=direction,
+            grouptype=grouptype,
+            groupuuid=res_add_address_book['groupuuid'],
+            description=res_add_address_book['description']
+        )
+        # 如果创建控制策略组失败，则删除地址资源组
+        if not (isinstance(res_add_control_policy, dict) and res_add_control_policy.get('desc') == "创建成功"):
+            self.delete_address_book(
+                groupuuid=res_add_address_book['groupuuid']
+            )
+        return block_policy_msg(res_add_address_book, list_addrgrp_addresslist, res_add_control_policy)
+
+    def _unblock_group(self, direction, addrgrp, matched_addrs, new_address_list, remove_addrs, add_addrs,
+                       policy_index=None):
+        """从地址组中移除匹配的IP，地址组为空时删除地址组及引用该地址组的控制策略（通过 policy_index 查找）
 
+        Returns:
+            每个匹配IP的结果消息列表（desc 为 解封成功/解封失败）
+        """
+        addrgrp_groupname = addrgrp['GroupName']
+        addrgrp_groupuuid = addrgrp['GroupUuid']
+        base_addresslist = addrgrp['AddressList']
+        if len(new_address_list) == 0:
+            # 按快照地址组将被清空：删除前回读最新内容，期间若有其他进程写入了新地址，则改为修改地址组
+            try:
+                current_addresslist = self.read_address_list(addrgrp)
+            except Exception as e:
+                logger.error(f'地址组回读失败: {e}')
+                current_addresslist = None
+            if current_addresslist:
+                base_addresslist = current_addresslist
+                new_address_list = merge_address_list(current_addresslist, add_addrs, remove_addrs)
+        if len(new_address_list) == 0:
+            # 地址组为空，删除地址组和相关策略
+            # 先删除引用该地址组UUID的控制策略（封禁策略以地址组UUID作为源/目的地址）
+            if policy_index is None:
+                logger.error(f"控制策略索引不可用，跳过删除地址组的控制策略: {addrgrp_groupname}")
+            else:
+                for policy_id in policy_index.group_rules(addrgrp_groupuuid):
+                    res_delete_policy = self.delete_control_policy(policy_id, direction)
+                    if isinstance(res_delete_policy, dict) and res_delete_policy.get('statusCode') == 200:
+                        policy_index.remove(policy_id)
+                        logger.info(f"成功删除控制策略: {policy_id}")
+                    else:
+                        logger.error(f"删除控制策略失败: {policy_id}")
+            
+            # 删除地址组
+            res = self.delete_address_book(addrgrp_groupuuid)
+            success_msg = {
+                "groupname": addrgrp_groupname,
+                "groupuuid": addrgrp_groupuuid,
+                "desc": "解封成功"
+            }
+        else:
+            # 修改地址组，移除匹配的IP（读-合并-写）
+            # 拆分地址段时追加的剩余部分可能超出地址组容量
+            max_addresses = utils.get_config('modify_address_book.max_addresses_per_group') if add_addrs else None
+            res = self.merge_modify_address_book(addrgrp, base_addresslist, add_addrs, remove_addrs, max_addresses)
+            success_msg = {
+                "groupname": addrgrp_groupname,
+                "groupuuid": addrgrp_groupuuid,
+                "grouplen": len(res['addresslist']) if isinstance(res, dict) and 'addresslist' in res else len(new_address_list),
+                "desc": "解封成功"
+            }
+        return unblock_group_msgs(res, matched_addrs, success_msg)
 
     def auto_block_task(self, addr, direction=None):
         
         # 验证direction参数
         if direction not in ['in', 'out']:
-            msg = {
-                "addr": f"{addr}",
-                "desc": "direction参数必须为'in'或'out'"
-            }
-            logger.error(f'{msg}')
-            return msg
+            return invalid_direction_result(addr)
         
         # 验证SOAR入参IP（单个IP） or 手动入参IPS（多个IP）
-        addrs = utils.parse_ip_list(addr)
+        return self._block_addrs(*utils.classify_ip_list(addr), direction)
+
+    def auto_block_stream(self, source, direction=None, chunk_size=None):
+        """流式封禁：从本地文件或迭代器中按块读取地址（见 utils.iter_address_source），逐块执行封禁并产出每块的结果
+
+        每块的结果格式与 auto_block_task 相同，body 中增加 chunk（从 0 开始的块序号）；内存占用只与块大小有关
+        """
+        if direction not in ['in', 'out']:
+            yield invalid_direction_result(source)
+            return
+        chunk_size = chunk_size or utils.get_config('stream.chunk_size', 1000)
+        for chunk_index, (addrs, buckets) in enumerate(utils.iter_address_chunks(source, chunk_size)):
+            res = self._block_addrs(addrs, buckets, direction)
+            res['body']['chunk'] = chunk_index
+            yield res
+
+    def _block_addrs(self, addrs, buckets, direction):
+        """封禁标准化后的地址列表（buckets 为解析时的分类结果，见 utils.classify_ip_list），返回统一格式的封禁结果"""
         if not addrs:
-            return {
-                "statusCode": 400,
-                "error": "没有有效的IP地址",
-                "body": {
-                    "total_ips": 0,
-                    "success_count": 0,
-                    "failed_count": 0,
-                    "existed_count": 0,
-                    "results": []
-                }
-            }
-        
-        """ 初始化处理状态变量定义及初始化 """
-        # 其中任何一个需要封禁的ip同一时间值可以位于4个列表 list_remain_addrs list_success_addrs list_failed_addrs list_existed_addrs 中的一个
-        # list_remain_addrs 为消费前的任务ip地址列表，list_remain_addrs list_success_addrs list_failed_addrs list_existed_addrs 则是经过处理后ip应该处于的结果列表
-        # list_success_addrs 为封禁成功的ip地址字典的列表
-        # list_failed_addrs 为封禁失败的ip地址字典的列表
-        # list_existed_addrs 为已存在于现有封禁策略中的ip地址字典的列表
-        list_success_addrs = []
-        list_failed_addrs = []
-        list_existed_addrs = []
-        list_remain_addrs = list(addrs)
+            return block_task_result(addrs, [], [], [])
 
-        # 连续处理失败次数计数器（防止while由于某些原因导致死循环）
-        consecutive_failures = 0
+        # 写合并：同一租户同一方向的封禁/解封请求按到达顺序串行执行，排队期间到达的封禁请求合并为一次执行
+        batcher = get_write_batcher()
+        if batcher is None:
+            list_success_addrs, list_failed_addrs, list_existed_addrs, task_metrics = self._run_block_task(buckets, direction)
+        else:
+            list_success_addrs, list_failed_addrs, list_existed_addrs, task_metrics = batcher.submit(
+                self._batch_key(direction, 'block'),
+                self._batch_key(direction),
+                utils.classified_items(buckets),
+                lambda batch_items: self._run_block_task(utils.group_classified(batch_items), direction)
+            )
+        # 结果消息中的地址段（归并、合并执行）映射回本次调用输入的地址
+        list_success_addrs, list_failed_addrs, list_existed_addrs = [
+            filter_task_msgs(msgs, addrs) for msgs in (list_success_addrs, list_failed_addrs, list_existed_addrs)
+        ]
+        # 组装统一的返回结果格式，retries / metrics 为本次任务（合并执行时为整个批次）的重试次数与指标
+        res = block_task_result(addrs, list_success_addrs, list_failed_addrs, list_existed_addrs)
+        return task_metrics_result(res, task_metrics)
 
-        # 设置查询前缀和配置
-        query_prefix = f"{utils.get_config('add_address_book.group_name_prefix', '')}-{direction.title()}"
-        max_addresses_per_group = utils.get_config('modify_address_book.max_addresses_per_group')
-        
-        # 主处理循环
-        # list_remain_addrs 列表为待处理地址列表，会在执行过程中被消费指导列表为空，退出while循环
-        # 一共 3个独立的 步骤：
-        # 步骤1：判断需要封禁的地址资源是否已存在于现有封禁策略中
-        # 步骤2：遍历现有指定名称前缀的所有地址簿，检查是否存地址簿有空位可用
-        # 步骤3：如果还有剩余的待封禁的IP，则创建新的地址簿 和 同名称的控制策略组
-
-        while list_remain_addrs:
-            len_list_remain_addrs = len(list_remain_addrs)
-            msg = {
-                "addr": f"{list_remain_addrs}",
-                "desc": f"len({len_list_remain_addrs})"
-            }
-            logger.info(f'{msg}')
-            # 按地址类型分组处理
-            # 将ip类型和domain类型进行分组，分别存储到addrs_groups列表中
-            addrs_groups = {
-                "ip" : [],
-                "domain": []
-            }
-            # 遍历list_remain_addrs列表，将ip类型和domain类型进行分组，分别存储到addrs_groups列表中
-            for remain_addr in list_remain_addrs[:]:
-                try:
-                    # 如果ip地址是ipv4地址，则将ip类型存储到addrs_groups列表中
-                    ipaddress.IPv4Address(remain_addr.split('/')[0])
-                    describe_address_book_grouptype = "ip"
-                except ipaddress.AddressValueError:
-                    try:
-                        # 如果ip地址是ipv6地址，则将ip类型存储到addrs_groups列表中
-                        ipaddress.IPv6Address(remain_addr.split('/')[0])
-                        # IPV6 无需封禁
-                        list_existed_addrs.append({
-                            "addr": f"{remain_addr}",
-                            "desc": "无需封禁"
-                        })
-                        if remain_addr in list_remain_addrs:
-                            list_remain_addrs.remove(remain_addr)
-                        continue
-                    except ipaddress.AddressValueError:
-                        # 如果ip地址是domain地址，则将domain类型存储到addrs_groups列表中
-                        describe_address_book_grouptype = "domain"
-                addrs_groups[describe_address_book_grouptype].append(remain_addr)
-            
+    def _run_block_task(self, buckets, direction):
+        """执行封禁任务
 
-            ########################################################
-            #                       步骤1                           #
-            ########################################################
-            # 对addrs_groups列表中每一个的ip进行判断
-            # 如果存在则加入到  list_existed_addrs 列表，同时移除list_remain_addrs列表中对应的地址（消费掉），保证下一次循环中不再处理该地址
-            for describe_address_book_grouptype, list_addrs_groups in addrs_groups.items():
-                if not list_addrs_groups:
-                    continue
-                # 获取该类型的现有地址组
-                res_describe_address_book = self.describe_address_book(
-                    query=query_prefix,
-                    grouptype=describe_address_book_grouptype
-                )
-                
-                # 检查API调用是否成功
-                if (isinstance(res_describe_address_book, str) or 
-                    res_describe_address_book is None or 
-                    res_describe_address_book.get('statusCode') != 200 or
-                    res_describe_address_book.get('body') is None or
-                    res_describe_address_book.get('body', {}).get('Acls') is None):
-                    logger.error(f"查询地址组失败: {res_describe_address_book}")
-                    continue
-                
-                # 检查已存在的IP
-                for addr in list_addrs_groups[:]:
-                    found = False
-                    for list_res_describe_address_book in res_describe_address_book['body']['Acls']:
-                        if query_prefix in list_res_describe_address_book['GroupName']:
-                            if addr in list_res_describe_address_book['AddressList']:
-                                found = True
-                                msg = {
-                                    "addr": f"{addr}",
-                                    "groupname": list_res_describe_address_book['GroupName'],
-                                    "desc": "无需封禁"
-                                }
-                                list_existed_addrs.append(msg)
-                                logger.info(f'{msg}')
-                                break
-                    if found == True:
-                        if addr in list_addrs_groups:
-                            list_addrs_groups.remove(addr)
-                        if addr in list_remain_addrs:
-                            list_remain_addrs.remove(addr)
-                
-
-                ########################################################
-                #                       步骤2                           #
-                ########################################################
-                # 遍历现有指定名称前缀的所有地址簿，检查是否存地址簿有空位可用
-                # 针对每一个可用的地址簿，计算空位数量，假设为N个
-                # 1. 如果空位数N大于当前需要封禁的IP数量M，则一次请求，将M个待封禁的IP添加到该地址簿，此时消费完成全部待封禁的IP
-                # 2. 如果空位数N小于等于当前需要封禁的IP数量M，则一次请求，将N个待封禁的IP添加到该地址簿，此时还剩余M-N个待封禁的IP
-                # 不停遍历每一个地址簿，直到 全部的地址簿空位被填满（N<M） 或 消费完成全部待封禁的IP（N>=M）
-                addrgrps = [data_describe_address_book for data_describe_address_book in
-                            res_describe_address_book['body']['Acls']
-                            if query_prefix in data_describe_address_book['GroupName']]
-                for addrgrp in addrgrps:
-                    if not list_addrs_groups:
-                        break
-                    addrgrp_groupname = addrgrp['GroupName']
-                    addrgrp_groupuuid = addrgrp['GroupUuid']
-                    addrgrp_description = addrgrp['Description']
-                    len_addrgrp = len(addrgrp['AddressList'])
-                    # 如果当前地址组内的地址数量小于地址组最大容量（这个地址簿还没有满）
-                    if len_addrgrp < max_addresses_per_group:
-                        # 查询当前地址组同名的控制策略组
-                        res_describe_control_policy = self.describe_control_policy(
-                            direction=direction,
-                            description=addrgrp_groupname
+        Returns:
+            (list_success_addrs, list_failed_addrs, list_existed_addrs, 任务指标 metrics.TaskMetrics)
+        """
+        address_count = sum(len(list_addrs) for list_addrs in buckets.values())
+        with metrics.task_scope('block') as task_metrics, \
+                tracing.span('block_task', {"fw.direction": direction, "fw.address_count": address_count}) as task_span:
+            list_success_addrs, list_failed_addrs, list_existed_addrs = self._block_task_loop(buckets, direction, task_metrics)
+            task_span.set_attributes({"fw.success_count": len(list_success_addrs), "fw.failed_count": len(list_failed_addrs),
+                                      "fw.existed_count": len(list_existed_addrs), "fw.iterations": task_metrics.iterations,
+                                      "fw.retries": task_metrics.retries})
+        return list_success_addrs, list_failed_addrs, list_existed_addrs, task_metrics
+
+    def _block_task_loop(self, buckets, direction, task_metrics):
+        """封禁任务主循环（规划与结果见 BlockTask），返回 (list_success_addrs, list_failed_addrs, list_existed_addrs)"""
+        task = BlockTask(buckets, direction)
+
+        while task.remain_count():
+            task_metrics.record_iteration()
+            with tracing.span('block.iteration', {"fw.iteration": task_metrics.iterations, "fw.remain_count": task.remain_count()}) as iteration_span:
+                for describe_address_book_grouptype, list_addrs_groups in task.start_iteration():
+                    # 步骤1：判断需要封禁的地址资源是否已存在于现有封禁策略中
+                    with tracing.span('block.step1.lookup', {"fw.group_type": describe_address_book_grouptype, "fw.address_count": len(list_addrs_groups)}) as step_span:
+                        # 获取该类型的现有地址组（不使用查询缓存，地址组写入以此为基础合并）
+                        res_describe_address_book = self.describe_address_book(
+                            query=task.query_prefix,
+                            grouptype=describe_address_book_grouptype,
+                            fresh=True
                         )
-                        # 如果当前地址组同名的控制策略组不存在，则跳过当前地址组
-                        if isinstance(res_describe_control_policy, str) or res_describe_control_policy['body']['TotalCount'] == 0:
+                        snapshot = task.build_snapshot(res_describe_address_book)
+                        if snapshot is None:
+                            step_span.set_status(tracing.STATUS_ERROR, '查询地址组失败')
                             continue
-                        # 如果待消费的ip数量这个地址簿剩余容量（ip数量多到这个地址簿放不下），填完坑还有ip剩余
-                        if len(list_addrs_groups[:]) > max_addresses_per_group - len_addrgrp:
-                            list_addrgrp_addresslist = list_addrs_groups[:max_addresses_per_group - len_addrgrp]
-                            data_addrgrp_addresslist = addrgrp['AddressList'] + list_addrs_groups[:max_addresses_per_group - len_addrgrp]
-                        # 如果待消费的ip数量小于等于这个地址簿剩余容量（这个地址簿可以一次性消费掉全部ip），填完坑没有ip剩余
-                        else:
-                            list_addrgrp_addresslist = list_addrs_groups[:]
-                            data_addrgrp_addresslist = addrgrp['AddressList'] + list_addrs_groups[:]
+                        list_addrs_groups, existed_count = task.check_existed(describe_address_book_grouptype, snapshot, list_addrs_groups)
+                        step_span.set_attribute("fw.existed_count", existed_count)
+
+                    # 步骤2：装箱规划，填满现有且已有封禁策略的地址簿空位（控制策略索引每个任务只加载一次）
+                    # 并发模式下（concurrency.max_workers > 1），地址簿修改并发执行
+                    with tracing.span('block.step2.fill', {"fw.group_type": describe_address_book_grouptype, "fw.address_count": len(list_addrs_groups)}) as step_span:
+                        if task.needs_policy_index(snapshot, list_addrs_groups):
+                            task.policy_index = self.load_control_policy_index(direction)
+                        fills, new_groups = task.plan(snapshot, list_addrs_groups)
                         # 将需要封禁的地址资源更新至地址资源组
-                        res_modify_address_book = self.modify_address_book(
-                            groupname=addrgrp_groupname,
-                            groupuuid=addrgrp_groupuuid,
-                            description=addrgrp_description,
-                            addresslist=data_addrgrp_addresslist
+                        list_fill_msgs = run_concurrently(
+                            lambda fill: self._block_fill_group(fill[0], snapshot.address_list(fill[0]['GroupUuid']), fill[1]),
+                            fills,
+                            task.max_workers
                         )
-                        # 如果更新地址资源组成功，则将成功信息加入到list_success_addrs列表
-                        if isinstance(res_modify_address_book, dict) and res_modify_address_book.get('statusCode') == 200:
-                            msg = {
-                                "addr": f"{','.join(list_addrgrp_addresslist)}",
-                                "groupname": f"{addrgrp_groupname}",
-                                "groupuuid": f"{addrgrp_groupuuid}",
-                                "grouplen": len(data_addrgrp_addresslist),
-                                "desc": "封禁成功"
-                            }
-                            logger.info(f'{msg}')
-                            list_success_addrs.append(msg)
-                        # 如果更新地址资源组失败，则将失败信息加入到list_failed_addrs列表
-                        else:
-                            msg = {
-                                "addr": f"{','.join(list_addrgrp_addresslist)}",
-                                "groupname": f"{addrgrp_groupname}",
-                                "groupuuid": f"{addrgrp_groupuuid}",
-                                "desc": "封禁失败"
-                            }
-                            logger.info(f'{msg}')
-                            list_failed_addrs.append(msg)
-                        # 将已消费的地址资源从list_addrs_groups列表中移除
-                        list_addrs_groups = [x for x in list_addrs_groups if x not in list_addrgrp_addresslist]
-                        # 将已消费的地址资源从list_remain_addrs列表中移除
-                        list_remain_addrs = [x for x in list_remain_addrs if x not in list_addrgrp_addresslist]
-
-
-
-                ########################################################
-                #                       步骤3                           #
-                ########################################################
-                # 如果还有剩余的待封禁的IP，则创建新的地址簿 和 同名称的控制策略组
-                # 仅创建新的地址簿 和 同名称的控制策略组，本轮循环内不再处理剩余的待封禁的IP
-                # 消费剩余的待封禁的IP 不是在这里处理的，而是交给下一次 while 循环的"步骤2"天填坑来处理的
-                if list_addrs_groups:
-                    random_string = ''.join(random.choices(string.ascii_letters + string.digits, k=6))
-                    # 创建地址资源组
-                    res_add_address_book = self.add_address_book(
-                        groupname=f"{query_prefix}-{random_string}",
-                        grouptype=describe_address_book_grouptype,
-                        description=f"{query_prefix}-{random_string}",
-                        addresslist=utils.get_config('add_address_book.addresslist', '1.1.1.1/32')
-                    )
-                    # 如果创建地址资源组成功，则创建同名的控制策略组
-                    if isinstance(res_add_address_book, dict) and res_add_address_book.get('desc') == "创建成功":
+                        task.record_fills(describe_address_book_grouptype, snapshot, fills, list_fill_msgs)
+                        step_span.set_attributes({"fw.fill_group_count": len(fills), "fw.new_group_count": len(new_groups),
+                                                  "fw.fill_address_count": sum(len(fill[1]) for fill in fills)})
+
+                    # 步骤3：按规划创建新的地址簿和同名控制策略
+                    # 先创建全部地址簿，再统一等待其可见，等待时间相互重叠而不是逐个累加
+                    with tracing.span('block.step3.create', {"fw.group_type": describe_address_book_grouptype, "fw.new_group_count": len(new_groups)}) as step_span:
+                        list_res_add_address_book = run_concurrently(
+                            lambda list_addrgrp_addresslist: self._block_create_group(task.query_prefix, describe_address_book_grouptype, list_addrgrp_addresslist),
+                            new_groups,
+                            task.max_workers
+                        )
+                        list_created_groups = [(res_add_address_book, list_addrgrp_addresslist)
+                                               for res_add_address_book, list_addrgrp_addresslist in zip(list_res_add_address_book, new_groups)
+                                               if res_add_address_book]
+
                         # 等待地址组创建完成，火山云API需要时间同步
-                        import time
-                        time.sleep(5)  # 增加延迟时间
-                        
-                        # 调试：打印地址组信息
-                        logger.info(f"准备创建控制策略，地址组信息: {res_add_address_book}")
-                        
-                        # 验证地址组是否真的创建成功
-                        verify_result = self.describe_address_book(query=res_add_address_book['groupname'], grouptype=describe_address_book_grouptype)
-                        logger.info(f"验证地址组是否存在: {verify_result}")
-                        
-                        if direction == 'in':
-                            res_add_control_policy = self.add_control_policy(
-                                aclaction=utils.get_config('add_control_policy.action', 'deny'),
-                                description=res_add_address_book['description'],
-                                destination=utils.get_config('add_control_policy.destination_any', '0.0.0.0/0'),
-                                destinationtype='net',
-                                direction=direction,
-                                proto=utils.get_config('add_control_policy.proto', 'ANY'),
-                                source=res_add_address_book['groupuuid'],  # 修改：使用UUID而不是名称
-                                sourcetype='group',
-                                neworder=utils.get_config('add_control_policy.prio', 2)
+                        set_ready_groupuuids = set()
+                        if list_created_groups:
+                            set_ready_groupuuids = self.wait_address_books_ready(
+                                query=task.query_prefix,
+                                grouptype=describe_address_book_grouptype,
+                                groupuuids=[res_add_address_book['groupuuid'] for res_add_address_book, _ in list_created_groups]
                             )
-                        elif direction == 'out':
-                            if describe_address_book_grouptype == 'ip':
-                                res_add_control_policy = self.add_control_policy(
-                                    aclaction=utils.get_config('add_control_policy.action', 'deny'),
-                                    description=res_add_address_book['description'],
-                                    destination=res_add_address_book['groupuuid'],  # 修改：使用UUID而不是名称
-                                    destinationtype='group',
-                                    direction=direction,
-                                    proto=utils.get_config('add_control_policy.proto', 'ANY'),
-                                    source=utils.get_config('add_control_policy.source_any', '0.0.0.0/0'),
-                                    sourcetype='net',
-                                    neworder=utils.get_config('add_control_policy.prio', 2)
-                                )
-                            elif describe_address_book_grouptype == 'domain':
-                                res_add_control_policy = self.add_control_policy(
-                                    aclaction=utils.get_config('add_control_policy.action', 'deny'),
-                                    description=res_add_address_book['description'],
-                                    destination=res_add_address_book['groupuuid'],  # 修改：使用UUID而不是名称
-                                    destinationtype='group',
-                                    direction=direction,
-                                    proto=utils.get_config('add_control_policy.proto', 'TCP'),
-                                    source=utils.get_config('add_control_policy.source_any', '0.0.0.0/0'),
-                                    sourcetype='net',
-                                    neworder=utils.get_config('add_control_policy.prio', 2)
-                                )
-                        # 如果创建控制策略组成功，则将成功信息加入到list_success_addrs列表
-                        if isinstance(res_add_control_policy, dict) and res_add_control_policy.get('desc') == "创建成功":
-                            msg = {
-                                "groupname": res_add_address_book['groupname'],
-                                "groupuuid": res_add_address_book['groupuuid'],
-                                "description": res_add_address_book['description'],
-                                "acluuid": res_add_control_policy['acluuid'],
-                                "desc": "创建成功"
-                            }
-                            logger.info(f'{msg}')
-                        # 如果创建控制策略组失败，则删除地址资源组
-                        else:
-                            self.delete_address_book(
-                                groupuuid=res_add_address_book['groupuuid']
-                            )
-                            msg = {
-                                "groupname": res_add_address_book['groupname'],
-                                "groupuuid": res_add_address_book['groupuuid'],
-                                "description": res_add_address_book['description'],
-                                "acluuid": res_add_control_policy.get('acluuid', '') if isinstance(res_add_control_policy, dict) else '',
-                                "desc": "创建失败"
-                            }
-                            logger.info(f'{msg}')
-                    # 如果创建地址资源组失败，记录错误信息
-                    else:
-                        logger.error(f"创建地址资源组失败: {res_add_address_book}")
-                        msg = {
-                            "groupname": f"{query_prefix}-{random_string}",
-                            "desc": "创建地址资源组失败"
-                        }
-                        logger.info(f'{msg}')
-            # while主循环保护机制
-            # 如果2次循环后，list_remain_addrs列表中的地址数量没有变化，则认为封禁失败加入list_failed_addrs，并退出循环
-            if len(list_remain_addrs) == len_list_remain_addrs:
-                consecutive_failures += 1
-                # 如果连续处理失败次数大于等于2，则认为封禁失败加入list_failed_addrs，并退出循环
-                if consecutive_failures >= 2:
-                    msg = {
-                        "addr": f"{list_remain_addrs}",
-                        "desc": "封禁失败"
-                    }
-                    logger.info(f"{msg}")
-                    list_failed_addrs.append(msg)
-                    break
-            else:
-                # 如果本轮循环处理了IP，则将连续处理失败次数归零
-                consecutive_failures = 0
-        # 组装统一的返回结果格式
-        all_results = list_success_addrs + list_failed_addrs + list_existed_addrs
-        
-        if list_success_addrs:
-            return {
-                "statusCode": 200,
-                "message": f"成功将 {len(list_success_addrs)} 个IP添加到火山云防火墙封禁列表",
-                "body": {
-                    "total_ips": len(addrs),
-                    "success_count": len(list_success_addrs),
-                    "failed_count": len(list_failed_addrs),
-                    "existed_count": len(list_existed_addrs),
-                    "results": all_results
-                }
-            }
-        else:
-            return {
-                "statusCode": 400,
-                "error": "所有IP都无法添加到火山云防火墙封禁列表",
-                "body": {
-                    "total_ips": len(addrs),
-                    "success_count": len(list_success_addrs),
-                    "failed_count": len(list_failed_addrs),
-                    "existed_count": len(list_existed_addrs),
-                    "results": all_results
-                }
-            }
+
+                        # 地址资源组创建成功，则创建同名的控制策略组
+                        list_policy_msgs = run_concurrently(
+                            lambda created: self._block_create_group_policy(
+                                direction, describe_address_book_grouptype, created[0], created[1],
+                                ready=created[0]['groupuuid'] in set_ready_groupuuids
+                            ),
+                            list_created_groups,
+                            task.max_workers
+                        )
+                        policy_success_count = task.record_created(describe_address_book_grouptype, list_created_groups, list_policy_msgs)
+                        step_span.set_attributes({"fw.created_group_count": len(list_created_groups), "fw.ready_group_count": len(set_ready_groupuuids),
+                                                  "fw.policy_success_count": policy_success_count})
+                iteration_span.set_attribute("fw.remain_count_after", task.remain_count())
+            # while主循环保护机制：连续2轮没有处理任何地址时，剩余地址记为封禁失败并退出循环
+            if not task.end_iteration():
+                break
+        return task.results()
 
     def auto_unblock_task(self, addr, direction=None):
         
         # 验证direction参数
         if direction not in ['in', 'out']:
-            msg = {
-                "addr": f"{addr}",
-                "desc": "direction参数必须为'in'或'out'"
-            }
-            logger.error(f'{msg}')
-            return msg
+            return invalid_direction_result(addr)
         
         # 验证SOAR入参IP（单个IP） or 手动入参IPS（多个IP）
-        addrs = utils.parse_ip_list(addr)
+        return self._unblock_addrs(*utils.classify_ip_list(addr), direction)
+
+    def auto_unblock_stream(self, source, direction=None, chunk_size=None):
+        """流式解封：从本地文件或迭代器中按块读取地址，逐块执行解封并产出每块的结果（body 中增加 chunk 块序号）"""
+        if direction not in ['in', 'out']:
+            yield invalid_direction_result(source)
+            return
+        chunk_size = chunk_size or utils.get_config('stream.chunk_size', 1000)
+        for chunk_index, (addrs, buckets) in enumerate(utils.iter_address_chunks(source, chunk_size)):
+            res = self._unblock_addrs(addrs, buckets, direction)
+            res['body']['chunk'] = chunk_index
+            yield res
+
+    def _unblock_addrs(self, addrs, buckets, direction):
+        """解封标准化后的地址列表（buckets 为解析时的分类结果，见 utils.classify_ip_list），返回统一格式的解封结果"""
         if not addrs:
-            return {
-                "statusCode": 400,
-                "error": "没有有效的IP地址",
-                "body": {
-                    "total_ips": 0,
-                    "success_count": 0,
-                    "failed_count": 0,
-                    "results": []
-                }
-            }
-        
-        """ 初始化处理状态变量定义及初始化 """
-        list_success_addrs = []
-        list_failed_addrs = []
-        list_remain_addrs = list(addrs)
+            return unblock_task_result(addrs, [], [])
 
-        # 连续处理失败次数计数器（防止while由于某些原因导致死循环）
-        consecutive_failures = 0
+        # 写合并：同一租户同一方向的封禁/解封请求按到达顺序串行执行，排队期间到达的解封请求合并为一次执行
+        batcher = get_write_batcher()
+        if batcher is None:
+            list_success_addrs, list_failed_addrs, task_metrics = self._run_unblock_task(buckets, direction)
+        else:
+            list_success_addrs, list_failed_addrs, task_metrics = batcher.submit(
+                self._batch_key(direction, 'unblock'),
+                self._batch_key(direction),
+                utils.classified_items(buckets),
+                lambda batch_items: self._run_unblock_task(utils.group_classified(batch_items), direction)
+            )
+        # 结果消息映射回本次调用输入的地址（合并执行时只保留本次调用的地址）
+        list_success_addrs, list_failed_addrs = [
+            filter_task_msgs(msgs, addrs) for msgs in (list_success_addrs, list_failed_addrs)
+        ]
+        # 组装统一的返回结果格式，retries / metrics 为本次任务（合并执行时为整个批次）的重试次数与指标
+        res = unblock_task_result(addrs, list_success_addrs, list_failed_addrs)
+        return task_metrics_result(res, task_metrics)
 
-        # 设置查询前缀
-        query_prefix = f"{utils.get_config('add_address_book.group_name_prefix', '')}-{direction.title()}"
-        
-        # 主处理循环
-        while list_remain_addrs:
-            len_list_remain_addrs = len(list_remain_addrs)
-            msg = {
-                "addr": f"{list_remain_addrs}",
-                "desc": f"len({len_list_remain_addrs})"
-            }
-            logger.info(f'{msg}')
-            
-            # 按地址类型分组处理
-            addrs_groups = {
-                "ip" : [],
-                "domain": []
-            }
-            
-            # 遍历list_remain_addrs列表，将ip类型和domain类型进行分组
-            for remain_addr in list_remain_addrs[:]:
-                try:
-                    ipaddress.IPv4Address(remain_addr.split('/')[0])
-                    describe_address_book_grouptype = "ip"
-                except ipaddress.AddressValueError:
-                    try:
-                        ipaddress.IPv6Address(remain_addr.split('/')[0])
-                        # IPV6 直接跳过
-                        if remain_addr in list_remain_addrs:
-                            list_remain_addrs.remove(remain_addr)
-                        continue
-                    except ipaddress.AddressValueError:
-                        describe_address_book_grouptype = "domain"
-                addrs_groups[describe_address_book_grouptype].append(remain_addr)
-
-            # 对addrs_groups列表中每一个类型的地址进行处理
-            for describe_address_book_grouptype, list_addrs_groups in addrs_groups.items():
-                if not list_addrs_groups:
-                    continue
-                    
-                # 获取该类型的现有地址组
+    def _run_unblock_task(self, buckets, direction):
+        """执行解封任务
+
+        Returns:
+            (list_success_addrs, list_failed_addrs, 任务指标 metrics.TaskMetrics)
+        """
+        address_count = sum(len(list_addrs) for list_addrs in buckets.values())
+        with metrics.task_scope('unblock') as task_metrics, \
+                tracing.span('unblock_task', {"fw.direction": direction, "fw.address_count": address_count}) as task_span:
+            list_success_addrs, list_failed_addrs = self._unblock_task_plan(buckets, direction)
+            task_span.set_attributes({"fw.success_count": len(list_success_addrs), "fw.failed_count": len(list_failed_addrs),
+                                      "fw.retries": task_metrics.retries})
+        return list_success_addrs, list_failed_addrs, task_metrics
+
+    def _unblock_task_plan(self, buckets, direction):
+        """按地址组快照一次性规划并执行解封（规划与结果见 UnblockTask），返回 (list_success_addrs, list_failed_addrs)"""
+        task = UnblockTask(buckets, direction)
+
+        # 每个类型只查询一次地址组，一次性规划后批量执行
+        for describe_address_book_grouptype, list_addrs_groups in task.addrs_groups:
+            with tracing.span('unblock.plan', {"fw.group_type": describe_address_book_grouptype, "fw.address_count": len(list_addrs_groups)}) as step_span:
+                # 获取该类型的现有地址组（不使用查询缓存，地址组写入以此为基础合并）
                 res_describe_address_book = self.describe_address_book(
-                    query=query_prefix,
-                    grouptype=describe_address_book_grouptype
+                    query=task.query_prefix,
+                    grouptype=describe_address_book_grouptype,
+                    fresh=True
                 )
-                
-                # 检查API调用是否成功
-                if (isinstance(res_describe_address_book, str) or 
-                    res_describe_address_book is None or 
-                    res_describe_address_book.get('statusCode') != 200 or
-                    res_describe_address_book.get('body') is None or
-                    res_describe_address_book.get('body', {}).get('Acls') is None):
-                    logger.error(f"查询地址组失败: {res_describe_address_book}")
+                snapshot = task.build_snapshot(res_describe_address_book)
+                not_found_before = len(task.notfound)
+                plans = task.plan(snapshot, list_addrs_groups)
+                if snapshot is None:
+                    step_span.set_status(tracing.STATUS_ERROR, '查询地址组失败')
                     continue
-                
-                # 遍历每个地址组，查找匹配的IP并移除
-                for addrgrp in res_describe_address_book['body']['Acls']:
-                    if not list_addrs_groups:
-                        break
-                    if query_prefix not in addrgrp['GroupName']:
-                        continue
-                        
-                    addrgrp_groupname = addrgrp['GroupName']
-                    addrgrp_groupuuid = addrgrp['GroupUuid']
-                    addrgrp_description = addrgrp['Description']
-                    addrgrp_addresslist = addrgrp['AddressList']
-                    
-                    # 查找匹配的IP并构建新的地址列表
-                    matched_addrs = []
-                    new_address_list = []
-                    
-                    for addr in addrgrp_addresslist:
-                        found_match = False
-                        for remain_addr in list_addrs_groups[:]:
-                            if utils.ip_matches(addr, remain_addr):
-                                matched_addrs.append(remain_addr)
-                                found_match = True
-                                break
-                        if not found_match:
-                            new_address_list.append(addr)
-                    
-                    # 如果找到匹配的IP，则进行处理
-                    if matched_addrs:
-                        if len(new_address_list) == 0:
-                            # 地址组为空，删除地址组和相关策略
-                            # 先查找并删除相关的控制策略（按描述过滤）
-                            res_describe_control_policy = self.describe_control_policy(direction, description=addrgrp_groupname)
-                            if isinstance(res_describe_control_policy, dict) and res_describe_control_policy.get('statusCode') == 200:
-                                policies = res_describe_control_policy['body']['Policys']
-                                for policy in policies:
-                                    policy_source = policy.get('Source', '')
-                                    policy_destination = policy.get('Destination', '')
-                                    if ((direction == 'in' and policy_source == addrgrp_groupname) or
-                                        (direction == 'out' and policy_destination == addrgrp_groupname)):
-                                        policy_id = policy.get('AclUuid')
-                                        if policy_id:
-                                            res_delete_policy = self.delete_control_policy(policy_id, direction)
-                                            if isinstance(res_delete_policy, dict) and res_delete_policy.get('statusCode') == 200:
-                                                logger.info(f"成功删除控制策略: {policy_id}")
-                                            else:
-                                                logger.error(f"删除控制策略失败: {policy_id}")
-                            
-                            # 删除地址组
-                            res_delete_address_book = self.delete_address_book(addrgrp_groupuuid)
-                            if isinstance(res_delete_address_book, dict) and res_delete_address_book.get('statusCode') == 200:
-                                for matched_addr in matched_addrs:
-                                    msg = {
-                                        "addr": f"{matched_addr}",
-                                        "groupname": addrgrp_groupname,
-                                        "groupuuid": addrgrp_groupuuid,
-                                        "desc": "解封成功"
-                                    }
-                                    logger.info(f'{msg}')
-                                    list_success_addrs.append(msg)
-                                    if matched_addr in list_addrs_groups:
-                                        list_addrs_groups.remove(matched_addr)
-                                    if matched_addr in list_remain_addrs:
-                                        list_remain_addrs.remove(matched_addr)
-                            else:
-                                for matched_addr in matched_addrs:
-                                    msg = {
-                                        "addr": f"{matched_addr}",
-                                        "desc": "解封失败"
-                                    }
-                                    logger.info(f'{msg}')
-                                    list_failed_addrs.append(msg)
-                                    if matched_addr in list_addrs_groups:
-                                        list_addrs_groups.remove(matched_addr)
-                                    if matched_addr in list_remain_addrs:
-                                        list_remain_addrs.remove(matched_addr)
-                        else:
-                            # 修改地址组，移除匹配的IP
-                            res_modify_address_book = self.modify_address_book(
-                                groupname=addrgrp_groupname,
-                                groupuuid=addrgrp_groupuuid,
-                                description=addrgrp_description,
-                                addresslist=new_address_list
-                            )
-                            
-                            if isinstance(res_modify_address_book, dict) and res_modify_address_book.get('statusCode') == 200:
-                                for matched_addr in matched_addrs:
-                                    msg = {
-                                        "addr": f"{matched_addr}",
-                                        "groupname": addrgrp_groupname,
-                                        "groupuuid": addrgrp_groupuuid,
-                                        "grouplen": len(new_address_list),
-                                        "desc": "解封成功"
-                                    }
-                                    logger.info(f'{msg}')
-                                    list_success_addrs.append(msg)
-                                    if matched_addr in list_addrs_groups:
-                                        list_addrs_groups.remove(matched_addr)
-                                    if matched_addr in list_remain_addrs:
-                                        list_remain_addrs.remove(matched_addr)
-                            else:
-                                for matched_addr in matched_addrs:
-                                    msg = {
-                                        "addr": f"{matched_addr}",
-                                        "desc": "解封失败"
-                                    }
-                                    logger.info(f'{msg}')
-                                    list_failed_addrs.append(msg)
-                                    if matched_addr in list_addrs_groups:
-                                        list_addrs_groups.remove(matched_addr)
-                                    if matched_addr in list_remain_addrs:
-                                        list_remain_addrs.remove(matched_addr)
-                        
-                        # 找到匹配后跳出当前地址簿循环，继续处理下一个地址簿
-                        break
-                
-            # while主循环保护机制
-            if len(list_remain_addrs) == len_list_remain_addrs:
-                consecutive_failures += 1
-                if consecutive_failures >= 2:
-                    # 处理剩余未找到的IP
-                    for addr in list_remain_addrs:
-                        msg = {
-                            "addr": f"{addr}",
-                            "desc": "未找到该IP"
-                        }
-                        logger.info(f'{msg}')
-                        list_failed_addrs.append(msg)
-                    break
-            else:
-                consecutive_failures = 0
-        
-        # 组装统一的返回结果格式
-        all_results = list_success_addrs + list_failed_addrs
-        
-        if list_success_addrs:
-            return {
-                "statusCode": 200,
-                "message": f"成功从火山云防火墙封禁列表中移除 {len(list_success_addrs)} 个IP",
-                "body": {
-                    "total_ips": len(addrs),
-                    "success_count": len(list_success_addrs),
-                    "failed_count": len(list_failed_addrs),
-                    "results": all_results
-                }
-            }
-        else:
-            return {
-                "statusCode": 400,
-                "error": "没有找到需要移除的IP",
-                "body": {
-                    "total_ips": len(addrs),
-                    "success_count": len(list_success_addrs),
-                    "failed_count": len(list_failed_addrs),
-                    "results": all_results
-                }
-            }
\ No newline at end of file
+                step_span.set_attributes({"fw.group_count": len(plans), "fw.not_found_count": len(task.notfound) - not_found_before})
+
+            with tracing.span('unblock.apply', {"fw.group_type": describe_address_book_grouptype, "fw.group_count": len(plans)}) as step_span:
+                # 存在需要删除的地址组时，加载一次控制策略索引，用于查找引用这些地址组的控制策略
+                if task.needs_policy_index(plans):
+                    task.policy_index = self.load_control_policy_index(direction)
+
+                # 批量执行各地址组的修改/删除（concurrency.max_workers > 1 时并发）
+                list_group_msgs = run_concurrently(
+                    lambda plan: self._unblock_group(direction, *plan, policy_index=task.policy_index),
+                    plans,
+                    task.max_workers
+                )
+                step_span.set_attribute("fw.success_count", task.record_group_msgs(list_group_msgs))
+
+        return task.results()
+
+    def check_blocked(self, addr, direction=None):
+        """查询IP是否已被封禁：按地址组快照构建的前缀树做最长前缀匹配，返回命中的地址组
+
+        direction 为空时同时查询入/出方向；快照在 cache.ttl 内且没有写操作时跨调用复用
+        """
+        if direction not in (None, '', 'in', 'out'):
+            return invalid_direction_result(addr)
+
+        addrs, buckets = utils.classify_ip_list(addr)
+        addrs_groups, _ = split_addrs_by_type(buckets)
+        snapshots = {}
+        for check_direction in ([direction] if direction else ['in', 'out']):
+            for grouptype, list_addrs in addrs_groups.items():
+                if not list_addrs:
+                    continue
+                snapshot = self.blocklist_snapshot(check_direction, grouptype)
+                if snapshot is None:
+                    return check_blocked_error_result(addrs, check_direction, grouptype)
+                snapshots.setdefault(check_direction, {})[grouptype] = snapshot
+        return check_blocked_result(addrs, buckets, snapshots)
+
+    def blocklist_snapshot(self, direction, grouptype):
+        """获取某方向某类型的封禁地址组快照（优先复用缓存），查询失败返回 None"""
+        key = (self.ak, self.region, direction, grouptype)
+        snapshot = cached_blocklist_snapshot(key)
+        if snapshot is not None:
+            return snapshot
+
+        generation = get_read_cache().generation()
+        query_prefix = block_query_prefix(direction)
+        res_describe_address_book = self.describe_address_book(query=query_prefix, grouptype=grouptype)
+        snapshot = AddressBookSnapshot.from_describe(
+            res_describe_address_book, query_prefix,
+            utils.get_config('modify_address_book.max_addresses_per_group')
+        )
+        if snapshot is not None:
+            store_blocklist_snapshot(key, generation, snapshot)
+        return snapshot
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙地址组快照
+"""
+
+from apps.fw_volcengine import utils
+from apps.fw_volcengine.cidr import PrefixTrie, exclude_addresses, parse_network
+
+
+class AddressBookSnapshot:
+    """地址组快照
+
+    由一次 describe_address_book 的查询结果构建，维护 标准化地址 -> (地址组UUID, 地址组名称) 的哈希索引，
+    "是否已封禁"、地址组容量、空位查询均为 O(1)；写操作成功后通过 add/remove 同步快照，避免重复查询
+    """
+
+    def __init__(self, acls, query_prefix, max_addresses_per_group):
+        self.query_prefix = query_prefix
+        self.max_addresses_per_group = max_addresses_per_group
+        self.groups = {}            # 地址组UUID -> 地址组字典（阿里云格式）
+        self.address_index = {}     # 标准化地址 -> (地址组UUID, 地址组名称)
+        self._members = {}          # 地址组UUID -> {标准化地址: 原始地址}，保持原有顺序
+        self._free_groups = {}      # 有空位的地址组UUID（dict 保持插入顺序，当作有序集合使用）
+        self._trie = None           # IPv4 地址段前缀树（首次查询覆盖关系时构建），value 为标准化地址
+        for acl in acls or []:
+            if query_prefix in acl['GroupName']:
+                self.add_group(acl)
+
+    @classmethod
+    def from_describe(cls, res_describe_address_book, query_prefix, max_addresses_per_group):
+        """从 describe_address_book 的返回结果构建快照，查询失败时返回 None"""
+        if (not isinstance(res_describe_address_book, dict) or
+                res_describe_address_book.get('statusCode') != 200 or
+                res_describe_address_book.get('body') is None or
+                res_describe_address_book['body'].get('Acls') is None):
+            return None
+        return cls(res_describe_address_book['body']['Acls'], query_prefix, max_addresses_per_group)
+
+    def add_group(self, acl):
+        """将地址组加入快照"""
+        groupuuid = acl['GroupUuid']
+        members = {}
+        for addr in acl.get('AddressList') or []:
+            members.setdefault(utils.classify_ip(addr)[0], addr)
+        self.groups[groupuuid] = dict(acl, AddressList=list(members.values()))
+        self._members[groupuuid] = members
+        for normalized_addr in members:
+            self.address_index.setdefault(normalized_addr, (groupuuid, acl['GroupName']))
+            self._trie_insert(normalized_addr)
+        self._refresh_free(groupuuid)
+
+    def remove_group(self, groupuuid):
+        """将地址组从快照中移除"""
+        self.groups.pop(groupuuid, None)
+        self._free_groups.pop(groupuuid, None)
+        self._trie = None
+        for normalized_addr in self._members.pop(groupuuid, {}):
+            if self.address_index.get(normalized_addr, (None,))[0] == groupuuid:
+                del self.address_index[normalized_addr]
+
+    def lookup(self, addr):
+        """查询地址所在的地址组，返回 (地址组UUID, 地址组名称)，未封禁返回 None
+
+        addr 需为 utils.parse_ip_list 标准化后的格式
+        """
+        return self.address_index.get(addr)
+
+    def covering(self, addr):
+        """查询覆盖该地址的已封禁地址段（如 10.0.0.5/32 被 10.0.0.0/24 覆盖）
+
+        Returns:
+            (地址组UUID, 地址组名称, 覆盖该地址的标准化地址段)，未被覆盖返回 None
+        """
+        network = parse_network(addr)
+        if network is None:
+            return None
+        match = self.prefix_trie().covering(network)
+        if match is None:
+            return None
+        return self.address_index[match[1]] + (match[1],)
+
+    def covering_entries(self, addr):
+        """查询与该地址相同或覆盖该地址的全部已封禁条目（嵌套的各级地址段，以及写入了多个地址组的同一条目各算一条）
+
+        Returns:
+            [(地址组UUID, 地址组名称, 标准化地址), ...]，地址段按前缀长度从短到长
+        """
+        network = parse_network(addr)
+        if network is None:
+            entries = [addr] if addr in self.address_index else []
+        else:
+            entries = [value for _, value in self.prefix_trie().matches(network)]
+        return [hit + (entry,) for entry in entries for hit in self.entry_groups(entry)]
+
+    def covered_entries(self, addr):
+        """查询被该地址段覆盖的更精确的已封禁条目（如 10.0.0.0/30 覆盖的 10.0.0.1/32），不含与该地址相同的条目
+
+        Returns:
+            [(地址组UUID, 地址组名称, 标准化地址), ...]
+        """
+        network = parse_network(addr)
+        if network is None:
+            return []
+        return [hit + (value,) for _, value in self.prefix_trie().subnets(network) for hit in self.entry_groups(value)]
+
+    def entry_groups(self, normalized_addr):
+        """包含该标准化地址的全部地址组 [(地址组UUID, 地址组名称), ...]，索引中的地址组在前"""
+        hit = self.address_index.get(normalized_addr)
+        if hit is None:
+            return []
+        return [hit] + [(groupuuid, self.groups[groupuuid]['GroupName']) for groupuuid, members in self._members.items()
+                        if groupuuid != hit[0] and normalized_addr in members]
+
+    def longest_match(self, addr):
+        """最长前缀匹配：查询封禁该标准化地址的最精确的地址段（IPv4），域名等非IP地址精确匹配
+
+        Returns:
+            (地址组UUID, 地址组名称, 匹配的标准化地址)，未封禁返回 None
+        """
+        network = parse_network(addr)
+        if network is None:
+            hit = self.address_index.get(addr)
+            return hit + (addr,) if hit else None
+        match = self.prefix_trie().longest_match(network)
+        if match is None:
+            return None
+        return self.address_index[match[1]] + (match[1],)
+
+    def prefix_trie(self):
+        """IPv4 地址段前缀树（首次调用时构建，构建完成后才对其他线程可见），value 为标准化地址"""
+        if self._trie is None:
+            trie = PrefixTrie()
+            for normalized_addr in self.address_index:
+                network = parse_network(normalized_addr)
+                if network is not None:
+                    trie.insert(network, normalized_addr)
+            self._trie = trie
+        return self._trie
+
+    def contains(self, addr):
+        """地址是否已存在于某个地址组中"""
+        return addr in self.address_index
+
+    def group_size(self, groupuuid):
+        """地址组当前地址数量"""
+        return len(self._members.get(groupuuid, ()))
+
+    def free_slots(self, groupuuid):
+        """地址组剩余空位数量"""
+        return max(self.max_addresses_per_group - self.group_size(groupuuid), 0)
+
+    def groups_with_free_slots(self):
+        """有空位的地址组列表（按查询结果顺序）"""
+        return [self.groups[groupuuid] for groupuuid in list(self._free_groups)]
+
+    def address_list(self, groupuuid, exclude=None):
+        """地址组的地址列表，exclude 为需要排除的标准化地址集合"""
+        members = self._members.get(groupuuid, {})
+        if not exclude:
+            return list(members.values())
+        return [addr for normalized_addr, addr in members.items() if normalized_addr not in exclude]
+
+    def add(self, groupuuid, addrs):
+        """地址写入地址组成功后同步快照"""
+        members = self._members[groupuuid]
+        groupname = self.groups[groupuuid]['GroupName']
+        for addr in addrs:
+            members.setdefault(addr, addr)
+            self.address_index.setdefault(addr, (groupuuid, groupname))
+            self._trie_insert(addr)
+        self.groups[groupuuid]['AddressList'] = list(members.values())
+        self._refresh_free(groupuuid)
+
+    def remove(self, groupuuid, addrs):
+        """地址从地址组移除成功后同步快照"""
+        members = self._members[groupuuid]
+        for addr in addrs:
+            members.pop(addr, None)
+            if self.address_index.get(addr, (None,))[0] == groupuuid:
+                del self.address_index[addr]
+        self._trie = None
+        self.groups[groupuuid]['AddressList'] = list(members.values())
+        self._refresh_free(groupuuid)
+
+    def _trie_insert(self, normalized_addr):
+        if self._trie is not None:
+            network = parse_network(normalized_addr)
+            if network is not None:
+                self._trie.insert(network, normalized_addr)
+
+    def _refresh_free(self, groupuuid):
+        if self.group_size(groupuuid) < self.max_addresses_per_group:
+            self._free_groups[groupuuid] = None
+        else:
+            self._free_groups.pop(groupuuid, None)
+
+
+def plan_block(snapshot, addrs, has_policy):
+    """封禁装箱规划：一次性为全部待封禁地址分配目标地址组
+
+    先按顺序填满现有地址组的空位（仅限 has_policy(地址组) 为真的地址组，按需逐个判断），
+    剩余地址按地址组最大容量切分，每一份对应一个需要新建的地址组
+
+    Args:
+        snapshot: AddressBookSnapshot 地址组快照
+        addrs: 待封禁的标准化地址列表（不含已封禁地址）
+        has_policy: 判断地址组是否已有同名控制策略的函数
+
+    Returns:
+        (fills, new_groups)
+        fills: [(地址组字典, 写入该地址组的地址列表), ...]
+        new_groups: [新建地址组的最终地址列表, ...]
+    """
+    fills = []
+    offset = 0
+    for addrgrp in snapshot.groups_with_free_slots():
+        if offset >= len(addrs):
+            break
+        if not has_policy(addrgrp):
+            continue
+        free_slots = snapshot.free_slots(addrgrp['GroupUuid'])
+        fills.append((addrgrp, addrs[offset:offset + free_slots]))
+        offset += free_slots
+
+    max_addresses_per_group = snapshot.max_addresses_per_group
+    new_groups = [addrs[i:i + max_addresses_per_group]
+                  for i in range(offset, len(addrs), max_addresses_per_group)]
+    return fills, new_groups
+
+
+def exclude_blocked(snapshot, addrs):
+    """剔除待封禁地址段中已被地址组中更精确的条目封禁的部分，避免地址组中出现相互覆盖的重复条目
+    （如待封禁 10.0.0.0/31 而 10.0.0.0/32 已封禁时，只写入 10.0.0.1/32）
+
+    Args:
+        snapshot: AddressBookSnapshot 地址组快照
+        addrs: 待封禁的标准化地址列表（不含已封禁或已被覆盖的地址）
+
+    Returns:
+        (new_addrs, blocked)
+        new_addrs: 需要写入的地址列表
+        blocked: {已被更精确的条目完全封禁的地址段: (地址组UUID, 地址组名称)}
+    """
+    new_addrs = []
+    blocked = {}
+    for addr in addrs:
+        covered = snapshot.covered_entries(addr)
+        if not covered:
+            new_addrs.append(addr)
+            continue
+        remaining = exclude_addresses(addr, [entry for _, _, entry in covered])
+        if remaining:
+            new_addrs.extend(remaining)
+        else:
+            blocked[addr] = covered[0][:2]
+    return new_addrs, blocked
+
+
+def plan_unblock(snapshot, addrs):
+    """解封规划：一次性按快照索引将全部待解封地址归集到其所在的地址组
+
+    与待解封地址相同、或被待解封地址段覆盖的条目直接移除；覆盖待解封地址的每一级地址段（即使同时存在相同的条目）
+    都需要拆分：移除该地址段并追加其余部分（如 10.0.0.5/32 位于 10.0.0.0/24 中时追加 10.0.0.0/30、10.0.0.4/32、10.0.0.6/31 ...），
+    否则解封后该地址仍被地址段封禁
+
+    Args:
+        snapshot: AddressBookSnapshot 地址组快照
+        addrs: 待解封的标准化地址列表
+
+    Returns:
+        (plans, not_found)
+        plans: [(地址组字典, 该地址组中匹配的地址列表, 移除后的新地址列表, 需移除的地址列表, 需追加的地址列表), ...]，
+            新地址列表为空表示需删除地址组
+        not_found: 未在任何地址组中找到的地址列表
+    """
+    matched_by_group = {}       # 地址组UUID -> {匹配的待解封地址: None}
+    remove_by_group = {}        # 地址组UUID -> {需直接移除的条目: None}
+    split_by_group = {}         # 地址组UUID -> {需拆分的覆盖地址段: [其中待解封的地址]}
+    not_found = []
+    for addr in addrs:
+        covering = snapshot.covering_entries(addr)
+        covered = snapshot.covered_entries(addr)
+        if not covering and not covered:
+            not_found.append(addr)
+            continue
+        for groupuuid, _, entry in covering:
+            matched_by_group.setdefault(groupuuid, {})[addr] = None
+            if entry == addr:
+                remove_by_group.setdefault(groupuuid, {})[entry] = None
+            else:
+                split_by_group.setdefault(groupuuid, {}).setdefault(entry, []).append(addr)
+        for groupuuid, _, entry in covered:
+            matched_by_group.setdefault(groupuuid, {})[addr] = None
+            remove_by_group.setdefault(groupuuid, {})[entry] = None
+
+    plans = []
+    for groupuuid, matched_addrs in matched_by_group.items():
+        splits = split_by_group.get(groupuuid, {})
+        remove_addrs = list(remove_by_group.get(groupuuid, {})) + [supernet for supernet in splits]
+        # 嵌套的覆盖地址段拆分后剩余部分可能重复，或已是地址组中的条目
+        add_addrs = []
+        for supernet, split_addrs in splits.items():
+            for remain_addr in exclude_addresses(supernet, split_addrs):
+                if not snapshot.contains(remain_addr) and remain_addr not in add_addrs:
+                    add_addrs.append(remain_addr)
+        new_address_list = snapshot.address_list(groupuuid, exclude=set(remove_addrs)) + add_addrs
+        plans.append((snapshot.groups[groupuuid], list(matched_addrs), new_address_list, remove_addrs, add_addrs))
+    return plans, not_found
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙写合并队列
+"""
+
+import asyncio
+import collections
+import threading
+
+from apps.fw_volcengine import metrics, utils
+
+
+class _Batch:
+    """一个正在收集请求的批次"""
+
+    def __init__(self, key):
+        self.key = key
+        self.items = {}             # 去重后的待处理项（dict 保持提交顺序）
+        self.started = False        # 已开始执行，不再接收新的请求
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WriteBatcher:
+    """写合并队列（线程安全）
+
+    相同 lock_key 的请求（例如同一租户同一方向的封禁与解封）按到达顺序排队串行执行，避免并发修改同一地址组时后写覆盖先写：
+    队列为空时立即执行，不等待；有批次正在执行时，新到达的请求若与队尾批次的 key 相同则并入该批次（去重），
+    否则在队尾新建批次，因此批次的执行顺序与请求的到达顺序一致（同一IP先封禁后解封不会颠倒）。
+    每个批次由第一个提交者调用一次 run(全部项) 执行，其余提交者等待并共享该次结果；
+    window 秒大于 0 时，存在排队的批次时新建的批次额外等待 window 秒收集请求
+    """
+
+    def __init__(self, window=0):
+        self.window = window
+        self._queues = {}           # lock_key -> 按到达顺序排队的 _Batch（队首为正在执行或下一个执行的批次）
+        self._cond = threading.Condition()
+
+    def submit(self, key, lock_key, items, run):
+        """提交待处理项，返回所在批次 run 的执行结果（同一批次的提交者得到同一个结果对象）"""
+        with self._cond:
+            queue = self._queues.setdefault(lock_key, collections.deque())
+            batch = queue[-1] if queue and queue[-1].key == key and not queue[-1].started else None
+            leader = batch is None
+            if leader:
+                batch = _Batch(key)
+                queue.append(batch)
+            for item in items:
+                batch.items.setdefault(item, None)
+            contended = len(queue) > 1
+
+        if not leader:
+            batch.event.wait()
+            if batch.error is not None:
+                raise batch.error
+            return batch.result
+
+        try:
+            if contended and self.window:
+                # 收集窗口：前面有批次排队时，窗口内相同 key 的请求并入本批次
+                metrics.sleep(self.window, 'batch_window')
+            with self._cond:
+                while queue[0] is not batch:
+                    self._cond.wait()
+                batch.started = True
+                batch_items = list(batch.items)
+            batch.result = run(batch_items)
+            return batch.result
+        except BaseException as e:
+            batch.error = e
+            raise
+        finally:
+            with self._cond:
+                queue.remove(batch)
+                if not queue and self._queues.get(lock_key) is queue:
+                    del self._queues[lock_key]
+                self._cond.notify_all()
+            batch.event.set()
+
+
+class _AsyncBatch:
+    """AsyncWriteBatcher 中一个正在收集请求的批次"""
+
+    def __init__(self, key):
+        self.key = key
+        self.items = {}
+        self.started = False
+        self.finished = asyncio.Event()
+        self.result = None
+        self.error = None
+
+
+class AsyncWriteBatcher:
+    """写合并队列（asyncio 版本），排队与合并规则同 WriteBatcher，队列按事件循环隔离
+
+    run 为协程函数，每个批次由第一个提交者 await run(全部项) 执行一次，其余提交者等待并共享该次结果
+    """
+
+    def __init__(self, window=0):
+        self.window = window
+        self._queues = {}           # (事件循环, lock_key) -> 按到达顺序排队的 _AsyncBatch
+
+    async def submit(self, key, lock_key, items, run):
+        """提交待处理项，返回所在批次 run 的执行结果（同一批次的提交者得到同一个结果对象）"""
+        queue_key = (asyncio.get_running_loop(), lock_key)
+        queue = self._queues.setdefault(queue_key, collections.deque())
+        batch = queue[-1] if queue and queue[-1].key == key and not queue[-1].started else None
+        leader = batch is None
+        if leader:
+            batch = _AsyncBatch(key)
+            queue.append(batch)
+        for item in items:
+            batch.items.setdefault(item, None)
+        contended = len(queue) > 1
+
+        if not leader:
+            await batch.finished.wait()
+            if batch.error is not None:
+                raise batch.error
+            return batch.result
+
+        try:
+            if contended and self.window:
+                # 收集窗口：前面有批次排队时，窗口内相同 key 的请求并入本批次
+                await metrics.async_sleep(self.window, 'batch_window')
+            while queue[0] is not batch:
+                await queue[0].finished.wait()
+            batch.started = True
+            batch.result = await run(list(batch.items))
+            return batch.result
+        except BaseException as e:
+            batch.error = e
+            raise
+        finally:
+            queue.remove(batch)
+            if not queue and self._queues.get(queue_key) is queue:
+                del self._queues[queue_key]
+            batch.finished.set()
+
+
+_write_batcher = None   # 进程内共享的写合并队列
+_write_batcher_lock = threading.Lock()
+_async_write_batcher = None     # 异步版本共享的写合并队列
+
+
+def get_write_batcher():
+    """获取（不存在则按 config.yaml 的 batch 配置创建）进程内共享的写合并队列，batch.enabled 为 false 时返回 None"""
+    global _write_batcher
+    if not utils.get_config('batch.enabled', False):
+        return None
+    if _write_batcher is None:
+        with _write_batcher_lock:
+            if _write_batcher is None:
+                _write_batcher = WriteBatcher(utils.get_config('batch.window_ms', 0) / 1000.0)
+    return _write_batcher
+
+
+def get_async_write_batcher():
+    """获取（不存在则创建）异步版本共享的写合并队列，配置同 get_write_batcher，batch.enabled 为 false 时返回 None"""
+    global _async_write_batcher
+    if not utils.get_config('batch.enabled', False):
+        return None
+    if _async_write_batcher is None:
+        _async_write_batcher = AsyncWriteBatcher(utils.get_config('batch.window_ms', 0) / 1000.0)
+    return _async_write_batcher
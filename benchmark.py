@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙封禁/解封性能基准
+
+针对本地 FWCENTER 模拟服务（fake_fwcenter）运行 auto_block_task / auto_unblock_task，
+按 地址数量 × 地址组容量 × 预置地址组数量 × 模拟API延迟 的组合逐个场景测量：
+耗时、各接口调用次数、峰值内存（RSS）、休眠时间（重试退避、可见性等待、写合并窗口等），结果写入 JSON 文件
+
+每个场景的封禁、解封阶段分别在新的子进程中执行（峰值内存与进程内缓存互不影响），
+模拟服务运行在主进程中，按阶段统计接口调用次数
+
+用法：
+    python -m apps.fw_volcengine.benchmark --suite quick --output benchmark.json
+    python -m apps.fw_volcengine.benchmark --sizes 1,1000,100000 --capacities 15,20000 --existing 0,100 --latency 0,0.02
+"""
+
+import argparse
+import datetime
+import http.client
+import ipaddress
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from apps.fw_volcengine.fake_fwcenter import FakeFwcenterServer
+
+# 预设的场景组合
+SUITES = {
+    "quick": {
+        "sizes": [1, 100, 1000],
+        "capacities": [15, 1000],
+        "existing": [0, 20],
+        "latency": [0.0],
+    },
+    "full": {
+        "sizes": [1, 100, 1000, 10000, 100000],
+        "capacities": [15, 1000, 20000],
+        "existing": [0, 100],
+        "latency": [0.0, 0.02],
+    },
+}
+
+_BLOCK_BASE = int(ipaddress.IPv4Address('10.0.0.0'))        # 待封禁地址从 10.0.0.0 开始，间隔 2 个地址（不会被归并为网段）
+_EXISTING_BASE = int(ipaddress.IPv4Address('172.16.0.0'))   # 预置地址组中的地址
+_ROUND_TRIP_WARN_MS = 10                                    # 模拟服务往返耗时超出模拟延迟该值（毫秒）时告警
+
+
+def benchmark_addresses(count, base=_BLOCK_BASE):
+    """生成 count 个互不相邻的 IPv4 地址"""
+    return [str(ipaddress.IPv4Address(base + 2 * i)) for i in range(count)]
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _run_phase(phase, endpoint, size, direction, config_overrides, log_level):
+    """子进程中执行一个阶段（block / unblock），返回耗时、休眠时间、峰值内存与任务结果计数"""
+    from loguru import logger
+    from apps.fw_volcengine import utils
+    from apps.fw_volcengine.FwVolcengineApp import FwVolcengineApp
+
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+    config = utils.get_config(None) or {}
+    for key_path, value in config_overrides.items():
+        section, key = key_path.split('.', 1)
+        config.setdefault(section, {})[key] = value
+
+    # 统计客户端休眠时间（重试退避、限流等待、地址组可见性轮询、写合并窗口等）
+    sleep_stats = {"seconds": 0.0, "calls": 0}
+    sleep_lock = threading.Lock()
+    original_sleep = time.sleep
+
+    def counting_sleep(seconds):
+        with sleep_lock:
+            sleep_stats["seconds"] += seconds
+            sleep_stats["calls"] += 1
+        original_sleep(seconds)
+
+    time.sleep = counting_sleep
+
+    addr = ','.join(benchmark_addresses(size))
+    app = FwVolcengineApp(ak='benchmark', sk='benchmark', endpoint=endpoint, region='cn-beijing')
+    rss_before = _peak_rss_kb()
+    started = time.perf_counter()
+    if phase == 'block':
+        res = app.auto_block_task(addr, direction)
+    else:
+        res = app.auto_unblock_task(addr, direction)
+    wall = time.perf_counter() - started
+    time.sleep = original_sleep
+
+    body = res.get('body', {}) if isinstance(res, dict) else {}
+    return {
+        "wall_seconds": round(wall, 4),
+        "sleep_seconds": round(sleep_stats["seconds"], 4),
+        "sleep_calls": sleep_stats["calls"],
+        "peak_rss_kb": _peak_rss_kb(),
+        "peak_rss_kb_before": rss_before,
+        "status_code": res.get('statusCode') if isinstance(res, dict) else None,
+        "result": {key: value for key, value in body.items() if key != 'results'},
+    }
+
+
+def server_round_trip_ms(endpoint, count=20):
+    """模拟服务单个请求的往返耗时中位数（毫秒，同一长连接，不经过SDK），用于确认测量结果不受回环服务自身的传输开销影响"""
+    host, port = endpoint.split('://', 1)[1].rsplit(':', 1)
+    conn = http.client.HTTPConnection(host, int(port), timeout=10)
+    samples = []
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            conn.request('POST', '/?Action=DescribeControlPolicy&Version=2021-09-06', body='{"Direction": "in"}',
+                         headers={'Content-Type': 'application/json'})
+            conn.getresponse().read()
+            samples.append((time.perf_counter() - started) * 1000)
+    finally:
+        conn.close()
+    samples.sort()
+    return round(samples[len(samples) // 2], 3)
+
+
+def run_scenario(size, capacity, existing, latency, direction='in', consistency_delay=0.0, log_level='WARNING'):
+    """运行一个场景（先封禁再解封），返回场景参数与各阶段的测量结果"""
+    from apps.fw_volcengine import utils
+
+    query_prefix = f"{utils.get_config('add_address_book.group_name_prefix', '')}-{direction.title()}"
+    # 开启任务指标，结果中包含各接口调用耗时百分位数与各原因的休眠时间
+    config_overrides = {"modify_address_book.max_addresses_per_group": capacity, "metrics.enabled": True}
+    scenario = {
+        "size": size,
+        "max_addresses_per_group": capacity,
+        "existing_groups": existing,
+        "latency": latency,
+        "direction": direction,
+        "consistency_delay": consistency_delay,
+        "server_round_trip_ms": None,
+        "phases": {},
+    }
+
+    with FakeFwcenterServer(max_addresses=capacity, latency=latency, consistency_delay=consistency_delay) as server:
+        # 预置地址组：每组填充一半容量，封禁时会先填满这些地址组的空位
+        fill = max(capacity // 2, 1)
+        existing_addrs = iter(benchmark_addresses(existing * fill, base=_EXISTING_BASE))
+        for index in range(existing):
+            server.fwcenter.preload(f'{query_prefix}-bench{index:05d}', 'ip',
+                                    [f'{addr}/32' for addr in itertools.islice(existing_addrs, fill)], direction)
+
+        # 模拟服务自身的往返耗时（不含模拟延迟 latency 时应远小于 1ms 量级的客户端开销）
+        scenario["server_round_trip_ms"] = server_round_trip_ms(server.endpoint)
+        if scenario["server_round_trip_ms"] > latency * 1000 + _ROUND_TRIP_WARN_MS:
+            print(f"警告: 模拟服务往返耗时 {scenario['server_round_trip_ms']}ms 异常，测量结果主要反映回环服务的传输开销",
+                  file=sys.stderr, flush=True)
+
+        context = multiprocessing.get_context('spawn')
+        for phase in ('block', 'unblock'):
+            calls_before = dict(server.calls)
+            with context.Pool(1) as pool:
+                measurement = pool.apply(_run_phase, (phase, server.endpoint, size, direction, config_overrides, log_level))
+            api_calls = {action: count - calls_before.get(action, 0)
+                         for action, count in server.calls.items() if count - calls_before.get(action, 0)}
+            measurement["api_calls"] = api_calls
+            measurement["api_calls_total"] = sum(api_calls.values())
+            scenario["phases"][phase] = measurement
+        scenario["server_errors"] = dict(server.fwcenter.errors)
+    return scenario
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _parse_list(value, cast):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='火山云云防火墙封禁/解封性能基准')
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick', help='预设的场景组合，可被下列参数覆盖')
+    parser.add_argument('--sizes', help='地址数量列表，如 1,1000,100000')
+    parser.add_argument('--capacities', help='max_addresses_per_group 列表，如 15,20000')
+    parser.add_argument('--existing', help='预置地址组数量列表，如 0,100')
+    parser.add_argument('--latency', help='模拟API延迟（秒）列表，如 0,0.02')
+    parser.add_argument('--consistency-delay', type=float, default=0.0, help='模拟服务的最终一致性延迟（秒）')
+    parser.add_argument('--direction', choices=['in', 'out'], default='in')
+    parser.add_argument('--log-level', default='WARNING', help='子进程日志级别')
+    parser.add_argument('--output', default='benchmark.json', help='结果 JSON 文件路径')
+    args = parser.parse_args()
+
+    suite = SUITES[args.suite]
+    sizes = _parse_list(args.sizes, int) if args.sizes else suite["sizes"]
+    capacities = _parse_list(args.capacities, int) if args.capacities else suite["capacities"]
+    existing_counts = _parse_list(args.existing, int) if args.existing else suite["existing"]
+    latencies = _parse_list(args.latency, float) if args.latency else suite["latency"]
+
+    results = []
+    for size, capacity, existing, latency in itertools.product(sizes, capacities, existing_counts, latencies):
+        scenario = run_scenario(size, capacity, existing, latency, args.direction, args.consistency_delay, args.log_level)
+        results.append(scenario)
+        block, unblock = scenario["phases"]["block"], scenario["phases"]["unblock"]
+        print(f"size={size} capacity={capacity} existing={existing} latency={latency}: "
+              f"block {block['wall_seconds']}s/{block['api_calls_total']} calls, "
+              f"unblock {unblock['wall_seconds']}s/{unblock['api_calls_total']} calls", flush=True)
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec='seconds'),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "suite": args.suite,
+        },
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙查询结果缓存
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from apps.fw_volcengine import utils
+
+
+class TTLCache:
+    """线程安全的 TTL + LRU 缓存
+
+    条目超过 ttl 秒即失效，条目数超过 maxsize 时淘汰最久未使用的条目；ttl <= 0 时不缓存。
+    写操作通过 invalidate 按键前缀失效缓存，并递增代数：查询开始前通过 generation() 取得代数，
+    查询期间若发生失效，set 会丢弃该结果，避免把写操作之前读到的旧数据写回缓存
+    """
+
+    def __init__(self, ttl, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # 键 -> (过期时间, 值)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """当前缓存代数"""
+        return self._generation
+
+    def get(self, key):
+        """获取缓存值（返回副本），未命中或已过期返回 None"""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            value = entry[1]
+        return copy.deepcopy(value)
+
+    def set(self, key, value, generation=None):
+        """写入缓存（保存副本）；generation 与当前代数不一致时放弃写入"""
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, prefix=()):
+        """失效以 prefix 开头的全部键（prefix 为空时清空缓存）"""
+        prefix = tuple(prefix)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[:len(prefix)] == prefix]:
+                del self._entries[key]
+
+    def clear(self):
+        self.invalidate()
+
+
+_read_cache = None  # 进程内共享的查询结果缓存
+_read_cache_lock = threading.Lock()
+
+
+def get_read_cache():
+    """获取（不存在则按 config.yaml 的 cache 配置创建）进程内共享的查询结果缓存"""
+    global _read_cache
+    if _read_cache is None:
+        with _read_cache_lock:
+            if _read_cache is None:
+                _read_cache = TTLCache(
+                    utils.get_config('cache.ttl', 0),
+                    utils.get_config('cache.maxsize', 256)
+                )
+    return _read_cache
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙地址段前缀树
+"""
+
+import ipaddress
+
+
+class _Node:
+    __slots__ = ('children', 'terminal', 'value')
+
+    def __init__(self):
+        self.children = [None, None]
+        self.terminal = False
+        self.value = None
+
+
+class PrefixTrie:
+    """IP地址段前缀树（按位二叉 trie，IPv4/IPv6 各一棵）
+
+    每个终结节点代表一个地址段（网络前缀），可附带 value（如所属地址组），嵌套的前缀各自保留，
+    covering 返回最短的覆盖前缀，longest_match 返回最长的覆盖前缀，matches 返回全部覆盖前缀，subnets 返回被覆盖的更长前缀；
+    collapse=True 时用于地址段归并：插入已被覆盖的前缀会被忽略，插入的前缀会移除其下更长的前缀，
+    两个相邻的兄弟前缀（value 相同）自动合并为上一级前缀，效果等同于增量的 ipaddress.collapse_addresses
+    """
+
+    def __init__(self, collapse=False):
+        self.collapse = collapse
+        self._roots = {4: _Node(), 6: _Node()}
+
+    @staticmethod
+    def _parse(network):
+        if not isinstance(network, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+            network = ipaddress.ip_network(network, strict=False)
+        return network.version, network.max_prefixlen, int(network.network_address), network.prefixlen
+
+    def insert(self, network, value=None):
+        """插入地址段；collapse 模式下已被现有前缀覆盖时返回 False"""
+        version, max_prefixlen, address, prefixlen = self._parse(network)
+        node = self._roots[version]
+        path = []
+        for i in range(prefixlen):
+            if node.terminal and self.collapse:
+                return False
+            bit = (address >> (max_prefixlen - 1 - i)) & 1
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            path.append(node)
+            node = node.children[bit]
+        if node.terminal and self.collapse:
+            return False
+        node.terminal = True
+        node.value = value
+        if self.collapse:
+            node.children = [None, None]
+            # 自底向上合并 value 相同的相邻兄弟前缀
+            for parent in reversed(path):
+                left, right = parent.children
+                if not (left and right and left.terminal and right.terminal and left.value == right.value):
+                    break
+                parent.terminal = True
+                parent.value = left.value
+                parent.children = [None, None]
+        return True
+
+    def covering(self, network):
+        """查找覆盖 network 的最短前缀（network 本身也算），返回 (地址段, value)，未被覆盖返回 None"""
+        version, max_prefixlen, address, prefixlen = self._parse(network)
+        node = self._roots[version]
+        for i in range(prefixlen + 1):
+            if node.terminal:
+                return self._network(version, max_prefixlen, address, i), node.value
+            if i == prefixlen:
+                break
+            node = node.children[(address >> (max_prefixlen - 1 - i)) & 1]
+            if node is None:
+                break
+        return None
+
+    def longest_match(self, network):
+        """最长前缀匹配：查找覆盖 network 的最长前缀，返回 (地址段, value)，未被覆盖返回 None"""
+        version, max_prefixlen, address, prefixlen = self._parse(network)
+        node = self._roots[version]
+        match = None
+        for i in range(prefixlen + 1):
+            if node.terminal:
+                match = (i, node.value)
+            if i == prefixlen:
+                break
+            node = node.children[(address >> (max_prefixlen - 1 - i)) & 1]
+            if node is None:
+                break
+        if match is None:
+            return None
+        return self._network(version, max_prefixlen, address, match[0]), match[1]
+
+    def summarize(self, density, min_prefixlen=24):
+        """将稠密地址段汇总为一个前缀：前缀长度 >= min_prefixlen 且已覆盖的地址占比 >= density 时，用该前缀替换其下的全部前缀
+
+        注意：汇总会封禁该前缀内原本未列出的地址，仅在 density < 1 时可能扩大范围
+        """
+        for version, root in self._roots.items():
+            max_prefixlen = 32 if version == 4 else 128
+            self._summarize(root, 0, max_prefixlen, density, min_prefixlen)
+
+    def _summarize(self, node, depth, max_prefixlen, density, min_prefixlen):
+        """返回该节点下已覆盖的地址数量"""
+        if node.terminal:
+            return 1 << (max_prefixlen - depth)
+        covered = 0
+        for child in node.children:
+            if child is not None:
+                covered += self._summarize(child, depth + 1, max_prefixlen, density, min_prefixlen)
+        if covered and depth >= min_prefixlen and covered >= density * (1 << (max_prefixlen - depth)):
+            node.terminal = True
+            node.value = None
+            node.children = [None, None]
+            return 1 << (max_prefixlen - depth)
+        return covered
+
+    def matches(self, network):
+        """查找覆盖 network 的全部前缀（network 本身也算），按前缀长度从短到长返回 [(地址段, value), ...]"""
+        version, max_prefixlen, address, prefixlen = self._parse(network)
+        node = self._roots[version]
+        matches = []
+        for i in range(prefixlen + 1):
+            if node.terminal:
+                matches.append((self._network(version, max_prefixlen, address, i), node.value))
+            if i == prefixlen:
+                break
+            node = node.children[(address >> (max_prefixlen - 1 - i)) & 1]
+            if node is None:
+                break
+        return matches
+
+    def subnets(self, network):
+        """查找被 network 覆盖的全部更长前缀（不含 network 本身），按地址顺序返回 [(地址段, value), ...]"""
+        version, max_prefixlen, address, prefixlen = self._parse(network)
+        node = self._roots[version]
+        for i in range(prefixlen):
+            node = node.children[(address >> (max_prefixlen - 1 - i)) & 1]
+            if node is None:
+                return []
+        subnets = []
+        for bit in (0, 1):
+            child = node.children[bit]
+            if child is not None:
+                subnets.extend(self._walk(version, max_prefixlen, child,
+                                          address | (bit << (max_prefixlen - 1 - prefixlen)), prefixlen + 1))
+        return subnets
+
+    def items(self):
+        """按地址顺序遍历全部前缀（嵌套前缀中短前缀在前），产出 (地址段, value)"""
+        for version, root in sorted(self._roots.items()):
+            yield from self._walk(version, 32 if version == 4 else 128, root, 0, 0)
+
+    def _walk(self, version, max_prefixlen, node, address, depth):
+        """按地址顺序遍历 node 及其下的全部前缀，产出 (地址段, value)"""
+        stack = [(node, address, depth)]
+        while stack:
+            node, address, depth = stack.pop()
+            if node.terminal:
+                yield self._network(version, max_prefixlen, address, depth), node.value
+            for bit in (1, 0):
+                child = node.children[bit]
+                if child is not None:
+                    stack.append((child, address | (bit << (max_prefixlen - 1 - depth)), depth + 1))
+
+    @staticmethod
+    def _network(version, max_prefixlen, address, prefixlen):
+        mask = ((1 << prefixlen) - 1) << (max_prefixlen - prefixlen)
+        network_address = address & mask
+        if version == 4:
+            return ipaddress.IPv4Network((network_address, prefixlen))
+        return ipaddress.IPv6Network((network_address, prefixlen))
+
+
+def parse_network(addr):
+    """将地址解析为 IPv4 地址段，非 IPv4 地址（域名、IPv6）返回 None"""
+    try:
+        network = ipaddress.ip_network(addr.strip(), strict=False)
+    except ValueError:
+        return None
+    return network if network.version == 4 else None
+
+
+def aggregate_addresses(addrs, summarize_density=0, summarize_min_prefixlen=24):
+    """封禁前的地址段归并
+
+    合并重叠与相邻的 IPv4 地址段（如 10.0.0.0/32 + 10.0.0.1/32 -> 10.0.0.0/31），被其他输入覆盖的地址段去除；
+    summarize_density > 0 时将稠密地址段汇总为一个前缀。非 IPv4 地址原样保留在结果前部（保持输入顺序）
+
+    Returns:
+        归并后的地址列表，IPv4 地址段格式为 a.b.c.d/n
+    """
+    trie = PrefixTrie(collapse=True)
+    others = []
+    seen_others = set()
+    for addr in addrs:
+        network = parse_network(addr)
+        if network is None:
+            if addr not in seen_others:
+                seen_others.add(addr)
+                others.append(addr)
+        else:
+            trie.insert(network)
+    if summarize_density:
+        trie.summarize(summarize_density, summarize_min_prefixlen)
+    return others + [str(network) for network, _ in trie.items()]
+
+
+def network_contains(supernet, addr):
+    """supernet 地址段是否覆盖 addr（均为字符串，无法解析时按字符串相等判断）"""
+    if supernet == addr:
+        return True
+    outer = parse_network(supernet)
+    inner = parse_network(addr)
+    return outer is not None and inner is not None and inner.subnet_of(outer)
+
+
+def exclude_addresses(supernet, addrs):
+    """从 supernet 地址段中剔除 addrs，返回剩余部分的最少地址段列表（如 10.0.0.0/30 剔除 10.0.0.1 -> 10.0.0.0/32、10.0.0.2/31）"""
+    remaining = [parse_network(supernet)]
+    for addr in addrs:
+        network = parse_network(addr)
+        next_remaining = []
+        for remain in remaining:
+            if network.subnet_of(remain):
+                next_remaining.extend(remain.address_exclude(network))
+            elif not remain.subnet_of(network):
+                next_remaining.append(remain)
+        remaining = next_remaining
+    return [str(network) for network in ipaddress.collapse_addresses(remaining)]
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙并发执行与限流工具
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from apps.fw_volcengine import metrics
+
+try:
+    import fcntl
+except ImportError:  # 非 Unix 平台不支持跨进程文件锁限流
+    fcntl = None
+
+
+def run_concurrently(func, items, max_workers):
+    """使用线程池并发执行 func(item)，按输入顺序返回结果
+
+    max_workers <= 1 或只有一个任务时在当前线程串行执行；并发执行时每个任务复制调用方的上下文（任务指标等 contextvars）
+    """
+    items = list(items)
+    if max_workers is None or max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [metrics.copy_context_submit(executor, func, item) for item in items]
+        return [future.result() for future in futures]
+
+
+class RateLimiter:
+    """令牌桶限流器（线程安全）
+
+    以 rate 个/秒的速度补充令牌，桶容量为 burst；令牌不足时阻塞等待，使调用均匀分布
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst else max(rate, 1))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """预占令牌（不阻塞），返回调用方需要等待的秒数
+
+        令牌不足时允许透支，等待期间补充的令牌归本次调用，后续调用顺延排队；
+        异步调用方可据此 await asyncio.sleep(delay)
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            delay = max(0.0, -self._tokens / self.rate)
+        return delay
+
+    def acquire(self, tokens=1):
+        """获取令牌（阻塞等待），返回本次等待的秒数（等待时间记录到任务指标的 rate_limit 休眠时间）"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            metrics.sleep(delay, 'rate_limit')
+        return delay
+
+
+class FileRateLimiter(RateLimiter):
+    """跨进程共享的令牌桶限流器
+
+    令牌桶状态（剩余令牌、更新时间）保存在本地文件中，通过 fcntl 文件锁互斥读写，
+    同一台机器上的多个工作进程共用一个令牌桶；时间使用 time.time()，各进程一致
+    """
+
+    def __init__(self, path, rate, burst=None):
+        super().__init__(rate, burst)
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def reserve(self, tokens=1):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or '{}')
+                except ValueError:
+                    state = {}
+                now = time.time()
+                available = state.get('tokens', self.burst)
+                updated = state.get('updated', now)
+                available = min(self.burst, available + max(now - updated, 0) * self.rate) - tokens
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": available, "updated": now}))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return max(0.0, -available / self.rate)
+
+
+_rate_limiters = {}  # 限流器注册表：key -> RateLimiter
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key, rate, burst=None, state_dir=None):
+    """获取（不存在则创建）共享的限流器，同一 key 的所有线程共用一个令牌桶
+
+    state_dir 不为空且平台支持文件锁时使用 FileRateLimiter，同一 state_dir 下相同 key 的多个进程共用一个令牌桶
+    """
+    limiter = _rate_limiters.get(key)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(key)
+            if limiter is None:
+                if state_dir and fcntl is not None:
+                    name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+                    limiter = FileRateLimiter(os.path.join(state_dir, f'{name}.json'), rate, burst)
+                else:
+                    limiter = RateLimiter(rate, burst)
+                _rate_limiters[key] = limiter
+    return limiter
+
+
+class _Call:
+    """SingleFlight 中一次进行中的调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """请求合并（线程安全）
+
+    相同 key 的并发调用只执行一次 func，其余调用方等待并共享该次结果（返回副本）；
+    调用结束后即移除，不缓存结果
+    """
+
+    def __init__(self):
+        self._calls = {}    # key -> 进行中的 _Call
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """请求合并（asyncio 版本），同一事件循环内相同 key 的并发调用共享一次执行结果"""
+
+    def __init__(self):
+        self._tasks = {}    # (事件循环, key) -> 进行中的 Task
+
+    async def do(self, key, func):
+        task_key = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(task_key)
+        if task is not None:
+            return copy.deepcopy(await asyncio.shield(task))
+        task = asyncio.ensure_future(func())
+        self._tasks[task_key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        # shield：发起方被取消时不影响正在等待同一结果的其他调用方
+        return await asyncio.shield(task)
+
+
+single_flight = SingleFlight()              # 进程内共享的请求合并器
+async_single_flight = AsyncSingleFlight()   # 异步版本共享的请求合并器
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙控制策略索引
+"""
+
+
+class ControlPolicyIndex:
+    """单方向控制策略索引
+
+    由一次分页遍历 describe_control_policy 的结果构建，维护 描述 / 源地址组UUID / 目的地址组UUID -> 策略ID 的映射，
+    "地址组是否已有封禁策略"、"删除地址组前需删除哪些策略" 均为内存查询；写操作成功后通过 add/remove 同步索引
+    """
+
+    def __init__(self, direction, policies=None):
+        self.direction = direction
+        self.policies = {}          # 策略ID -> 策略字典（阿里云格式）
+        self.by_description = {}    # 策略描述 -> {策略ID}
+        self.by_source = {}         # 源地址（地址组UUID） -> {策略ID}
+        self.by_destination = {}    # 目的地址（地址组UUID） -> {策略ID}
+        for policy in policies or []:
+            self.add(policy)
+
+    def add(self, policy):
+        """将策略加入索引"""
+        rule_id = policy.get('AclUuid')
+        if not rule_id:
+            return
+        self.remove(rule_id)
+        self.policies[rule_id] = policy
+        self.by_description.setdefault(policy.get('Description', ''), set()).add(rule_id)
+        self.by_source.setdefault(policy.get('Source', ''), set()).add(rule_id)
+        self.by_destination.setdefault(policy.get('Destination', ''), set()).add(rule_id)
+
+    def add_group_policy(self, rule_id, description, groupuuid):
+        """封禁地址组的控制策略创建成功后同步索引（入方向以地址组为源，出方向以地址组为目的）"""
+        policy = {"AclUuid": rule_id, "Description": description, "Direction": self.direction}
+        if self.direction == 'in':
+            policy["Source"] = groupuuid
+        else:
+            policy["Destination"] = groupuuid
+        self.add(policy)
+
+    def remove(self, rule_id):
+        """策略删除成功后将其从索引中移除"""
+        policy = self.policies.pop(rule_id, None)
+        if policy is None:
+            return
+        for index, key in ((self.by_description, policy.get('Description', '')),
+                           (self.by_source, policy.get('Source', '')),
+                           (self.by_destination, policy.get('Destination', ''))):
+            rule_ids = index.get(key)
+            if rule_ids is not None:
+                rule_ids.discard(rule_id)
+                if not rule_ids:
+                    index.pop(key, None)
+
+    def group_rules(self, groupuuid):
+        """引用该地址组的策略ID列表（入方向按源地址匹配，出方向按目的地址匹配）"""
+        index = self.by_source if self.direction == 'in' else self.by_destination
+        return sorted(index.get(groupuuid, ()))
+
+    def has_group_policy(self, addrgrp):
+        """地址组是否已有封禁策略：存在同名描述的策略，或有策略引用该地址组UUID"""
+        return bool(self.by_description.get(addrgrp['GroupName']) or self.group_rules(addrgrp['GroupUuid']))
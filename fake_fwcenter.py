@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙 FWCENTER API 本地模拟服务
+
+用于离线集成测试与压测：在本机回环地址上启动一个 HTTP 服务，按火山云 OpenAPI 的协议
+（Action/Version 查询参数 + JSON 请求体，响应为 ResponseMetadata + Result）模拟插件用到的接口：
+AddAddressBook、ModifyAddressBook、DescribeAddressBook、DeleteAddressBook、
+AddControlPolicy、DescribeControlPolicy、DeleteControlPolicy
+
+模拟的服务端行为：分页（PageSize 上限）、地址组容量与数量配额、被策略引用的地址组不可删除、
+写入后查询接口的最终一致性延迟、按接口的限流、请求延迟，以及按次数/按概率注入的故障
+
+用法：
+    with FakeFwcenterServer(consistency_delay=0.5, qps=20) as server:
+        app = FwVolcengineApp(ak='ak', sk='sk', endpoint=server.endpoint, region='cn-beijing')
+        app.auto_block_task('1.1.1.1', 'in')
+        print(server.calls)
+
+也可以独立运行：python fake_fwcenter.py --port 18080 --qps 20
+"""
+
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_VERSION = '2021-09-06'
+
+# 地址组 / 控制策略在 DescribeXxx 响应中的字段（与 SDK 模型的 attribute_map 一致）
+_ADDRESS_BOOK_FIELDS = ('GroupUuid', 'GroupName', 'GroupType', 'Description', 'AddressList', 'RefCnt')
+_CONTROL_POLICY_FIELDS = ('RuleId', 'Action', 'Description', 'Destination', 'DestinationType', 'Direction',
+                          'Proto', 'Source', 'SourceType', 'Status', 'Prio')
+
+
+class FakeApiError(Exception):
+    """模拟接口返回的错误（ResponseMetadata.Error）"""
+
+    def __init__(self, code, message='', status=200):
+        super().__init__(message or code)
+        self.code = code
+        self.message = message or code
+        self.status = status
+
+
+class _VersionedStore:
+    """带写入历史的资源存储，用于模拟最终一致性
+
+    写操作立即作用于最新版本（写接口读到的是最新状态），查询接口只能看到 delay 秒之前的版本
+    """
+
+    def __init__(self):
+        self._history = {}  # 资源ID -> [(写入时间, 资源字典 或 None 表示已删除), ...]
+
+    def latest(self, key):
+        versions = self._history.get(key)
+        return versions[-1][1] if versions else None
+
+    def put(self, key, value):
+        self._history.setdefault(key, []).append((time.monotonic(), value))
+
+    def preload(self, key, value):
+        """写入初始版本（不受最终一致性延迟影响，立即可见）"""
+        self._history[key] = [(float('-inf'), value)]
+
+    def delete(self, key):
+        self.put(key, None)
+
+    def values(self):
+        """全部资源的最新版本"""
+        return [versions[-1][1] for versions in self._history.values() if versions[-1][1] is not None]
+
+    def visible(self, delay):
+        """查询接口可见的资源：每个资源取 delay 秒之前的最后一个版本"""
+        if delay <= 0:
+            return self.values()
+        deadline = time.monotonic() - delay
+        result = []
+        for versions in self._history.values():
+            value = None
+            for written_at, version in versions:
+                if written_at > deadline:
+                    break
+                value = version
+            if value is not None:
+                result.append(value)
+        return result
+
+
+class FakeFwcenter:
+    """FWCENTER 接口的内存模拟实现（与 HTTP 协议无关，由 FakeFwcenterServer 调用）
+
+    Args:
+        max_addresses: 单个地址组的地址数量上限，0 表示不限制
+        max_groups: 地址组数量配额，0 表示不限制
+        max_page_size: 分页查询的 PageSize 上限
+        consistency_delay: 写入后在查询接口中可见的延迟（秒）
+        latency: 每个请求的固定处理延迟（秒）
+        qps: 每个接口的速率上限（次/秒），超出时返回限流错误，0 表示不限流
+        fault_rate: 随机注入服务端错误的概率（0~1）
+        seed: 随机数种子
+    """
+
+    def __init__(self, max_addresses=0, max_groups=0, max_page_size=100, consistency_delay=0.0,
+                 latency=0.0, qps=0, fault_rate=0.0, seed=None):
+        self.max_addresses = max_addresses
+        self.max_groups = max_groups
+        self.max_page_size = max_page_size
+        self.consistency_delay = consistency_delay
+        self.latency = latency
+        self.qps = qps
+        self.fault_rate = fault_rate
+        self.calls = collections.Counter()      # 接口名 -> 调用次数（含失败）
+        self.errors = collections.Counter()     # 错误码 -> 次数
+        self.address_books = _VersionedStore()
+        self.control_policies = _VersionedStore()
+        self._faults = []                       # 待注入的故障：[{"action", "code", "status", "times", "delay"}]
+        self._buckets = {}                      # 接口名 -> [令牌数, 上次补充时间]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def inject_fault(self, action=None, code='InternalError', status=500, times=1, delay=0.0):
+        """注入故障：接下来 times 次调用 action（为空表示任意接口）时返回错误码 code
+
+        delay > 0 时先等待 delay 秒再返回，可配合客户端超时模拟读超时（请求已被处理但响应丢失）；
+        code 为空时只延迟、正常处理请求
+        """
+        with self._lock:
+            self._faults.append({"action": action, "code": code, "status": status, "times": times, "delay": delay})
+
+    def preload(self, group_name, group_type, address_list, direction=None, description=None):
+        """预置地址组（direction 不为空时同时预置引用该地址组的同名封禁策略），不计入调用次数、立即可见
+
+        Returns:
+            地址组UUID
+        """
+        group_uuid = str(uuid.uuid4())
+        group = {"GroupUuid": group_uuid, "GroupName": group_name, "GroupType": group_type,
+                 "Description": description or group_name, "AddressList": list(address_list)}
+        with self._lock:
+            self.address_books.preload(group_uuid, group)
+            if direction:
+                rule_id = str(uuid.uuid4())
+                policy = {"RuleId": rule_id, "Action": "deny", "Description": group_name, "Direction": direction,
+                          "Proto": "ANY", "Status": True, "Prio": 2}
+                if direction == 'in':
+                    policy.update(Source=group_uuid, SourceType='group', Destination='0.0.0.0/0', DestinationType='net')
+                else:
+                    policy.update(Source='0.0.0.0/0', SourceType='net', Destination=group_uuid, DestinationType='group')
+                self.control_policies.preload(rule_id, policy)
+        return group_uuid
+
+    def handle(self, action, params):
+        """处理一次接口调用，返回 Result 字典；出错时抛出 FakeApiError"""
+        handler = getattr(self, f'_{action}', None)
+        with self._lock:
+            self.calls[action] += 1
+            fault = self._take_fault(action)
+        if self.latency:
+            time.sleep(self.latency)
+        if fault and fault['delay']:
+            time.sleep(fault['delay'])
+        try:
+            if handler is None:
+                raise FakeApiError('InvalidAction', f'不支持的接口: {action}', status=404)
+            if fault and fault['code']:
+                raise FakeApiError(fault['code'], '注入的故障', status=fault['status'])
+            with self._lock:
+                self._check_throttle(action)
+                if self.fault_rate and self._random.random() < self.fault_rate:
+                    raise FakeApiError(self._random.choice(['InternalError', 'ServiceUnavailable']),
+                                       '随机注入的故障', status=self._random.choice([500, 503]))
+                return handler(params)
+        except FakeApiError as e:
+            with self._lock:
+                self.errors[e.code] += 1
+            raise
+
+    def _take_fault(self, action):
+        for fault in self._faults:
+            if fault['action'] in (None, action):
+                fault['times'] -= 1
+                if fault['times'] <= 0:
+                    self._faults.remove(fault)
+                return fault
+        return None
+
+    def _check_throttle(self, action):
+        if not self.qps:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.setdefault(action, [float(self.qps), now])
+        bucket[0] = min(float(self.qps), bucket[0] + (now - bucket[1]) * self.qps)
+        bucket[1] = now
+        if bucket[0] < 1:
+            raise FakeApiError('FlowLimitExceeded', f'{action} 调用过于频繁', status=429)
+        bucket[0] -= 1
+
+    def _page(self, items, params):
+        page_number = max(int(params.get('PageNumber') or 1), 1)
+        page_size = min(max(int(params.get('PageSize') or 10), 1), self.max_page_size)
+        page = items[(page_number - 1) * page_size: page_number * page_size]
+        return {
+            "Count": len(page),
+            "Data": page,
+            "PageNumber": page_number,
+            "PageSize": page_size,
+            "TotalCount": len(items)
+        }
+
+    def _check_address_list(self, address_list):
+        if not isinstance(address_list, list):
+            raise FakeApiError('InvalidParameter', 'AddressList 必须为列表', status=400)
+        if self.max_addresses and len(address_list) > self.max_addresses:
+            raise FakeApiError('InvalidParameter.AddressListExceeded',
+                               f'地址数量 {len(address_list)} 超过上限 {self.max_addresses}', status=400)
+
+    def _ref_cnt(self, group_uuid):
+        return sum(1 for policy in self.control_policies.values()
+                   if group_uuid in (policy.get('Source'), policy.get('Destination')))
+
+    def _AddAddressBook(self, params):
+        if not params.get('GroupName') or not params.get('GroupType'):
+            raise FakeApiError('MissingParameter', 'GroupName/GroupType 不能为空', status=400)
+        address_list = params.get('AddressList') or []
+        self._check_address_list(address_list)
+        if self.max_groups and len(self.address_books.values()) >= self.max_groups:
+            raise FakeApiError('QuotaExceeded.AddressBook', f'地址组数量超过配额 {self.max_groups}', status=400)
+        group_uuid = str(uuid.uuid4())
+        self.address_books.put(group_uuid, {
+            "GroupUuid": group_uuid,
+            "GroupName": params['GroupName'],
+            "GroupType": params['GroupType'],
+            "Description": params.get('Description', ''),
+            "AddressList": list(address_list)
+        })
+        return {"GroupUuid": group_uuid}
+
+    def _ModifyAddressBook(self, params):
+        group = self.address_books.latest(params.get('GroupUuid'))
+        if group is None:
+            raise FakeApiError('NotFound.AddressBook', f'地址组不存在: {params.get("GroupUuid")}', status=404)
+        address_list = params.get('AddressList')
+        if address_list is not None:
+            self._check_address_list(address_list)
+        group = dict(group)
+        for key in ('GroupName', 'Description', 'AddressList'):
+            if params.get(key) is not None:
+                group[key] = list(params[key]) if key == 'AddressList' else params[key]
+        self.address_books.put(group['GroupUuid'], group)
+        return {"GroupUuid": group['GroupUuid']}
+
+    def _DeleteAddressBook(self, params):
+        group_uuid = params.get('GroupUuid')
+        if self.address_books.latest(group_uuid) is None:
+            raise FakeApiError('NotFound.AddressBook', f'地址组不存在: {group_uuid}', status=404)
+        if self._ref_cnt(group_uuid):
+            raise FakeApiError('OperationDenied.AddressBookInUse', f'地址组被控制策略引用: {group_uuid}', status=400)
+        self.address_books.delete(group_uuid)
+        return {"GroupUuid": group_uuid}
+
+    def _DescribeAddressBook(self, params):
+        query = params.get('Query') or ''
+        group_type = params.get('GroupType')
+        items = [
+            dict({key: group.get(key) for key in _ADDRESS_BOOK_FIELDS}, RefCnt=self._ref_cnt(group['GroupUuid']))
+            for group in self.address_books.visible(self.consistency_delay)
+            if query in group['GroupName'] and (not group_type or group['GroupType'] == group_type)
+        ]
+        return self._page(items, params)
+
+    def _AddControlPolicy(self, params):
+        direction = params.get('Direction')
+        if direction not in ('in', 'out'):
+            raise FakeApiError('InvalidParameter', 'Direction 必须为 in 或 out', status=400)
+        for key, type_key in (('Source', 'SourceType'), ('Destination', 'DestinationType')):
+            if params.get(type_key) == 'group' and self.address_books.latest(params.get(key)) is None:
+                raise FakeApiError('NotFound.AddressBook', f'地址组不存在: {params.get(key)}', status=404)
+        rule_id = str(uuid.uuid4())
+        policy = {key: params.get(key) for key in _CONTROL_POLICY_FIELDS if key in params}
+        policy.update(RuleId=rule_id, Status=params.get('Status', True))
+        self.control_policies.put(rule_id, policy)
+        return {"RuleId": rule_id}
+
+    def _DescribeControlPolicy(self, params):
+        direction = params.get('Direction')
+        description = params.get('Description')
+        items = [
+            {key: policy.get(key) for key in _CONTROL_POLICY_FIELDS}
+            for policy in self.control_policies.visible(self.consistency_delay)
+            if policy.get('Direction') == direction and (not description or description in (policy.get('Description') or ''))
+        ]
+        return self._page(items, params)
+
+    def _DeleteControlPolicy(self, params):
+        rule_id = params.get('RuleId')
+        policy = self.control_policies.latest(rule_id)
+        if policy is None or policy.get('Direction') != params.get('Direction'):
+            raise FakeApiError('NotFound.ControlPolicy', f'控制策略不存在: {rule_id}', status=404)
+        self.control_policies.delete(rule_id)
+        return {"RuleId": rule_id}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 保持长连接，与 SDK 的连接池行为一致
+    # 响应头与响应体分两次写出，长连接上 Nagle 算法与客户端延迟确认叠加会使每个请求多等待约 40ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        query = parse_qs(urlparse(self.path).query)
+        action = (query.get('Action') or [''])[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        metadata = {"RequestId": str(uuid.uuid4()), "Action": action,
+                    "Version": (query.get('Version') or [API_VERSION])[0], "Service": "fw_center"}
+        try:
+            params = json.loads(raw_body or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError('请求体必须为 JSON 对象')
+        except ValueError as e:
+            self._respond(400, {"ResponseMetadata": dict(metadata, Error={"Code": "InvalidParameter", "Message": str(e)})})
+            return
+        try:
+            result = self.server.fwcenter.handle(action, params)
+        except FakeApiError as e:
+            self._respond(e.status, {"ResponseMetadata": dict(metadata, Error={"Code": e.code, "Message": e.message})})
+            return
+        self._respond(200, {"ResponseMetadata": metadata, "Result": result})
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeFwcenterServer:
+    """在本机回环地址上运行的 FWCENTER 模拟服务（后台线程），endpoint 可直接作为插件的 endpoint 配置
+
+    参数同 FakeFwcenter；port 为 0 时自动分配空闲端口
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, **kwargs):
+        self.fwcenter = FakeFwcenter(**kwargs)
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fwcenter = self.fwcenter
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def calls(self):
+        return self.fwcenter.calls
+
+    def inject_fault(self, *args, **kwargs):
+        self.fwcenter.inject_fault(*args, **kwargs)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-fwcenter', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='火山云云防火墙 FWCENTER API 本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--max-addresses', type=int, default=0, help='单个地址组的地址数量上限，0 表示不限制')
+    parser.add_argument('--max-groups', type=int, default=0, help='地址组数量配额，0 表示不限制')
+    parser.add_argument('--max-page-size', type=int, default=100, help='分页查询的 PageSize 上限')
+    parser.add_argument('--consistency-delay', type=float, default=0.0, help='写入后在查询接口中可见的延迟（秒）')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的处理延迟（秒）')
+    parser.add_argument('--qps', type=float, default=0, help='每个接口的速率上限（次/秒），0 表示不限流')
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='随机注入服务端错误的概率（0~1）')
+    args = parser.parse_args()
+
+    server = FakeFwcenterServer(
+        host=args.host, port=args.port, max_addresses=args.max_addresses, max_groups=args.max_groups,
+        max_page_size=args.max_page_size, consistency_delay=args.consistency_delay, latency=args.latency,
+        qps=args.qps, fault_rate=args.fault_rate
+    )
+    print(f'FWCENTER 模拟服务已启动: {server.endpoint}')
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+        print(dict(server.calls))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@
 from cbt.base_app import BaseApp
 from cbt.action_result import ActionResult
 import cbt.status as cbt_status
-from apps.fw_volcengine.FwVolcengineApp import FwVolcengineApp
+from apps.fw_volcengine.FwVolcengineApp import FwVolcengineApp, stream_task_result
 from apps.fw_volcengine import utils
 from loguru import logger
 import os
@@ -159,4 +159,32 @@ class App(BaseApp):
         autounblockobj = FwVolcengineApp(ak=self.ak, sk=self.sk, endpoint=self.endpoint, region=self.region, proxies=self.proxies)
         # 传递asset信息以支持实例名日志
         res = autounblockobj.auto_unblock_task(addr, direction)
+        return res
+
+    def CheckBlocked(self, params):
+        """查询IP是否已被封禁"""
+        addr = params.get("addr")
+        direction = params.get("direction")
+        checkblockedobj = FwVolcengineApp(ak=self.ak, sk=self.sk, endpoint=self.endpoint, region=self.region, proxies=self.proxies)
+        res = checkblockedobj.check_blocked(addr, direction)
+        return res
+
+    def AutoBlockFileTask(self, params):
+        """从本地文件流式批量封禁IP地址"""
+        path = params.get("path")
+        direction = params.get("direction")
+        if not path or not os.path.isfile(path):
+            return {"statusCode": 400, "error": f"文件不存在: {path}"}
+        autoblockobj = FwVolcengineApp(ak=self.ak, sk=self.sk, endpoint=self.endpoint, region=self.region, proxies=self.proxies)
+        res = stream_task_result(autoblockobj.auto_block_stream(path, direction))
+        return res
+
+    def AutoUnblockFileTask(self, params):
+        """从本地文件流式批量解封IP地址"""
+        path = params.get("path")
+        direction = params.get("direction")
+        if not path or not os.path.isfile(path):
+            return {"statusCode": 400, "error": f"文件不存在: {path}"}
+        autounblockobj = FwVolcengineApp(ak=self.ak, sk=self.sk, endpoint=self.endpoint, region=self.region, proxies=self.proxies)
+        res = stream_task_result(autounblockobj.auto_unblock_stream(path, direction))
         return res
\ No newline at end of file
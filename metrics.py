@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙任务指标：SDK调用耗时与结果、重试、休眠时间、主循环轮数、地址组写入的并发写冲突
+
+每个封禁/解封任务在 task_scope() 中执行，任务内（含线程池/协程中）的SDK调用与休眠记录到当前任务的 TaskMetrics，
+同时累加到进程内的全局指标，可导出为 Prometheus 文本格式写入本地文件（供 node_exporter textfile 采集）
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import math
+import os
+import threading
+import time
+
+# 当前任务的指标（线程池中执行的函数需通过 contextvars.copy_context().run 传递）
+_current = contextvars.ContextVar('fw_volcengine_task_metrics', default=None)
+
+# SDK调用耗时直方图的分桶上界（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'     # 不可重试的错误；可重试的错误按 retry 模块的分类（throttled / retryable / uncertain）记录
+
+
+def _percentile(sorted_values, percent):
+    """最近秩法百分位数（sorted_values 已升序排列且非空）"""
+    index = max(math.ceil(len(sorted_values) * percent / 100.0) - 1, 0)
+    return sorted_values[index]
+
+
+class TaskMetrics:
+    """单个任务的指标（线程安全）"""
+
+    def __init__(self, task):
+        self.task = task
+        self.started = time.perf_counter()
+        self.wall_seconds = None
+        self.iterations = 0
+        self.retries = 0
+        self.group_writes = 0       # 经回读校验的地址组写入次数
+        self.group_conflicts = 0    # 回读校验发现的并发写冲突次数
+        self._durations = {}    # 接口 -> [耗时（秒）...]
+        self._errors = {}       # 接口 -> 失败次数
+        self._sleep = {}        # 休眠原因 -> 累计秒数
+        self._lock = threading.Lock()
+
+    def record_call(self, operation, seconds, outcome):
+        with self._lock:
+            self._durations.setdefault(operation, []).append(seconds)
+            if outcome != OUTCOME_OK:
+                self._errors[operation] = self._errors.get(operation, 0) + 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_sleep(self, seconds, reason):
+        with self._lock:
+            self._sleep[reason] = self._sleep.get(reason, 0.0) + seconds
+
+    def record_iteration(self):
+        with self._lock:
+            self.iterations += 1
+
+    def record_group_write(self, conflict):
+        with self._lock:
+            self.group_writes += 1
+            if conflict:
+                self.group_conflicts += 1
+
+    def finish(self):
+        if self.wall_seconds is None:
+            self.wall_seconds = time.perf_counter() - self.started
+
+    def summary(self):
+        """任务指标汇总：各接口调用次数、失败次数、耗时百分位数（毫秒），重试次数、各原因的休眠秒数、主循环轮数、
+        地址组写入次数与并发写冲突次数、任务耗时
+        """
+        with self._lock:
+            api = {}
+            for operation, durations in sorted(self._durations.items()):
+                values = sorted(durations)
+                api[operation] = {
+                    "calls": len(values),
+                    "errors": self._errors.get(operation, 0),
+                    "p50_ms": round(_percentile(values, 50) * 1000, 2),
+                    "p90_ms": round(_percentile(values, 90) * 1000, 2),
+                    "p99_ms": round(_percentile(values, 99) * 1000, 2),
+                    "max_ms": round(values[-1] * 1000, 2),
+                    "total_ms": round(sum(values) * 1000, 2),
+                }
+            sleep = {reason: round(seconds, 4) for reason, seconds in sorted(self._sleep.items())}
+            wall_seconds = self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self.started
+            return {
+                "wall_seconds": round(wall_seconds, 4),
+                "api_calls": sum(item["calls"] for item in api.values()),
+                "api": api,
+                "retries": self.retries,
+                "sleep_seconds": round(sum(self._sleep.values()), 4),
+                "sleep": sleep,
+                "iterations": self.iterations,
+                "group_writes": self.group_writes,
+                "group_conflicts": self.group_conflicts,
+            }
+
+
+def merge_summaries(summaries):
+    """合并多个任务的指标汇总（如流式任务的各块）：计数与耗时累加，最大耗时取最大值；百分位数无法合并，不保留"""
+    merged = {"wall_seconds": 0.0, "api_calls": 0, "api": {}, "retries": 0, "sleep_seconds": 0.0, "sleep": {}, "iterations": 0,
+              "group_writes": 0, "group_conflicts": 0}
+    for summary in summaries:
+        for key in ("wall_seconds", "api_calls", "retries", "sleep_seconds", "iterations", "group_writes", "group_conflicts"):
+            merged[key] += summary.get(key, 0)
+        for operation, stats in summary.get("api", {}).items():
+            total = merged["api"].setdefault(operation, {"calls": 0, "errors": 0, "max_ms": 0.0, "total_ms": 0.0})
+            total["calls"] += stats["calls"]
+            total["errors"] += stats["errors"]
+            total["max_ms"] = max(total["max_ms"], stats["max_ms"])
+            total["total_ms"] = round(total["total_ms"] + stats["total_ms"], 2)
+        for reason, seconds in summary.get("sleep", {}).items():
+            merged["sleep"][reason] = round(merged["sleep"].get(reason, 0.0) + seconds, 4)
+    merged["wall_seconds"] = round(merged["wall_seconds"], 4)
+    merged["sleep_seconds"] = round(merged["sleep_seconds"], 4)
+    return merged
+
+
+class MetricsRegistry:
+    """进程内累计的全局指标（线程安全），导出为 Prometheus 文本格式"""
+
+    def __init__(self):
+        self._calls = {}            # (接口, 结果) -> 次数
+        self._histograms = {}       # 接口 -> [各分桶计数..., 总数, 总耗时]
+        self._retries = {}          # 接口 -> 重试次数
+        self._sleep = {}            # 休眠原因 -> 累计秒数
+        self._tasks = {}            # 任务类型 -> [任务数, 总耗时, 主循环轮数]
+        self._group_writes = {}     # 回读校验结果（ok / conflict） -> 地址组写入次数
+        self._lock = threading.Lock()
+
+    def record_call(self, operation, seconds, outcome):
+        with self._lock:
+            key = (operation, outcome)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            histogram = self._histograms.setdefault(operation, [0] * len(DURATION_BUCKETS) + [0, 0.0])
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    def record_retry(self, operation):
+        with self._lock:
+            self._retries[operation] = self._retries.get(operation, 0) + 1
+
+    def record_sleep(self, seconds, reason):
+        with self._lock:
+            self._sleep[reason] = self._sleep.get(reason, 0.0) + seconds
+
+    def record_group_write(self, conflict):
+        with self._lock:
+            result = 'conflict' if conflict else 'ok'
+            self._group_writes[result] = self._group_writes.get(result, 0) + 1
+
+    def record_task(self, task_metrics):
+        with self._lock:
+            stats = self._tasks.setdefault(task_metrics.task, [0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += task_metrics.wall_seconds or 0.0
+            stats[2] += task_metrics.iterations
+
+    def reset(self):
+        with self._lock:
+            for values in (self._calls, self._histograms, self._retries, self._sleep, self._tasks, self._group_writes):
+                values.clear()
+
+    def prometheus_text(self):
+        """导出为 Prometheus 文本格式（exposition format 0.0.4）"""
+        lines = []
+        with self._lock:
+            lines += ['# HELP fw_volcengine_api_calls_total SDK调用次数（每次尝试计一次）',
+                      '# TYPE fw_volcengine_api_calls_total counter']
+            for (operation, outcome), count in sorted(self._calls.items()):
+                lines.append(f'fw_volcengine_api_calls_total{{operation="{operation}",outcome="{outcome}"}} {count}')
+            lines += ['# HELP fw_volcengine_api_call_duration_seconds SDK调用耗时',
+                      '# TYPE fw_volcengine_api_call_duration_seconds histogram']
+            for operation, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(DURATION_BUCKETS, histogram):
+                    lines.append(f'fw_volcengine_api_call_duration_seconds_bucket{{operation="{operation}",le="{bound}"}} {count}')
+                lines.append(f'fw_volcengine_api_call_duration_seconds_bucket{{operation="{operation}",le="+Inf"}} {histogram[-2]}')
+                lines.append(f'fw_volcengine_api_call_duration_seconds_sum{{operation="{operation}"}} {histogram[-1]:.6f}')
+                lines.append(f'fw_volcengine_api_call_duration_seconds_count{{operation="{operation}"}} {histogram[-2]}')
+            lines += ['# HELP fw_volcengine_api_retries_total SDK调用重试次数',
+                      '# TYPE fw_volcengine_api_retries_total counter']
+            for operation, count in sorted(self._retries.items()):
+                lines.append(f'fw_volcengine_api_retries_total{{operation="{operation}"}} {count}')
+            lines += ['# HELP fw_volcengine_sleep_seconds_total 客户端休眠时间（重试退避、限流等待、可见性轮询等）',
+                      '# TYPE fw_volcengine_sleep_seconds_total counter']
+            for reason, seconds in sorted(self._sleep.items()):
+                lines.append(f'fw_volcengine_sleep_seconds_total{{reason="{reason}"}} {seconds:.6f}')
+            lines += ['# HELP fw_volcengine_tasks_total 执行的封禁/解封任务数（合并执行的批次计一次）',
+                      '# TYPE fw_volcengine_tasks_total counter']
+            for task, stats in sorted(self._tasks.items()):
+                lines.append(f'fw_volcengine_tasks_total{{task="{task}"}} {stats[0]}')
+            lines += ['# HELP fw_volcengine_task_duration_seconds_total 封禁/解封任务累计耗时',
+                      '# TYPE fw_volcengine_task_duration_seconds_total counter']
+            for task, stats in sorted(self._tasks.items()):
+                lines.append(f'fw_volcengine_task_duration_seconds_total{{task="{task}"}} {stats[1]:.6f}')
+            lines += ['# HELP fw_volcengine_task_iterations_total 封禁任务主循环累计轮数',
+                      '# TYPE fw_volcengine_task_iterations_total counter']
+            for task, stats in sorted(self._tasks.items()):
+                lines.append(f'fw_volcengine_task_iterations_total{{task="{task}"}} {stats[2]}')
+            lines += ['# HELP fw_volcengine_group_writes_total 经回读校验的地址组写入次数（result=conflict 为发现并发写冲突）',
+                      '# TYPE fw_volcengine_group_writes_total counter']
+            for result, count in sorted(self._group_writes.items()):
+                lines.append(f'fw_volcengine_group_writes_total{{result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """将 Prometheus 文本写入本地文件（先写临时文件再重命名，采集方不会读到写了一半的文件）"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()    # 进程内共享的全局指标
+
+
+def current():
+    """当前任务的指标，不在任务中时返回 None"""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def task_scope(task):
+    """在任务作用域中执行，产出本任务的 TaskMetrics；退出时记录任务耗时并累加到全局指标"""
+    task_metrics = TaskMetrics(task)
+    token = _current.set(task_metrics)
+    try:
+        yield task_metrics
+    finally:
+        _current.reset(token)
+        task_metrics.finish()
+        registry.record_task(task_metrics)
+
+
+def record_call(operation, seconds, outcome=OUTCOME_OK):
+    """记录一次SDK调用（outcome 为 ok、error 或 retry 模块的错误分类）"""
+    registry.record_call(operation, seconds, outcome)
+    task_metrics = _current.get()
+    if task_metrics is not None:
+        task_metrics.record_call(operation, seconds, outcome)
+
+
+def record_retry(operation):
+    registry.record_retry(operation)
+    task_metrics = _current.get()
+    if task_metrics is not None:
+        task_metrics.record_retry()
+
+
+def record_sleep(seconds, reason):
+    if seconds <= 0:
+        return
+    registry.record_sleep(seconds, reason)
+    task_metrics = _current.get()
+    if task_metrics is not None:
+        task_metrics.record_sleep(seconds, reason)
+
+
+def record_group_write(conflict):
+    """记录一次经回读校验的地址组写入，conflict 为回读发现本次写入被并发写覆盖"""
+    registry.record_group_write(conflict)
+    task_metrics = _current.get()
+    if task_metrics is not None:
+        task_metrics.record_group_write(conflict)
+
+
+def sleep(seconds, reason):
+    """记录休眠时间后休眠（reason 如 retry_backoff、rate_limit、ready_wait、conflict_backoff、batch_window）"""
+    record_sleep(seconds, reason)
+    time.sleep(seconds)
+
+
+async def async_sleep(seconds, reason):
+    """sleep 的异步版本"""
+    record_sleep(seconds, reason)
+    await asyncio.sleep(seconds)
+
+
+def copy_context_submit(executor, func, *args):
+    """向线程池提交任务并传递当前上下文（任务指标等 contextvars）"""
+    return executor.submit(contextvars.copy_context().run, func, *args)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙API调用错误分类
+"""
+
+import re
+import socket
+
+import urllib3
+from volcenginesdkcore.rest import ApiException
+
+from apps.fw_volcengine import utils
+
+THROTTLED = 'throttled'     # 被限流，可重试（服务端未处理请求）
+RETRYABLE = 'retryable'     # 临时错误，可重试（服务端未处理请求）
+UNCERTAIN = 'uncertain'     # 超时/5xx 等，服务端可能已处理请求，仅幂等调用可重试
+
+# 服务端返回错误码时的默认分类，可通过 config.yaml 的 retry.throttling_codes / retry.retryable_codes 覆盖
+DEFAULT_THROTTLING_CODES = ['FlowLimitExceeded', 'RequestLimitExceeded', 'Throttling', 'TooManyRequests']
+DEFAULT_RETRYABLE_CODES = ['InternalError', 'InternalServiceError', 'InternalServiceTimeout', 'ServiceUnavailable']
+
+_error_code_pattern = re.compile(r"""['"]Code['"]\s*:\s*['"]([^'"]+)['"]""")
+
+# 连接未建立，请求一定没有发出
+_connect_exceptions = (
+    urllib3.exceptions.NewConnectionError,
+    urllib3.exceptions.ConnectTimeoutError,
+    socket.gaierror,
+    ConnectionRefusedError,
+)
+
+# 请求可能已发出
+_transport_exceptions = (
+    urllib3.exceptions.ReadTimeoutError,
+    urllib3.exceptions.ProtocolError,
+    socket.timeout,
+    ConnectionError,
+)
+
+
+def api_error_code(e):
+    """从 ApiException 中提取火山云错误码（ResponseMetadata.Error.Code），没有则返回 None"""
+    if not isinstance(e, ApiException):
+        return None
+    match = _error_code_pattern.search(f'{e.reason} {e.body or ""}')
+    return match.group(1) if match else None
+
+
+def classify_api_error(e):
+    """API调用异常分类
+
+    Returns:
+        THROTTLED / RETRYABLE / UNCERTAIN；不可重试的错误（参数错误、鉴权失败、资源不存在等）返回 None
+    """
+    if isinstance(e, urllib3.exceptions.MaxRetryError):
+        e = e.reason if e.reason is not None else e
+    if isinstance(e, _connect_exceptions):
+        return RETRYABLE
+    if isinstance(e, _transport_exceptions):
+        return UNCERTAIN
+    if not isinstance(e, ApiException):
+        return None
+
+    code = api_error_code(e)
+    if code in utils.get_config('retry.throttling_codes', DEFAULT_THROTTLING_CODES):
+        return THROTTLED
+    if code in utils.get_config('retry.retryable_codes', DEFAULT_RETRYABLE_CODES):
+        return UNCERTAIN
+    if e.status == 429:
+        return THROTTLED
+    if e.status in (502, 503):
+        return RETRYABLE
+    if e.status in (500, 504):
+        return UNCERTAIN
+    return None
+
+
+def should_retry(kind, idempotent):
+    """是否可以重试：非幂等调用（创建类接口）只在请求确定未被处理时重试，避免重复创建"""
+    if kind in (THROTTLED, RETRYABLE):
+        return True
+    return kind == UNCERTAIN and idempotent
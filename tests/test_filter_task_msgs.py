@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+filter_task_msgs：结果消息中的地址段映射回调用方输入的地址
+"""
+
+import pytest
+
+fw_app = pytest.importorskip('apps.fw_volcengine.FwVolcengineApp')
+
+
+def test_input_covered_by_another_input():
+    # 10.0.0.5/32 被同时输入的 10.0.0.0/24 覆盖，归并后只写入 10.0.0.0/24
+    addrs = ['10.0.0.0/24', '10.0.0.5/32', '10.0.1.0/32', '10.0.1.1/32']
+    msgs = [{"addr": "10.0.0.0/24,10.0.1.0/31", "desc": "封禁成功"}]
+
+    results = fw_app.filter_task_msgs(msgs, addrs)
+
+    assert len(results) == 1
+    assert sorted(results[0]['addr'].split(',')) == sorted(addrs)
+
+
+def test_remainder_maps_to_covering_input():
+    # 10.0.0.0/31 中 10.0.0.0 已封禁，只写入了 10.0.0.1/32
+    msgs = [{"addr": "10.0.0.1/32", "desc": "封禁成功"}]
+
+    assert fw_app.filter_task_msgs(msgs, ['10.0.0.0/31']) == [{"addr": "10.0.0.0/31", "desc": "封禁成功"}]
+
+
+def test_other_callers_addresses_are_dropped():
+    msgs = [
+        {"addr": "10.0.0.1/32,10.0.0.2/32", "desc": "封禁成功"},
+        {"addr": "['10.0.0.3/32', '10.0.0.4/32']", "desc": "封禁失败"},
+    ]
+
+    results = fw_app.filter_task_msgs(msgs, ['10.0.0.2/32', '10.0.0.4/32'])
+
+    assert results == [
+        {"addr": "10.0.0.2/32", "desc": "封禁成功"},
+        {"addr": "['10.0.0.4/32']", "desc": "封禁失败"},
+    ]
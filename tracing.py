@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+火山云云防火墙链路追踪（OpenTelemetry 风格的 span）
+
+封禁/解封任务、主循环每一轮、各步骤与每次SDK调用各记录一个 span，父子关系通过 contextvars 传递
+（线程池中执行的函数需通过 contextvars.copy_context().run 传递，见 metrics.copy_context_submit），
+导出方式由 config.yaml 的 tracing.exporter 决定：
+    none       不记录（默认），span() 返回空操作的 span，开销可忽略
+    console    每个 span 结束时以一行 JSON 输出到标准错误
+    otlp_file  按 OTLP/JSON 格式（与 OpenTelemetry Collector 的 file exporter / otlpjsonfile receiver 一致）
+               每个根 span 结束时将整条链路追加写入 tracing.file 的一行
+"""
+
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from loguru import logger
+from apps.fw_volcengine import utils
+
+# 当前 span（子 span 以其为父 span）
+_current_span = contextvars.ContextVar('fw_volcengine_span', default=None)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_SCOPE_NAME = 'apps.fw_volcengine'
+
+
+class Span:
+    """一个 span：名称、链路/span ID、父 span、起止时间（纳秒）、属性、事件与状态"""
+
+    def __init__(self, name, parent=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else f'{random.getrandbits(128):032x}'
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_span_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_message = None
+        if attributes:
+            self.set_attributes(attributes)
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.status_message = message
+
+    def record_exception(self, e):
+        self.events.append({
+            "name": "exception",
+            "time_ns": time.time_ns(),
+            "attributes": {"exception.type": type(e).__name__, "exception.message": str(e)[:1000]},
+        })
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """tracing.exporter 为 none 时使用的空操作 span"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def set_status(self, status, message=None):
+        pass
+
+    def record_exception(self, e):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value):
+    """属性值转换为 OTLP/JSON 的 AnyValue（64位整数按规范编码为字符串）"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def otlp_span(span):
+    """span 转换为 OTLP/JSON 的 Span 对象"""
+    item = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": {"code": span.status},
+    }
+    if span.parent_span_id:
+        item["parentSpanId"] = span.parent_span_id
+    if span.status_message:
+        item["status"]["message"] = span.status_message
+    if span.events:
+        item["events"] = [{"name": event["name"], "timeUnixNano": str(event["time_ns"]),
+                           "attributes": _otlp_attributes(event["attributes"])} for event in span.events]
+    return item
+
+
+class ConsoleSpanExporter:
+    """每个 span 结束时以一行 JSON 输出到标准错误"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps({
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_span_id,
+            "duration_ms": round(span.duration_ms, 3),
+            "status": span.status,
+            "attributes": span.attributes,
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def flush(self):
+        pass
+
+
+class OtlpFileSpanExporter:
+    """按 OTLP/JSON 格式写入本地文件：span 先缓存在内存中，根 span 结束（或缓存达到 max_buffer）时
+    将缓存的 span 作为一个 ExportTraceServiceRequest 追加写入一行（JSON Lines）
+    """
+
+    def __init__(self, path, service_name='fw_volcengine', max_buffer=512):
+        self.path = path
+        self.service_name = service_name
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, span):
+        with self._lock:
+            self._buffer.append(span)
+            if span.parent_span_id is not None and len(self._buffer) < self.max_buffer:
+                return
+            spans, self._buffer = self._buffer, []
+        self._write(spans)
+
+    def flush(self):
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        if spans:
+            self._write(spans)
+
+    def _write(self, spans):
+        request = {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": _SCOPE_NAME}, "spans": [otlp_span(span) for span in spans]}],
+        }]}
+        line = json.dumps(request, ensure_ascii=False, separators=(',', ':'), default=str)
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            logger.error(f"写入链路追踪文件失败: {e}")
+
+
+_exporter = None        # 进程内共享的 span 导出器（None 表示尚未按配置创建）
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """获取（不存在则按 config.yaml 的 tracing 配置创建）进程内共享的 span 导出器，tracing.exporter 为 none 时返回 None"""
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                kind = utils.get_config('tracing.exporter', 'none') or 'none'
+                service_name = utils.get_config('tracing.service_name', 'fw_volcengine')
+                if kind == 'console':
+                    _exporter = ConsoleSpanExporter()
+                elif kind == 'otlp_file':
+                    _exporter = OtlpFileSpanExporter(utils.get_config('tracing.file', '/tmp/fw_volcengine_traces.jsonl'), service_name)
+                else:
+                    _exporter = False
+    return _exporter or None
+
+
+def set_exporter(exporter):
+    """替换 span 导出器（None 表示重新按配置创建，False 表示关闭），替换前导出旧导出器中缓存的 span"""
+    global _exporter
+    with _exporter_lock:
+        if _exporter:
+            _exporter.flush()
+        _exporter = exporter
+
+
+def current_span():
+    """当前 span，不在 span 中（或未开启追踪）时返回 None"""
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def span(name, attributes=None, kind=SPAN_KIND_INTERNAL):
+    """在 span 中执行（以当前 span 为父 span），产出 Span；未开启追踪时产出空操作的 span
+
+    attributes 的键按 OpenTelemetry 语义约定使用点分名称（如 http.status_code、fw.group_uuid），值为 None 的属性不记录
+
+    块内抛出异常时记录 exception 事件并将状态置为 ERROR，异常继续向外抛出
+    """
+    exporter = get_exporter()
+    if exporter is None:
+        yield _NOOP_SPAN
+        return
+    current = Span(name, _current_span.get(), kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        current.set_status(STATUS_ERROR, f'{type(e).__name__}: {e}'[:200])
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+        exporter.export(current)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _exporter:
+        _exporter.flush()
@@ -3,7 +3,7 @@
 火山云云防火墙工具类
 """
 
-import os, ipaddress, yaml, platform
+import os, ipaddress, yaml, platform, random, re, csv, json, itertools
 from loguru import logger
 from functools import wraps
 
@@ -32,14 +32,15 @@ def init_logging(instance_name=None):
         
         log_file_path = os.path.join(logs_path, log_filename)
         
-        # 配置日志
+        # 配置日志：enqueue=True 时经队列由后台线程写入文件，调用方不等待磁盘 I/O
         logger.remove()
         logger.add(
             log_file_path,
             rotation='500MB',
             encoding='utf-8',
             format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level} | {name}:{function}:{line} - {message}",
-            level="INFO"
+            level=get_config('logging.level', 'INFO'),
+            enqueue=get_config('logging.enqueue', True)
         )
         logger.info(f"日志配置完成: {log_file_path}")
         
@@ -50,10 +51,58 @@ def init_logging(instance_name=None):
         logger.add(
             lambda msg: print(msg, end=''),
             format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level} | {message}",
-            level="INFO"
+            level=get_config('logging.level', 'INFO')
         )
 
 
+def summarize_payload(payload, max_items=None, max_chars=None):
+    """日志用的载荷摘要：列表只保留前 max_items 项并标注总数，嵌套超过 4 层的部分省略，整体截断为 max_chars 个字符
+
+    先按项数裁剪再格式化，格式化开销只与摘要大小有关（2 万个地址的地址组也只格式化前几项）
+    """
+    if max_items is None:
+        max_items = get_config('logging.payload_max_items', 5)
+    if max_chars is None:
+        max_chars = get_config('logging.payload_max_chars', 512)
+    text = _summarize(payload, max_items, max_chars, 0)
+    if len(text) > max_chars:
+        text = f'{text[:max_chars]}...(共 {len(text)} 字符)'
+    return text
+
+
+def _summarize(value, max_items, max_chars, depth):
+    if hasattr(value, 'to_dict'):  # 火山云SDK模型对象
+        value = value.to_dict()
+    if isinstance(value, dict):
+        if depth >= 4:
+            return '{...}'
+        items = [f'{key!r}: {_summarize(item, max_items, max_chars, depth + 1)}' for key, item in value.items()]
+        return '{' + ', '.join(items) + '}'
+    if isinstance(value, (list, tuple, set)):
+        if depth >= 4:
+            return '[...]'
+        head = [_summarize(item, max_items, max_chars, depth + 1) for item in itertools.islice(value, max_items)]
+        if len(value) > max_items:
+            head.append(f'...(共 {len(value)} 项)')
+        return '[' + ', '.join(head) + ']'
+    if isinstance(value, str) and len(value) > max_chars:
+        return repr(value[:max_chars]) + f'...(共 {len(value)} 字符)'
+    return repr(value)
+
+
+def log_payload(message, payload):
+    """输出载荷日志（SDK响应、地址列表、结果消息等）
+
+    INFO 级别输出截断后的摘要（按 logging.sample_rate 采样），DEBUG 级别输出完整载荷；
+    载荷只在对应级别的日志确实会输出时才格式化（loguru lazy），不会为被过滤的日志拼接大字符串
+    """
+    log = logger.opt(depth=1, lazy=True)
+    sample_rate = get_config('logging.sample_rate', 1.0)
+    if sample_rate >= 1 or random.random() < sample_rate:
+        log.info('{}{}', lambda: message, lambda: summarize_payload(payload))
+    log.debug('{}{}', lambda: message, lambda: payload)
+
+
 _config_cache = {}  # 配置缓存
 
 
@@ -131,22 +180,194 @@ def normalize_ip(ip):
         return ip
 
 
-def parse_ip_list(ip_list_str):
-    """解析IP列表字符串"""
+# IP列表分隔符：逗号（含中文逗号）、分号、空白字符
+_ip_list_separator = re.compile(r'[,，;\s]+')
+# IPv4 地址/网段（仅 ASCII 数字、不允许前导零，与 ipaddress 的校验规则一致），匹配成功即为合法地址，无需构建 ipaddress 对象
+_ipv4_octet = r'(?:25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])'
+_ipv4_pattern = re.compile(rf'{_ipv4_octet}(?:\.{_ipv4_octet}){{3}}(/0*(?:3[0-2]|[12]?[0-9]))?', re.ASCII)
+
+
+def classify_ip(ip):
+    """标准化并分类单个地址（IPv4 走正则快速路径，其余地址才使用 ipaddress 解析，无法解析时不记录日志）
+
+    Returns:
+        (标准化地址, 地址类型)，地址类型为 ipv4 / ipv6 / domain；标准化规则与 normalize_ip 一致，
+        掩码形式的 IPv4 网段（如 1.2.3.4/255.255.255.0）转换为前缀长度形式（1.2.3.4/24）
+    """
+    ip = ip.strip()
+    match = _ipv4_pattern.fullmatch(ip)
+    if match:
+        return (ip if match.group(1) else f"{ip}/32"), "ipv4"
+    try:
+        if ':' in ip:
+            if '/' in ip:
+                ipaddress.IPv6Network(ip, strict=False)
+                return ip, "ipv6"
+            ipaddress.IPv6Address(ip)
+            return f"{ip}/32", "ipv6"
+        if '/' in ip:
+            address, _ = ip.split('/', 1)
+            return f"{address}/{ipaddress.IPv4Network(ip, strict=False).prefixlen}", "ipv4"
+    except (ipaddress.AddressValueError, ipaddress.NetmaskValueError, ValueError):
+        pass
+    return ip, "domain"
+
+
+def classify_ip_list(ip_list_str):
+    """单次遍历解析IP列表字符串：切分、标准化、按标准化地址去重（保持首次出现的顺序）并分类
+
+    Returns:
+        (addrs, buckets)
+        addrs: 去重后的标准化地址列表
+        buckets: {"ipv4": [...], "ipv6": [...], "domain": [...]}，各类型的地址列表（保持 addrs 中的顺序）
+    """
+    buckets = {"ipv4": [], "ipv6": [], "domain": []}
     if not ip_list_str:
-        return []
-    
-    # 统一各种分隔符为逗号
-    normalized_str = ip_list_str.replace('，', ',').replace('\n', ',').replace(';', ',').replace(' ', ',')
-    
-    ips = []
-    for ip in normalized_str.split(','):
-        ip = ip.strip()
+        return [], buckets
+
+    seen = set()
+    addrs = []
+    for normalized_ip, addr_type in _iter_classified(ip_list_str):
+        if normalized_ip in seen:
+            continue
+        seen.add(normalized_ip)
+        addrs.append(normalized_ip)
+        buckets[addr_type].append(normalized_ip)
+
+    if buckets["domain"]:
+        # 无法解析为IP的地址按域名处理，汇总记录一次日志，避免超大输入逐条刷日志
+        logger.info(f"按域名处理的地址 {len(buckets['domain'])} 个，示例: {buckets['domain'][:5]}")
+    return addrs, buckets
+
+
+def parse_ip_list(ip_list_str):
+    """解析IP列表字符串，返回去重后的标准化地址列表"""
+    return classify_ip_list(ip_list_str)[0]
+
+
+def classified_items(buckets):
+    """将 classify_ip_list 的分类结果展开为 (标准化地址, 地址类型) 列表，用于写合并队列中跨请求去重与合并"""
+    return [(addr, addr_type) for addr_type, addrs in buckets.items() for addr in addrs]
+
+
+def group_classified(items):
+    """将 (标准化地址, 地址类型) 列表按类型分组，返回与 classify_ip_list 相同格式的 buckets"""
+    buckets = {"ipv4": [], "ipv6": [], "domain": []}
+    for addr, addr_type in items:
+        buckets[addr_type].append(addr)
+    return buckets
+
+
+def _iter_classified(ip_list_str):
+    """切分IP列表字符串，逐个产出 (标准化地址, 地址类型)"""
+    for ip in _ip_list_separator.split(ip_list_str):
         if ip:
-            normalized_ip = normalize_ip(ip)
-            ips.append(normalized_ip)
-    
-    return ips
+            yield classify_ip(ip)
+
+
+# 流式输入中 JSON 对象 / CSV 表头里表示地址的字段名（按顺序取第一个存在的字段）
+_address_fields = ('addr', 'ip', 'address', 'ioc', 'indicator', 'value')
+# .json 文档为对象时，除地址字段外还可以存放地址数组的字段名
+_address_list_fields = ('addrs', 'ips', 'addresses', 'iocs', 'indicators', 'items', 'data')
+
+
+def _json_address(value):
+    """JSON 值中的地址字符串：字符串原样返回，数组以逗号连接，对象取地址字段，无法识别时返回 None"""
+    if isinstance(value, dict):
+        value = next((value[name] for name in _address_fields if value.get(name)), None)
+    if isinstance(value, list):
+        value = ','.join(str(item) for item in value)
+    return str(value) if value else None
+
+
+def iter_address_source(source):
+    """逐条读取地址输入源，产出地址字符串（每条可以包含多个以分隔符隔开的地址）
+
+    Args:
+        source: 本地文件路径，或产出字符串的可迭代对象；文件按扩展名识别格式：
+            .csv 取表头中的地址字段（见 _address_fields），没有表头时取第一列；
+            .jsonl / .ndjson 每行一个 JSON 值（字符串、字符串数组，或包含地址字段的对象）；
+            .json 整个文件为一个 JSON 文档（需整体读入内存）：数组，或包含数组的对象（取地址字段或 _address_list_fields 中
+            第一个为数组的字段），数组中每一项的格式同 .jsonl 的每一行；
+            其他扩展名按文本处理，每行可包含一个或多个地址
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        for item in source:
+            if item:
+                yield str(item)
+        return
+
+    extension = os.path.splitext(os.fspath(source))[1].lower()
+    with open(source, encoding='utf-8-sig', newline='') as f:
+        if extension == '.csv':
+            reader = csv.reader(f)
+            column = 0
+            for row_number, row in enumerate(reader):
+                if not row:
+                    continue
+                if row_number == 0:
+                    header = [cell.strip().lower() for cell in row]
+                    field = next((name for name in _address_fields if name in header), None)
+                    if field is not None:
+                        column = header.index(field)
+                        continue
+                if column < len(row) and row[column]:
+                    yield row[column]
+        elif extension in ('.jsonl', '.ndjson'):
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    value = _json_address(json.loads(line))
+                except ValueError:
+                    logger.warning(f"无法解析的JSON行: {source}:{line_number}")
+                    continue
+                if value:
+                    yield value
+        elif extension == '.json':
+            try:
+                document = json.load(f)
+            except ValueError as e:
+                logger.error(f"无法解析的JSON文件: {source}: {e}")
+                return
+            if isinstance(document, dict):
+                document = next((document[name] for name in _address_fields + _address_list_fields
+                                 if isinstance(document.get(name), list)), [document])
+            if not isinstance(document, list):
+                document = [document]
+            for item in document:
+                value = _json_address(item)
+                if value:
+                    yield value
+        else:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def iter_address_chunks(source, chunk_size):
+    """将地址输入源切分为固定大小的地址块，逐块产出 (标准化地址列表, 分类结果)，分类结果格式同 classify_ip_list
+
+    每次只在内存中保留一个地址块，去重仅在块内进行（跨块的重复地址会在后续块中被识别为已封禁/未找到）
+    """
+    chunk = []
+    buckets = {"ipv4": [], "ipv6": [], "domain": []}
+    seen = set()
+    for text in iter_address_source(source):
+        for normalized_ip, addr_type in _iter_classified(text):
+            if normalized_ip in seen:
+                continue
+            seen.add(normalized_ip)
+            chunk.append(normalized_ip)
+            buckets[addr_type].append(normalized_ip)
+            if len(chunk) >= chunk_size:
+                yield chunk, buckets
+                chunk = []
+                buckets = {"ipv4": [], "ipv6": [], "domain": []}
+                seen = set()
+    if chunk:
+        yield chunk, buckets
 
 
 def ip_matches(ip1, ip2):
@@ -177,3 +398,9 @@ def check_address_type(addresslist):
     except (ipaddress.AddressValueError, ipaddress.NetmaskValueError):
         pass
     return "domain"
+
+
+def backoff_delay(attempt, base, cap):
+    """指数退避间隔（秒）：base * 2^attempt，上限 cap，并在 [delay/2, delay] 内随机抖动"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)